@@ -0,0 +1,1518 @@
+"""Benchmarks for the `punch` CLI.
+
+Run with `python benchmark.py [benchmark ...] [options]`. Each benchmark runs
+against generated data in a temporary directory, so the real `.csv`/`.log` files
+are never touched.
+
+`python benchmark.py suite --json results.json --baseline baseline.json` times
+every command over 1k, 100k and 1M entry fixtures, writes the timings as JSON and
+exits non-zero if any of them regressed against the baseline.
+
+`python benchmark.py stress` punches from many processes at once and exits
+non-zero if any punch was lost or half-written.
+"""
+
+import json
+import math
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from datetime import date, datetime, timedelta
+from typing import Iterator
+
+import constants as c
+from constants import CSV_FILE_NAME, LOG_FILE_NAME, ROWS_PER_READ, eprint
+
+
+def data_dir_for(tmp: str) -> str:
+    """Points the punch data directory at `tmp` and returns the path of the
+    directory that will hold the data files.
+    """
+    from timelog import (
+        data_file_path,
+        find_log_archive,
+        find_rollup,
+        find_store,
+        find_tag_index,
+        LogEntry,
+    )
+
+    # `%LOCALAPPDATA%` is only expanded on win32; elsewhere the path stays
+    #    relative, so also run from inside the temporary directory.
+    os.environ["LOCALAPPDATA"] = tmp
+    os.chdir(tmp)
+    # Paths are resolved once per process, so forget the previous directory
+    data_file_path.cache_clear()
+    find_store.cache_clear()
+    find_rollup.cache_clear()
+    find_log_archive.cache_clear()
+    find_tag_index.cache_clear()
+    LogEntry.find_log_file.cache_clear()
+    data_dir = os.path.join(tmp, "punch")
+    os.makedirs(data_dir, exist_ok=True)
+    return data_dir
+
+
+@contextmanager
+def isolated_data_dir() -> Iterator[str]:
+    """Runs the block with the punch data directory in a new temporary directory,
+    which is removed afterwards.
+    """
+    from timelog import find_store
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            yield data_dir_for(tmp)
+        finally:
+            # The store's memory maps must be closed before the files are removed
+            find_store().close()
+            os.chdir(cwd)
+
+
+def csv_path() -> str:
+    """The path `TimeLog` will resolve for the `.csv` file."""
+    return os.path.expandvars("%LOCALAPPDATA%\\punch\\" + CSV_FILE_NAME)
+
+
+def sessions(n_rows: int, years: int = 20) -> Iterator[tuple]:
+    """Generates `n_rows` sessions spread over at most `years` years of days.
+
+    :returns `Iterator[tuple]` - punch-in, punch-out, hours and description
+    """
+    per_day = max(2, -(-n_rows // (years * 365)))
+    # Minutes each session takes up in the day
+    slot = 24 * 60 // per_day
+    start = datetime(2006, 1, 1)
+    for i in range(n_rows):
+        punch_in = start + timedelta(days=i // per_day, minutes=i % per_day * slot)
+        punch_out = punch_in + timedelta(minutes=slot - 1)
+        description = f"task {i % 50}" if i % 7 else "NULL"
+        yield punch_in, punch_out, (slot - 1) / 60, description
+
+
+def write_csv(n_rows: int, punched_in: bool = False) -> None:
+    """Writes a `.csv` file holding `n_rows` complete entries and, if `punched_in`,
+    a last partial entry with only a date and punch-in time.
+    """
+    with open(csv_path(), "w") as file:
+        file.write("Date,Punch in,Punch out,Time (hours),Description")
+        for punch_in, punch_out, hours, description in sessions(n_rows):
+            file.write(
+                f"\n{punch_in.strftime('%D')},{punch_in.strftime('%H:%M')},"
+                f"{punch_out.strftime('%H:%M')},{hours},{description}"
+            )
+        if punched_in:
+            file.write(f"\n{datetime.now().strftime('%D,%H:%M')}")
+
+
+def write_log(n_rows: int, punched_in: bool = False) -> None:
+    """Writes a `.log` file holding the same entries as `write_csv()`."""
+    log_path = os.path.expandvars("%LOCALAPPDATA%\\punch\\" + LOG_FILE_NAME)
+    with open(log_path, "w") as file:
+        for punch_in, punch_out, hours, description in sessions(n_rows):
+            date = punch_in.strftime("%D")
+            if description == "NULL":
+                description = "(No Description)"
+            file.write(
+                f"Punch in:\t\t{date} {punch_in.strftime('%H:%M')}"
+                f"\nPunch out:\t\t{date} {punch_out.strftime('%H:%M')}"
+                f"\nHours worked:\t{hours:.6f}\t\t{description}\n\n"
+            )
+        if punched_in:
+            file.write(f"Punch in:\t\t{datetime.now().strftime('%D %H:%M')}")
+
+
+# Cells the worksheet reads as a number when entered as if typed in
+NUMBER = re.compile(r"-?\d+(\.\d*)?([eE][-+]?\d+)?")
+
+
+def render_cell(cell: str, unformatted: bool) -> str | int | float:
+    """Renders a cell stored as it was sent, as the worksheet reads back a cell
+    entered as if typed in: dates like '1/2/2006' and times like '9:05:00', or as
+    serial days and fractions of a day if `unformatted`, and numbers as numbers.
+    """
+    if not cell or cell[0] == "#":
+        return cell
+    try:
+        if len(cell) == 8 and cell[2] == "/":
+            day = datetime.strptime(cell, "%m/%d/%y").date()
+            if unformatted:
+                return (day - date(1899, 12, 30)).days
+            return f"{day.month}/{day.day}/{day.year}"
+        if len(cell) == 5 and cell[2] == ":":
+            clock = datetime.strptime(cell, "%H:%M")
+            if unformatted:
+                return (clock.hour * 60 + clock.minute) / (24 * 60)
+            return f"{clock.hour}:{clock.minute:02}:00"
+    except ValueError:
+        return cell
+    if NUMBER.fullmatch(cell):
+        number = float(cell)
+        if unformatted:
+            return int(number) if number.is_integer() else number
+        return f"{number:g}"
+    return cell
+
+
+class FakeWorksheet:
+    """Local stand-in for the `append_rows()` and `batch_get()` surface of
+    `gspread.Worksheet`. Keeps rows as they were sent, but reads them back as the
+    worksheet would, see `render_cell()`.
+
+    Raises `ConnectionError` on the request after `fail_after` requests; if
+    `reply_lost`, only after appending the rows the request sent, as if the reply
+    didn't make it back. Only counts the rows it is sent unless `keep_rows`.
+    Each request takes `latency` seconds, and the next `drops` ones raise
+    `ConnectionError` before any goes through; the next `lost` appends go through
+    but raise it, as if the reply was lost.
+    """
+
+    def __init__(
+        self,
+        fail_after: int | None = None,
+        keep_rows: bool = True,
+        reply_lost: bool = False,
+        latency: float = 0.0,
+        drops: int = 0,
+        lost: int = 0,
+    ) -> None:
+        self.rows: list[list[str]] = []
+        self.row_count: int = 0
+        self.requests: int = 0
+        # Cells sent back by `batch_get()`
+        self.cells_read: int = 0
+        self.fail_after: int | None = fail_after
+        self.keep_rows: bool = keep_rows
+        self.reply_lost: bool = reply_lost
+        self.latency: float = latency
+        self.drops: int = drops
+        self.lost: int = lost
+
+    def _fail(self) -> bool:
+        time.sleep(self.latency)
+        if self.drops:
+            self.drops -= 1
+            raise ConnectionError("Fake connection dropped.")
+        return self.fail_after is not None and self.requests >= self.fail_after
+
+    def append_rows(self, values: list[list[str]], **kwargs) -> dict:
+        failing = self._fail()
+        if failing and not self.reply_lost:
+            raise ConnectionError("Fake connection dropped.")
+        self.requests += 1
+        self.row_count += len(values)
+        if self.keep_rows:
+            self.rows.extend([list(row) for row in values])
+        if failing or self.lost:
+            self.lost = max(self.lost - 1, 0)
+            raise ConnectionError("Fake connection dropped.")
+        last = len(self.rows) if self.keep_rows else self.row_count
+        return {
+            "updates": {
+                "updatedRange": f"Sheet1!A{last - len(values) + 1}:G{last}",
+                "updatedRows": len(values),
+            }
+        }
+
+    def batch_get(
+        self,
+        ranges: list[str],
+        value_render_option: str = "FORMATTED_VALUE",
+        date_time_render_option: str = "FORMATTED_STRING",
+        **kwargs,
+    ) -> list[list[list]]:
+        """Reads A1 ranges of a single-letter column span, e.g. 'A2:F9' or 'G2:G'.
+        Blank cells at the end of a row, and blank rows at the end, are left out,
+        as the API does.
+        """
+        if self._fail():
+            raise ConnectionError("Fake connection dropped.")
+        self.requests += 1
+        unformatted = (
+            value_render_option == "UNFORMATTED_VALUE"
+            and date_time_render_option == "SERIAL_NUMBER"
+        )
+        values: list[list[list]] = []
+        for a1 in ranges:
+            first, last = a1.split(":")
+            columns = slice(ord(first[0]) - ord("A"), ord(last[0]) - ord("A") + 1)
+            stop = int(last[1:]) if last[1:] else len(self.rows)
+            rows = [row[columns] for row in self.rows[int(first[1:]) - 1 : stop]]
+            for index, row in enumerate(rows):
+                while row and not row[-1]:
+                    row.pop()
+                rows[index] = [render_cell(cell, unformatted) for cell in row]
+            while rows and not rows[-1]:
+                rows.pop()
+            self.cells_read += sum(len(row) for row in rows)
+            values.append(rows)
+        return values
+
+
+def time_it(func, repeat: int = 5) -> float:
+    """Returns the best wall-clock time of `repeat` calls to `func`, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def get_option(name: str) -> str | None:
+    """Gets the value given after option `name` on the command line, if any."""
+    if name in sys.argv and sys.argv.index(name) + 1 < len(sys.argv):
+        return sys.argv[sys.argv.index(name) + 1]
+    return None
+
+
+def run_command(*args: str) -> None:
+    """Runs `punch <args>` in this process, with its output thrown away."""
+    import punch
+
+    argv = sys.argv
+    sys.argv = ["punch", *args]
+    try:
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            punch.main()
+    except SystemExit as exit:
+        assert not exit.code, f"punch {' '.join(args)} exited with {exit.code}."
+    finally:
+        sys.argv = argv
+
+
+def bench_punch_in(sizes: tuple[int, ...] = (10, 1_000, 100_000, 1_000_000)) -> None:
+    """Times the work `punch in` does (state detection plus the append) for
+    histories of increasing size. The latency should stay flat.
+    """
+    from timelog import TimeLog, LogEntry
+
+    print("punch in latency:")
+    for n_rows in sizes:
+        with isolated_data_dir():
+            write_csv(n_rows)
+            # One-time migration into the session store
+            TimeLog()
+
+            best = float("inf")
+            for _ in range(5):
+                start = time.perf_counter()
+                log = TimeLog()
+                assert log.state == c.PUNCHED_OUT_STATE
+                entry = LogEntry(log.csv_file_path)
+                entry.punch_in = datetime.now()
+                entry.date = entry.punch_in.strftime("%D")
+                entry.punch_in_time = entry.punch_in.strftime("%H:%M")
+                entry.log_punch_in()
+                best = min(best, time.perf_counter() - start)
+
+                # Punch out again, untimed, so every repeat starts punched-out
+                entry.punch_out = entry.punch_in
+                entry.punch_out_time = entry.punch_in_time
+                entry.work_hours = 0.0
+                entry.log_work_time()
+        print(f"\t{n_rows:>9,} rows: {best * 1000:8.3f} ms")
+
+
+def bench_parse(n_rows: int = 500_000) -> None:
+    """Times loading every entry of a large history and measures the peak memory
+    held by the loaded entries.
+    """
+    from timelog import TimeLog
+
+    print(f"parse {n_rows:,} rows:")
+    with isolated_data_dir():
+        write_csv(n_rows)
+
+        seconds = time_it(lambda: TimeLog().entries, repeat=3)
+
+        log = TimeLog()
+        tracemalloc.start()
+        log.entries
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    print(f"\ttime:   {seconds * 1000:8.1f} ms")
+    print(f"\tmemory: {peak / 2**20:8.1f} MiB")
+
+
+def bench_upload(
+    n_uploaded: int = 1_000_000, sizes: tuple[int, ...] = (10, 1_000, 10_000)
+) -> None:
+    """Times uploading backlogs of increasing size on top of a large, already
+    uploaded history, with one dropped connection half way through. The cost
+    should follow the backlog, not the history.
+    """
+    from timelog import TimeLog
+    from uploading import upload_log
+
+    print(f"upload on top of {n_uploaded:,} uploaded rows:")
+    for n_rows in sizes:
+        with isolated_data_dir():
+            write_csv(n_uploaded)
+            TimeLog().clear_csv()
+            write_csv(n_rows)
+            # Migrate the new backlog on top of the uploaded history
+            log = TimeLog()
+            log.store.extend([entry.to_session() for entry in log.record_entries()])
+
+            chunks = -(-n_rows // c.UPLOAD_CHUNK_SIZE)
+            wks = FakeWorksheet(fail_after=chunks // 2)
+            start = time.perf_counter()
+            try:
+                upload_log(wks, log)
+            except ConnectionError:
+                wks.fail_after = None
+                upload_log(wks, log)
+            seconds = time.perf_counter() - start
+            assert len(wks.rows) == n_rows, "Rows were lost or sent twice."
+        print(f"\t{n_rows:>9,} rows: {seconds * 1000:8.1f} ms, {wks.requests} requests")
+
+
+def bench_stream(sizes: tuple[int, ...] = (100_000, 1_000_000)) -> None:
+    """Measures the peak memory of exporting the `.csv` file, `show csv` and
+    uploading over histories of increasing size. Rows are streamed, so the peaks
+    should stay flat.
+    """
+    from timelog import TimeLog
+    from uploading import upload_log
+
+    print("streamed rows, peak memory:")
+    for n_rows in sizes:
+        with isolated_data_dir():
+            log = TimeLog()
+            batch: list[tuple] = []
+            for punch_in, punch_out, hours, description in sessions(n_rows):
+                # Descriptions with commas need quoting in the `.csv` file
+                batch.append(
+                    (
+                        int(punch_in.timestamp()),
+                        int(punch_out.timestamp()),
+                        hours,
+                        description.replace(" ", ", "),
+                    )
+                )
+                if len(batch) == 100_000:
+                    log.store.extend(batch)
+                    batch.clear()
+            log.store.extend(batch)
+
+            peaks: dict[str, int] = {}
+            for name, func in (
+                ("export csv", log.export_csv),
+                ("show csv", lambda: run_command("show", "csv")),
+                ("upload", lambda: upload_log(FakeWorksheet(keep_rows=False), log)),
+            ):
+                tracemalloc.start()
+                func()
+                peaks[name] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                if name == "export csv":
+                    csv_size = os.path.getsize(log.csv_file_path)
+                    assert len(log.record_entries()) == n_rows, "Rows were misquoted."
+
+        peaks_mib = [f"{name} {peak / 2**20:5.1f} MiB" for name, peak in peaks.items()]
+        print(
+            f"\t{n_rows:>9,} rows ({csv_size / 2**20:6.1f} MiB .csv): "
+            + ", ".join(peaks_mib)
+        )
+
+
+def bench_log(n_rows: int = 500_000) -> None:
+    """Times rotating a large `.log` file into monthly segments, then reading a
+    week of it through the date index against reading all of it.
+    """
+    from timelog import TimeLog, data_file_path, find_log_archive
+
+    print(f"log of {n_rows:,} entries:")
+    with isolated_data_dir():
+        write_log(n_rows)
+        TimeLog()
+        archive = find_log_archive()
+        size = os.path.getsize(archive.log_path)
+
+        start = time.perf_counter()
+        archive.rotate()
+        seconds = time.perf_counter() - start
+        compressed = sum(
+            os.path.getsize(data_file_path(segment["name"]))
+            for segment in archive.segments
+        )
+        print(
+            f"\trotate       {seconds * 1000:8.1f} ms,"
+            f" {len(archive.segments)} segments,"
+            f" {size / 2**20:.1f} -> {compressed / 2**20:.1f} MiB"
+        )
+
+        last = date.fromisoformat(archive.segments[-1]["last"])
+        week = last - timedelta(days=6), last
+        for name, since, until in (("one week", *week), ("everything", None, None)):
+            seconds = time_it(lambda: sum(1 for _ in archive.lines(since, until)), 3)
+            print(f"\t{name:<11}  {seconds * 1000:8.1f} ms")
+
+
+def bench_startup(command: tuple[str, ...] = ("state",)) -> None:
+    """Measures the imports of `punch state` with `python -X importtime`, and
+    fails if the offline command pulls in the upload stack.
+    """
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "punch.py")
+    with isolated_data_dir():
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", script, *command],
+            capture_output=True,
+            text=True,
+            env=os.environ,
+        )
+
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    imports: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, package = line[len("import time:") :].split("|")
+        # Keep the indentation, which shows which import pulled the package in
+        imports[package[1:]] = int(cumulative)
+    assert result.returncode == 0, result.stderr.splitlines()[-1]
+    # Top-level imports are the ones that aren't indented
+    total = sum(us for package, us in imports.items() if not package.startswith(" "))
+
+    print(f"punch {' '.join(command)} startup:")
+    print(f"\timports: {total / 1000:8.1f} ms over {len(imports)} modules")
+    heavy = [p for p in ("uploading", "lib.gspread") if p in map(str.strip, imports)]
+    if heavy:
+        eprint(f"punch {' '.join(command)} imported {', '.join(heavy)}.")
+        sys.exit(1)
+
+
+def bench_report(n_rows: int = 500_000) -> None:
+    """Times `punch report` for each grouping against a naive loop over
+    `LogEntry`s that totals the hours per day.
+    """
+    from report import GROUPINGS, Report
+    from timelog import TimeLog
+
+    print(f"report over {n_rows:,} rows:")
+    with isolated_data_dir():
+        write_csv(n_rows)
+        log = TimeLog()
+
+        for by in GROUPINGS:
+            seconds = time_it(lambda: Report(log.store).totals(by), repeat=3)
+            print(f"\t--by {by:<5}  {seconds * 1000:8.1f} ms")
+
+        def naive_totals():
+            totals: dict[str, float] = {}
+            for entry in log.entries_between(datetime(1970, 1, 2), datetime.now()):
+                totals[entry.date] = totals.get(entry.date, 0.0) + entry.work_hours
+            return totals
+
+        seconds = time_it(naive_totals, repeat=1)
+        print(f"\tnaive loop  {seconds * 1000:8.1f} ms")
+
+
+def bench_breaks(n_rows: int = 500_000, per_session: int = 3) -> None:
+    """Times `punch report` and rebuilding the totals over a large history with
+    `per_session` breaks in every session, against the same history without
+    breaks.
+    """
+    from report import Report
+    from timelog import TimeLog
+
+    print(f"report over {n_rows:,} rows, {per_session} breaks each:")
+    for breaks in (0, per_session):
+        with isolated_data_dir():
+            log = TimeLog()
+            records: list[tuple] = []
+            pauses: list[tuple[int, int]] = []
+            for punch_in, punch_out, hours, description in sessions(n_rows):
+                start, end = int(punch_in.timestamp()), int(punch_out.timestamp())
+                # Evenly spaced breaks of a tenth of the session each
+                step = (end - start) // (breaks + 1)
+                for i in range(1, breaks + 1):
+                    pauses.append((start + i * step, start + i * step + step // 10))
+                records.append((start, end, hours, description, breaks * (step // 10)))
+            log.store.extend(records)
+            log.store.extend_breaks(pauses)
+
+            assert not log.rollup.check(), "Totals don't match the breaks."
+            label = f"{breaks} breaks"
+            for by in ("day", "desc"):
+                seconds = time_it(lambda: Report(log.store).totals(by), repeat=3)
+                print(f"\t{label:<9} --by {by:<4}  {seconds * 1000:8.1f} ms")
+            seconds = time_it(log.rollup.rebuild, repeat=3)
+            print(f"\t{label:<9} rollup     {seconds * 1000:8.1f} ms")
+
+
+def bench_import(n_rows: int = 500_000, files: int = 8) -> None:
+    """Times `punch import` of `n_rows` entries split over `files` `.csv` files,
+    each repeating a tenth of the one before it, parsing them in one process
+    against the process pool.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    from importing import import_files, parse_file
+    from timelog import TimeLog
+
+    print(f"import of {n_rows:,} entries from {files} files:")
+    with isolated_data_dir() as data_dir:
+        rows = list(sessions(n_rows))
+        per_file = -(-n_rows // files)
+        paths = []
+        for i in range(files):
+            path = os.path.join(data_dir, f"import-{i}.csv")
+            with open(path, "w") as file:
+                file.write("Date,Punch in,Punch out,Time (hours),Description")
+                start = max(i * per_file - per_file // 10, 0)
+                for punch_in, punch_out, hours, description in rows[
+                    start : (i + 1) * per_file
+                ]:
+                    file.write(
+                        f"\n{punch_in.strftime('%D')},{punch_in.strftime('%H:%M')},"
+                        f"{punch_out.strftime('%H:%M')},{hours},{description}"
+                    )
+            paths.append(path)
+
+        seconds = time_it(lambda: [parse_file(path) for path in paths], 1)
+        print(f"\tparse, 1 process  {seconds * 1000:8.1f} ms")
+        with ProcessPoolExecutor(max_workers=min(files, os.cpu_count() or 1)) as pool:
+            seconds = time_it(lambda: list(pool.map(parse_file, paths)), 1)
+        print(f"\tparse, pool       {seconds * 1000:8.1f} ms")
+
+        log = TimeLog()
+        start = time.perf_counter()
+        read, added, _ = import_files(log, paths)
+        seconds = time.perf_counter() - start
+        assert added == n_rows == len(log.store), "Lost or repeated an entry."
+        print(
+            f"\timport            {seconds * 1000:8.1f} ms,"
+            f" {read / seconds:,.0f} rows/s, {read - added:,} duplicates"
+        )
+        # Everything is a duplicate the second time around
+        start = time.perf_counter()
+        _, added, _ = import_files(log, paths)
+        seconds = time.perf_counter() - start
+        assert not added, "Imported a duplicate."
+        print(
+            f"\timport again      {seconds * 1000:8.1f} ms,"
+            f" {read / seconds:,.0f} rows/s"
+        )
+
+
+def bench_backends(n_rows: int = 1_000_000) -> None:
+    """Times the session store operations behind each command with the binary
+    and the SQLite backend, over a history of `n_rows` sessions.
+    """
+    from report import Report
+    from timelog import TimeLog, find_rollup, find_store
+
+    print(f"store backends over {n_rows:,} sessions:")
+    default = c.STORE_BACKEND
+    for backend in c.STORE_BACKENDS:
+        c.STORE_BACKEND = backend
+        try:
+            with isolated_data_dir():
+                log = TimeLog()
+                batch: list[tuple] = []
+                start = time.perf_counter()
+                for punch_in, punch_out, hours, description in sessions(n_rows):
+                    batch.append(
+                        (
+                            int(punch_in.timestamp()),
+                            int(punch_out.timestamp()),
+                            hours,
+                            description,
+                        )
+                    )
+                    if len(batch) == c.ROWS_PER_READ:
+                        log.store.extend(batch)
+                        batch = []
+                log.store.extend(batch)
+                loaded = time.perf_counter() - start
+                log.store.uploaded = n_rows - 1_000
+                size = sum(os.path.getsize(path) for path in log.store.paths)
+                print(
+                    f"\t{backend:<6} load          {loaded * 1000:9.1f} ms,"
+                    f" {size / 2**20:.1f} MiB"
+                )
+
+                def reopen() -> TimeLog:
+                    # As a new process would, finding the last session again
+                    find_store().close()
+                    find_store.cache_clear()
+                    find_rollup.cache_clear()
+                    return TimeLog()
+
+                last = datetime.fromtimestamp(log.store.record(-1)[0]).date()
+                week = last - timedelta(days=6), last
+                timings = {
+                    "open, last": reopen,
+                    "week range": lambda: log.store.find_range(
+                        datetime.combine(week[0], datetime.min.time()),
+                        datetime.combine(week[1], datetime.min.time()),
+                    ),
+                    "report week": lambda: Report(log.store, *week).totals("day"),
+                    "report all": lambda: Report(log.store).totals("day"),
+                    "report desc": lambda: Report(log.store).totals("desc"),
+                    "get 1k rows": log.get_rows,
+                    "punch in/out": lambda: (
+                        log.store.append(int(time.time())),
+                        log.store.close_last(int(time.time()), 0.0, "NULL"),
+                    ),
+                }
+                for name, func in timings.items():
+                    seconds = time_it(func, repeat=3)
+                    print(f"\t{backend:<6} {name:<13} {seconds * 1000:9.3f} ms")
+        finally:
+            c.STORE_BACKEND = default
+
+
+def bench_timestamps(n_rows: int = 1_000_000) -> None:
+    """Times converting `n_rows` punch times between epochs and the `.csv` file's
+    dates and times with `strptime()`/`strftime()` against the `timestamps` codec,
+    then building the `.csv` rows of a history of `n_rows` sessions.
+    """
+    import timestamps
+    from timelog import TimeLog
+
+    print(f"timestamps of {n_rows:,} rows:")
+    epochs = [int(punch_in.timestamp()) for punch_in, *_ in sessions(n_rows)]
+    days = [datetime.fromtimestamp(epoch).strftime("%D") for epoch in epochs]
+    clocks = [datetime.fromtimestamp(epoch).strftime("%H:%M") for epoch in epochs]
+
+    def clear() -> None:
+        # Time a cold codec, as a new process would run it
+        for cached in (
+            timestamps.parse_day,
+            timestamps._midnight,
+            timestamps._quarter,
+            timestamps._day_span,
+        ):
+            cached.cache_clear()
+
+    def strptime() -> list[int]:
+        return [
+            int(datetime.strptime(f"{day} {clock}", "%m/%d/%y %H:%M").timestamp())
+            for day, clock in zip(days, clocks)
+        ]
+
+    def to_epoch() -> list[int]:
+        clear()
+        return [timestamps.to_epoch(day, clock) for day, clock in zip(days, clocks)]
+
+    def strftime() -> list[tuple[str, str]]:
+        return [
+            (moment.strftime("%D"), moment.strftime("%H:%M"))
+            for moment in map(datetime.fromtimestamp, epochs)
+        ]
+
+    def format_column() -> tuple[list[str], list[str]]:
+        clear()
+        return timestamps.format_column(epochs)
+
+    assert strptime() == to_epoch() == epochs, "Parsed a different epoch."
+    assert strftime() == list(zip(*format_column())), "Formatted a different time."
+    for name, func in (
+        ("strptime", strptime),
+        ("to_epoch", to_epoch),
+        ("strftime", strftime),
+        ("format_column", format_column),
+    ):
+        seconds = time_it(func, repeat=3)
+        print(
+            f"\t{name:<14} {seconds * 1000:9.1f} ms,"
+            f" {seconds / n_rows * 1e9:6.0f} ns/row"
+        )
+
+    with isolated_data_dir():
+        log = TimeLog()
+        log.store.extend(
+            [
+                (int(punch_in.timestamp()), int(punch_out.timestamp()), hours, desc)
+                for punch_in, punch_out, hours, desc in sessions(n_rows)
+            ]
+        )
+        for name, func in (
+            ("rows, entries", lambda: [e.to_row() for e in log.entries_in(0, n_rows)]),
+            ("rows, columns", lambda: log.rows_in(0, n_rows)),
+        ):
+            seconds = time_it(func, repeat=1)
+            print(
+                f"\t{name:<14} {seconds * 1000:9.1f} ms,"
+                f" {seconds / n_rows * 1e9:6.0f} ns/row"
+            )
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    """The sample below which `fraction` of `samples` fall."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench_daemon(n_rows: int = 100_000, requests: int = 200) -> None:
+    """Times `punch state` over a large history as a bare socket round trip to a
+    running `punch daemon`, and as whole CLI processes with and without it.
+    """
+    import daemon
+    from timelog import TimeLog
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "punch.py")
+    print(f"punch state over {n_rows:,} rows:")
+    with isolated_data_dir():
+        write_csv(n_rows)
+        write_log(n_rows)
+        TimeLog()
+
+        server = subprocess.Popen(
+            [sys.executable, script, "daemon"], stdout=subprocess.DEVNULL
+        )
+        try:
+            while daemon.request(["daemon", "ping"]) is None:
+                time.sleep(0.01)
+            timings: dict[str, list[float]] = {
+                "socket round trip": [],
+                "cli via daemon": [],
+                "cli direct": [],
+            }
+            for _ in range(requests):
+                start = time.perf_counter()
+                daemon.request(["state"])
+                timings["socket round trip"].append(time.perf_counter() - start)
+            # Whole `punch state` processes, interpreter startup included
+            for _ in range(requests // 10):
+                for name, args in (("cli via daemon", []), ("cli direct", ["--direct"])):
+                    start = time.perf_counter()
+                    subprocess.run(
+                        [sys.executable, script, "state", *args],
+                        stdout=subprocess.DEVNULL,
+                    )
+                    timings[name].append(time.perf_counter() - start)
+        finally:
+            daemon.request(["daemon", "stop"])
+            server.wait()
+
+    for name, times in timings.items():
+        print(
+            f"\t{name:<17}  median {statistics.median(times) * 1000:8.3f} ms,"
+            f"  p99 {percentile(times, 0.99) * 1000:8.3f} ms"
+        )
+
+
+def bench_prompt(n_rows: int = 100_000, calls: int = 1_000) -> None:
+    """Times `punch prompt` while punched-in over a large history, reading the
+    status cache in this process and as whole CLI processes against `punch
+    state`, and fails if the prompt imports more than the cache needs.
+    """
+    import status
+    from timelog import TimeLog
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "punch.py")
+    print(f"punch prompt over {n_rows:,} rows:")
+    with isolated_data_dir():
+        write_csv(n_rows)
+        write_log(n_rows)
+        TimeLog()
+        run_command("in", "--direct")
+
+        timings: dict[str, list[float]] = {
+            "status.show": [],
+            "status.show, stale": [],
+            "cli prompt": [],
+            "cli state": [],
+        }
+        for _ in range(calls):
+            start = time.perf_counter()
+            status.show(c.STATUS_FORMAT)
+            timings["status.show"].append(time.perf_counter() - start)
+        for _ in range(calls // 100):
+            os.remove(status._data_path(c.STATUS_FILE_NAME))
+            start = time.perf_counter()
+            status.show(c.STATUS_FORMAT)
+            timings["status.show, stale"].append(time.perf_counter() - start)
+        # Whole processes, interpreter startup included
+        for _ in range(calls // 20):
+            for name, args in (("cli prompt", ["prompt"]), ("cli state", ["state"])):
+                start = time.perf_counter()
+                subprocess.run(
+                    [sys.executable, script, *args, "--direct"],
+                    stdout=subprocess.DEVNULL,
+                )
+                timings[name].append(time.perf_counter() - start)
+
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", script, "prompt"],
+            capture_output=True,
+            text=True,
+        )
+
+    for name, times in timings.items():
+        print(
+            f"\t{name:<18}  median {statistics.median(times) * 1000:8.3f} ms,"
+            f"  p99 {percentile(times, 0.99) * 1000:8.3f} ms"
+        )
+    imported = {line.split("|")[-1].strip() for line in result.stderr.splitlines()}
+    heavy = [p for p in ("timelog", "uploading", "lib.gspread") if p in imported]
+    if heavy:
+        eprint(f"punch prompt imported {', '.join(heavy)}.")
+        sys.exit(1)
+
+
+def bench_watch(n_rows: int = 1_000_000, seconds: float = 60.0) -> None:
+    """Measures the CPU time `punch state --watch` takes over `seconds` of a large
+    history, with a punch in, a break and a punch out along the way.
+    """
+    import signal
+
+    from timelog import TimeLog
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "punch.py")
+    print(f"punch state --watch over {n_rows:,} rows for {seconds:g} s:")
+    with isolated_data_dir():
+        log = TimeLog()
+        log.store.extend(
+            [
+                (int(punch_in.timestamp()), int(punch_out.timestamp()), hours, desc)
+                for punch_in, punch_out, hours, desc in sessions(n_rows)
+            ]
+        )
+        watcher = subprocess.Popen(
+            [sys.executable, script, "state", "--watch", "--direct"],
+            stdout=subprocess.DEVNULL,
+        )
+        start = time.perf_counter()
+        for command in (["in"], ["break"], ["break", "end"], ["out"]):
+            time.sleep(seconds / 5)
+            run_command(*command, "--direct")
+        time.sleep(seconds - (time.perf_counter() - start))
+        watcher.send_signal(signal.SIGINT)
+        _, code, usage = os.wait4(watcher.pid, 0)
+        elapsed = time.perf_counter() - start
+
+    cpu = usage.ru_utime + usage.ru_stime
+    print(
+        f"\tCPU {cpu * 1000:8.1f} ms over {elapsed:.1f} s, {cpu / elapsed:.3%},"
+        f" {cpu / elapsed * 8 * 60 * 60:.1f} s over an 8-hour shift"
+    )
+    if os.waitstatus_to_exitcode(code):
+        eprint("punch state --watch didn't exit cleanly.")
+        sys.exit(1)
+
+
+def bench_sync(
+    n_rows: int = 200_000, differences: tuple[int, ...] = (10, 1_000)
+) -> None:
+    """Times `punch sync` against a fake worksheet holding an uploaded history,
+    once with nothing cached, then with `differences` new entries on each side
+    and the connection dropped after the first appended chunk. Past the first
+    sync, the requests and cells read should follow the differences, not the
+    history, and no entry may be lost or sent twice.
+    """
+    from syncing import entry_hash, hash_cell, sync_log
+    from timelog import TimeLog
+    from uploading import upload_log
+
+    def records(dates: list[tuple]) -> list[tuple]:
+        return [
+            (int(punch_in.timestamp()), int(punch_out.timestamp()), hours, desc)
+            for punch_in, punch_out, hours, desc in dates
+        ]
+
+    print(f"sync with a worksheet of {n_rows:,} rows:")
+    # Generated at once, as the sessions in a day depend on how many there are
+    history = list(sessions(n_rows + 2 * sum(differences) + differences[0]))
+    with isolated_data_dir():
+        log = TimeLog()
+        log.store.extend(records(history[:n_rows]))
+        wks = FakeWorksheet()
+        wks.rows.append(list(c.CSV_HEADER))
+        upload_log(wks, log)
+        total = n_rows
+
+        for n_new in (0, *differences):
+            # Alternate new sessions between this machine and another one's rows
+            new = records(history[total : total + 2 * n_new])
+            log.store.extend(new[::2])
+            for punch_in, punch_out, hours, description in new[1::2]:
+                day, since = time.strftime("%D %H:%M", time.localtime(punch_in)).split()
+                until = time.strftime("%H:%M", time.localtime(punch_out))
+                digest = entry_hash(punch_in, punch_out, description)
+                wks.rows.append(
+                    [day, since, until, f"{hours}", description, f"{hours}"]
+                    + [hash_cell(digest)]
+                )
+            total += 2 * n_new
+
+            requests, cells = wks.requests, wks.cells_read
+            # One request for the hashes, the first append goes through
+            wks.fail_after = wks.requests + 2 if n_new else None
+            wks.reply_lost = True
+            start = time.perf_counter()
+            try:
+                sync_log(wks, log, "fake")
+            except ConnectionError:
+                wks.fail_after = None
+                sync_log(wks, log, "fake")
+            seconds = time.perf_counter() - start
+
+            digests = [row[6] for row in wks.rows[1:]]
+            assert len(digests) == len(set(digests)) == total, "Sent a row twice."
+            assert len(log.store) == total, "Lost an entry."
+            label = f"{n_new:,} new on each side" if n_new else "nothing cached"
+            print(
+                f"\t{label:>24}: {seconds * 1000:8.1f} ms,"
+                f" {wks.requests - requests} requests,"
+                f" {wks.cells_read - cells:,} cells read"
+            )
+
+        # Rows typed in by hand have no hash, so are read back and parsed, in
+        #    whatever format the worksheet shows them
+        typed = records(history[total : total + differences[0]])
+        for punch_in, punch_out, hours, description in typed:
+            day, since = time.strftime("%D %H:%M", time.localtime(punch_in)).split()
+            until = time.strftime("%H:%M", time.localtime(punch_out))
+            wks.rows.append([day, since, until, f"{hours}", description, f"{hours}"])
+        total += len(typed)
+        appended, merged, malformed = sync_log(wks, log, "fake")
+        assert not malformed, f"Misread a typed-in row: {malformed[0]}"
+        assert merged == len(typed) and not appended, "Mismatched a typed-in row."
+        assert len(log.store) == total, "Lost an entry."
+        print(f"\t{len(typed):>8,} typed-in rows: merged")
+
+
+def bench_tags(
+    n_rows: int = 1_000_000, tags: int = 5_000, punches: int = 3_000
+) -> None:
+    """Times building the tag index over `n_rows` sessions tagged with one of
+    `tags` clients, a third of them also '#billable', and reports on a tag from
+    the index against scanning every description for it. Then times `punches`
+    punch-outs of tagged sessions, each indexed as it's closed, and merging
+    imported sessions in among the others.
+    """
+    from importing import merge_sessions
+    from report import Report
+    from tagindex import TagIndex
+    from timelog import TimeLog, find_tag_index
+
+    def scan(tag: str, since: date) -> list[tuple]:
+        # Reports on `tag` by reading the tags of every session since `since`
+        store = log.store
+        found = store.find_range(datetime.combine(since, datetime.min.time()), now)
+        epochs, hours = array("q"), array("d")
+        for block in range(found.start, found.stop, ROWS_PER_READ):
+            end = min(block + ROWS_PER_READ, found.stop)
+            punch_ins, _, worked = store.columns(block, end)
+            on_break = store.session_break_seconds(block, end)
+            for row, tags in enumerate(store.tags(block, end)):
+                if tag in tags.split():
+                    epochs.append(punch_ins[row])
+                    hours.append(worked[row] - on_break[row] / 3600)
+        return Report(store, since, sessions=(epochs, hours)).totals("month")
+
+    print(f"tag index over {n_rows:,} sessions with {tags + 1:,} tags:")
+    now = datetime.now()
+    with isolated_data_dir():
+        log = TimeLog()
+        log.store.extend(
+            [
+                (
+                    int(punch_in.timestamp()),
+                    int(punch_out.timestamp()),
+                    hours,
+                    description,
+                    0,
+                    f"client{i * 7919 % tags}" + (" billable" if i % 3 == 0 else ""),
+                )
+                for i, (punch_in, punch_out, hours, description) in enumerate(
+                    sessions(n_rows)
+                )
+            ]
+        )
+        log.store.uploaded = n_rows
+        start = time.perf_counter()
+        index = find_tag_index()
+        print(f"\t{'rebuild':>24}: {(time.perf_counter() - start) * 1000:8.1f} ms")
+        seconds = time_it(
+            lambda: TagIndex(index.path, index.postings_path, log.store), repeat=5
+        )
+        print(f"\t{'load':>24}: {seconds * 1000:8.1f} ms")
+
+        first = datetime.fromtimestamp(log.store.record(0)[0]).date()
+        since = first + (now.date() - first) / 2
+        for tag in ("client42", "billable"):
+            indexed = index.report([tag], since).totals("month")
+            scanned = scan(tag, since)
+            assert [row[:3] for row in indexed] == [row[:3] for row in scanned]
+            assert all(
+                math.isclose(a[3], b[3], abs_tol=1e-6)
+                for a, b in zip(indexed, scanned)
+            ), f"The index and a scan disagree on #{tag}."
+            for label, func in (
+                ("index", lambda: index.report([tag], since).totals("month")),
+                ("scan", lambda: scan(tag, since)),
+            ):
+                seconds = time_it(func, repeat=3)
+                name = f"#{tag} since {since} {label}"
+                print(f"\t{name:>24}: {seconds * 1000:8.1f} ms")
+
+        # Punch-outs after the history, each closing a tagged session
+        last = log.store.record(-1)[1]
+        samples = []
+        for i in range(punches):
+            punch_in = last + (i + 1) * 3600
+            tagged = f"client{i % tags} billable"
+            log.store.extend([(punch_in, punch_in + 1800, 0.5, "call", 0, tagged)])
+            start = time.perf_counter()
+            index.sync()
+            samples.append(time.perf_counter() - start)
+        print(
+            f"\t{'index at punch-out':>24}: {percentile(samples, 0.5) * 1000:8.1f} ms"
+            f" median, {percentile(samples, 0.99) * 1000:.1f} ms p99,"
+            f" {max(samples) * 1000:.1f} ms compacting"
+        )
+
+        # Sessions imported in among the others, one a day for a year back
+        merged = [
+            (punch_in, punch_in + 600, 1 / 6, "imported", 0, "client42")
+            for punch_in in range(
+                int(now.timestamp()) - 365 * 86400, int(now.timestamp()), 86400
+            )
+        ]
+        log.rollup.sync()
+        start = time.perf_counter()
+        merge_sessions(log, merged)
+        print(
+            f"\t{f'merge {len(merged)} sessions':>24}:"
+            f" {(time.perf_counter() - start) * 1000:8.1f} ms"
+        )
+        # Sessions punched in at the same time with a tag each, as imported from
+        #    two people's sheets, aren't one session with both tags
+        clash = int(now.timestamp()) // 60 * 60 - 30 * 86400
+        merge_sessions(
+            log,
+            [
+                (clash, clash + 3600, 1.0, "call", 0, "acme"),
+                (clash, clash + 7200, 2.0, "call", 0, "design"),
+            ],
+        )
+        assert not index.report(["acme", "design"]).days, "Tags of sessions mixed."
+        assert not index.check(), index.check()[:5]
+        print("\tThe index matches a rebuild from the store.")
+
+    with isolated_data_dir():
+        run_command("in", "--tag", "acme", "--direct")
+        run_command("out", "--desc", "did stuff", "--direct")
+        store = TimeLog().store
+        description, tags = store.record(-1)[3], store.tags(len(store) - 1)[0]
+        assert description == "did stuff", f"Tags in the description: '{description}'."
+        assert tags == "acme", f"Tags lost: '{tags}'."
+        assert find_tag_index().report(["acme"]).days, "The session isn't indexed."
+    print("\tTags given at punch-in outlive a description given at punch-out.")
+
+
+def bench_targets(
+    n_rows: int = 5_000, targets: int = 3, latency: float = 0.25
+) -> None:
+    """Times uploading a backlog to several targets one after another and all at
+    once, each request taking `latency` seconds and one target dropping its
+    first requests. Then has one target fail for good: the upload mark mustn't
+    move until it's run again, and no target may get a row twice.
+    """
+    from timelog import TimeLog
+    from uploading import Target, upload_to_targets
+
+    def run(
+        log: "TimeLog", sheets: dict[str, FakeWorksheet], workers: int | None = None
+    ) -> tuple[list, float]:
+        # The first target only takes the entries of one description
+        targets = [
+            Target(name, name, description=None if index else "task 1*")
+            for index, name in enumerate(sheets)
+        ]
+        start = time.perf_counter()
+        results = upload_to_targets(
+            targets,
+            lambda target: sheets[target.name],
+            log,
+            backoff=0.01,
+            workers=workers,
+        )
+        return results, time.perf_counter() - start
+
+    print(
+        f"upload of {n_rows:,} rows to {targets} targets,"
+        f" {latency * 1000:g} ms a request:"
+    )
+    for label, workers in (("one at a time", 1), ("all at once", None)):
+        with isolated_data_dir():
+            write_csv(n_rows)
+            log = TimeLog()
+            sheets = {
+                f"target {index}": FakeWorksheet(
+                    latency=latency, drops=2 if index == 1 else 0
+                )
+                for index in range(targets)
+            }
+            results, seconds = run(log, sheets, workers)
+            assert not any(result.error for result in results), results
+            assert log.store.uploaded == n_rows, "The upload mark didn't move."
+        print(f"\t{label:>14}: {seconds:6.2f} s")
+        for result in results:
+            print(
+                f"\t{'':>14}  {result.name}: {result.rows:,} rows,"
+                f" {result.requests} requests, {result.seconds:.2f} s"
+            )
+
+    with isolated_data_dir():
+        write_csv(n_rows)
+        log = TimeLog()
+        sheets = {f"target {index}": FakeWorksheet() for index in range(targets)}
+        sheets["target 1"].fail_after = 2
+        results, _ = run(log, sheets)
+        assert [bool(result.error) for result in results].count(True) == 1
+        assert log.store.uploaded == 0, "The upload mark moved before all confirmed."
+        sheets["target 1"].fail_after = None
+        results, _ = run(log, sheets)
+        assert not any(result.error for result in results), results
+        assert log.store.uploaded == n_rows, "The upload mark didn't move."
+        for name, wks in sheets.items():
+            digests = [row[6] for row in wks.rows]
+            assert len(digests) == len(set(digests)), f"{name} got a row twice."
+        print("\tA failed target resumed without sending any row twice.")
+
+
+def bench_outbox(
+    n_rows: int = 100_000, queued: int = 20, offline: int = 6, latency: float = 0.1
+) -> None:
+    """Times `punch out --upload` against `punch out`, then drains an outbox of
+    `queued` entries on top of `n_rows` uploaded ones to a fake worksheet: offline
+    for the first `offline` attempts, with an entry punched out during each, then
+    taking `latency` seconds a request, dropping connections and losing a reply.
+    Every entry must reach the worksheet once, in order, in as few requests as
+    the connection allows; likewise after the flusher dies with a request in
+    flight, whether the request went through or not.
+    """
+    import uploading
+    from outbox import _InFlight, flush, flusher_running
+    from syncing import hash_cell, record_hash
+    from timelog import TimeLog, data_file_path
+    from uploading import upload_log
+
+    print("punch out latency:")
+    with isolated_data_dir():
+        write_csv(n_rows)
+        # A chosen worksheet and a key, for the background upload to fail to open
+        with open(data_file_path(c.UPLOAD_CACHE_FILE_NAME), "w") as file:
+            json.dump({"spreadsheet_id": "fake", "worksheet_id": 0}, file)
+        key_path = uploading.SERVICE_ACCT_JSON
+        uploading.SERVICE_ACCT_JSON = data_file_path("key.json")
+        with open(uploading.SERVICE_ACCT_JSON, "w") as file:
+            json.dump({"client_email": "fake@example.com"}, file)
+        for label, args in (("out", ["out"]), ("out --upload", ["out", "--upload"])):
+            samples = []
+            for _ in range(5):
+                # Time a punch-out, not the last one's flusher: give it time to
+                #    start, and to finish
+                time.sleep(0.5)
+                while flusher_running():
+                    time.sleep(0.01)
+                run_command("in", "--direct")
+                start = time.perf_counter()
+                run_command(*args, "--direct")
+                samples.append(time.perf_counter() - start)
+            print(f"\t{label:>22}: {statistics.median(samples) * 1000:8.1f} ms")
+        # Let the last background upload finish before the folder goes
+        time.sleep(0.5)
+        while flusher_running():
+            time.sleep(0.01)
+        uploading.SERVICE_ACCT_JSON = key_path
+
+    def check(log: "TimeLog", wks: FakeWorksheet) -> None:
+        expected = [hash_cell(record_hash(record)) for record in log.store.records()]
+        assert [row[6] for row in wks.rows[1:]] == expected, "Rows lost or resent."
+        assert log.store.uploaded == len(log.store), "The upload mark didn't move."
+
+    print(f"outbox over {n_rows:,} uploaded rows:")
+    history = [
+        (int(punch_in.timestamp()), int(punch_out.timestamp()), hours, description)
+        for punch_in, punch_out, hours, description in sessions(
+            n_rows + queued + offline + 10
+        )
+    ]
+    with isolated_data_dir():
+        log = TimeLog()
+        log.store.extend(history[:n_rows])
+        wks = FakeWorksheet()
+        wks.rows.append(list(c.CSV_HEADER))
+        upload_log(wks, log)
+        log.store.extend(history[n_rows : n_rows + queued])
+        next_entry = n_rows + queued
+
+        attempts = 0
+
+        def open_worksheet() -> FakeWorksheet:
+            nonlocal attempts, next_entry
+            attempts += 1
+            if attempts <= offline:
+                log.store.extend([history[next_entry]])
+                next_entry += 1
+                raise ConnectionError("Fake network unreachable.")
+            return wks
+
+        wks.latency, wks.drops, wks.lost = latency, 2, 1
+        requests, cells = wks.requests, wks.cells_read
+        start = time.perf_counter()
+        sent = flush(log, open_worksheet, backoff=0.01)
+        seconds = time.perf_counter() - start
+        check(log, wks)
+        print(
+            f"\t{'offline, then flaky':>22}: {sent} entries in"
+            f" {wks.requests - requests} requests, {wks.cells_read - cells:,} cells"
+            f" read, {seconds:.2f} s"
+        )
+
+        wks.latency = 0.0
+        for landed in (True, False):
+            log.store.extend(history[next_entry : next_entry + 2])
+            next_entry += 2
+            mark = log.store.uploaded
+            digests = [record_hash(record) for record in log.store.records(mark)]
+            _InFlight().save(digests)
+            if landed:
+                rows = log.rows_in(mark, len(log.store))
+                wks.append_rows(
+                    [row + [hash_cell(digest)] for row, digest in zip(rows, digests)]
+                )
+            requests, cells = wks.requests, wks.cells_read
+            flush(log, lambda: wks, backoff=0.01)
+            check(log, wks)
+            label = "died, request landed" if landed else "died, request lost"
+            print(
+                f"\t{label:>22}: {wks.requests - requests} requests,"
+                f" {wks.cells_read - cells:,} cells read"
+            )
+    print("\tEvery entry reached the worksheet once, in order.")
+
+
+def bench_stress(processes: int = 8, rounds: int = 10) -> None:
+    """Runs `processes` punch processes at once, each punching in, out and checking
+    the state `rounds` times, then checks that no punch was lost, duplicated or
+    half-written in the session store, `.log` and `.csv` files.
+    """
+    from timelog import LogEntry, TimeLog, find_rollup, find_store
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "punch.py")
+
+    def worker(_) -> tuple[int, int]:
+        ins = outs = 0
+        for _ in range(rounds):
+            for command in ("in", "out", "state"):
+                result = subprocess.run(
+                    [sys.executable, script, command, "--direct"],
+                    capture_output=True,
+                    text=True,
+                )
+                assert result.returncode == 0, result.stdout + result.stderr
+                ins += "PUNCH IN AT" in result.stdout
+                outs += "PUNCH OUT AT" in result.stdout
+        return ins, outs
+
+    print(f"stress {processes} processes x {rounds} rounds:")
+    with isolated_data_dir():
+        TimeLog()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(processes) as pool:
+            counts = list(pool.map(worker, range(processes)))
+        seconds = time.perf_counter() - start
+        ins = sum(count[0] for count in counts)
+        outs = sum(count[1] for count in counts)
+
+        # Forget what this process loaded before the workers wrote
+        find_store().close()
+        find_store.cache_clear()
+        find_rollup.cache_clear()
+        log = TimeLog()
+        problems: list[str] = []
+        if len(log.store) != ins:
+            problems.append(f"{ins} punch-ins, the store has {len(log.store)}.")
+        closed = sum(1 for record in log.store.records() if record[1])
+        if closed != outs:
+            problems.append(f"{outs} punch-outs, the store closed {closed}.")
+
+        with open(LogEntry.find_log_file(), "r") as file:
+            labels = [line.partition(":")[0] for line in file if line.strip()]
+        expected = ["Punch in", "Punch out", "Hours worked"] * outs
+        expected += ["Punch in"] * (ins - outs)
+        if labels != expected:
+            problems.append("The `.log` file doesn't alternate punch-ins and outs.")
+
+        with open(log.csv_file_path, "r") as file:
+            rows = [line.strip().split(",") for line in file][1:]
+        if [len(row) for row in rows] != [6] * outs + [2] * (ins - outs):
+            problems.append("The `.csv` file has half-written rows.")
+        problems.extend(log.rollup.check())
+
+    print(
+        f"\t{ins} punch-ins, {outs} punch-outs and {processes * rounds} state checks"
+        f" in {seconds:.1f} s"
+    )
+    if problems:
+        eprint("Concurrent punches corrupted the data files:", *problems)
+        sys.exit(1)
+    print("\tStore, `.log` and `.csv` files are consistent.")
+
+
+def suite_for(n_rows: int, repeat: int = 3) -> dict[str, float]:
+    """Times every command over a fixture of `n_rows` entries, ending in a
+    partial punched-in entry.
+
+    :returns `dict[str, float]` - median seconds per timed operation
+    """
+    from timelog import TimeLog
+    from uploading import upload_log
+
+    timings: dict[str, list[float]] = {}
+
+    def timed(name: str, func) -> None:
+        start = time.perf_counter()
+        func()
+        timings.setdefault(name, []).append(time.perf_counter() - start)
+
+    with isolated_data_dir():
+        write_csv(n_rows, punched_in=True)
+        write_log(n_rows, punched_in=True)
+        timed("migrate", TimeLog)
+
+        for _ in range(repeat):
+            timed("timelog_init", TimeLog)
+            log = TimeLog()
+            timed("record_entries", log.record_entries)
+            timed("get_rows", log.get_rows)
+            timed("show_csv", lambda: run_command("show", "csv"))
+            timed("state", lambda: run_command("state"))
+            timed("out", lambda: run_command("out"))
+            timed("in", lambda: run_command("in"))
+        run_command("out")
+
+        for _ in range(repeat):
+            log = TimeLog()
+            log.store.uploaded = 0
+            timed("upload", lambda: upload_log(FakeWorksheet(), log))
+
+    return {name: statistics.median(times) for name, times in timings.items()}
+
+
+def bench_suite() -> None:
+    """Times every command over fixtures of increasing size.
+
+    Options:
+      --sizes N[,N...]      Fixture sizes (default: 1000,100000,1000000)
+      --json PATH           Write the timings to PATH
+      --baseline PATH       Compare against timings written by an earlier run
+      --tolerance FRACTION  Slowdown over the baseline to allow (default: 0.25)
+    """
+
+    sizes = get_option("--sizes") or "1000,100000,1000000"
+    sizes = [int(size) for size in sizes.split(",")]
+    results: dict[str, dict[str, float]] = {}
+    for n_rows in sizes:
+        print(f"suite over {n_rows:,} rows:")
+        results[str(n_rows)] = suite_for(n_rows)
+        for name, seconds in results[str(n_rows)].items():
+            print(f"\t{name:<15} {seconds * 1000:10.3f} ms")
+
+    run = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "unit": "seconds",
+        "results": results,
+    }
+    if get_option("--json"):
+        with open(get_option("--json"), "w") as file:
+            json.dump(run, file, indent=2)
+
+    if get_option("--baseline"):
+        with open(get_option("--baseline"), "r") as file:
+            baseline = json.load(file)["results"]
+        tolerance = float(get_option("--tolerance") or 0.25)
+        regressions = compare(baseline, results, tolerance)
+        if regressions:
+            eprint("Regressions against the baseline:", *regressions)
+            sys.exit(1)
+        print("\nNo regressions against the baseline.\n")
+
+
+def compare(
+    baseline: dict[str, dict[str, float]],
+    results: dict[str, dict[str, float]],
+    tolerance: float,
+) -> list[str]:
+    """Compares timings against a baseline.
+
+    Differences under a millisecond are treated as noise.
+
+    :returns `list[str]` - a description of every timing more than `tolerance`
+        slower than in the baseline
+    """
+    regressions: list[str] = []
+    for size, timings in results.items():
+        for name, seconds in timings.items():
+            before = baseline.get(size, {}).get(name)
+            if before is None:
+                continue
+            if seconds > before * (1 + tolerance) and seconds - before > 0.001:
+                regressions.append(
+                    f"{name} over {int(size):,} rows: {before * 1000:.3f} ms"
+                    f" -> {seconds * 1000:.3f} ms ({seconds / before - 1:+.0%})"
+                )
+    return regressions
+
+
+def main() -> None:
+    """Main function."""
+    benchmarks = {
+        "punch_in": bench_punch_in,
+        "parse": bench_parse,
+        "upload": bench_upload,
+        "stream": bench_stream,
+        "log": bench_log,
+        "startup": bench_startup,
+        "report": bench_report,
+        "breaks": bench_breaks,
+        "import": bench_import,
+        "backends": bench_backends,
+        "timestamps": bench_timestamps,
+        "daemon": bench_daemon,
+        "prompt": bench_prompt,
+        "watch": bench_watch,
+        "sync": bench_sync,
+        "tags": bench_tags,
+        "targets": bench_targets,
+        "outbox": bench_outbox,
+        "stress": bench_stress,
+        "suite": bench_suite,
+    }
+    names = []
+    for arg in sys.argv[1:]:
+        if arg.startswith("--"):
+            break
+        names.append(arg)
+    # The suite covers the others and the stress test isn't a timing, so only run
+    #    them when asked for
+    for name in names or [
+        name for name in benchmarks if name not in ("suite", "stress")
+    ]:
+        benchmarks[name]()
+
+
+if __name__ == "__main__":
+    main()
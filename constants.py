@@ -5,10 +5,81 @@ _debug = False
 LOG_FILE_NAME: str = "punch.log"
 CSV_FILE_NAME: str = "punch.csv"
 DESC_FILE_NAME: str = "description.txt"
+STORE_FILE_NAME: str = "punch.dat"
+STORE_DESC_FILE_NAME: str = "punch.desc"
+STORE_BREAKS_FILE_NAME: str = "punch.breaks"
+STORE_DB_FILE_NAME: str = "punch.db"
+UPLOAD_CACHE_FILE_NAME: str = "upload_cache.json"
+UPLOAD_TARGETS_FILE_NAME: str = "upload_targets.json"
+UPLOAD_PROGRESS_FILE_NAME: str = "upload_progress.json"
+ROLLUP_FILE_NAME: str = "rollup.json"
+TAG_INDEX_FILE_NAME: str = "tag_index.json"
+TAG_POSTINGS_FILE_NAME: str = "tag_index.postings"
+DAEMON_SOCKET_NAME: str = "punchd.sock"
+LOCK_FILE_NAME: str = "punch.lock"
+LOG_INDEX_FILE_NAME: str = "punch_log_index.json"
+STATUS_FILE_NAME: str = "status.cache"
+SYNC_LOCAL_FILE_NAME: str = "sync_local.hashes"
+SYNC_REMOTE_FILE_NAME: str = "sync_remote.hashes"
+OUTBOX_FILE_NAME: str = "outbox.json"
+FLUSH_LOCK_FILE_NAME: str = "flush.lock"
+
+# Where the history is kept: "binary" files, or a "sqlite" database to run ad-hoc
+#    queries on; switching copies the history over on the next run
+STORE_BACKEND: str = "binary"
+STORE_BACKENDS: tuple[str, ...] = ("binary", "sqlite")
+
+# Commands a running `punch daemon` serves for the CLI
+DAEMON_COMMANDS: tuple[str, ...] = ("in", "out", "break", "state", "show")
+# Commands that check the state and write to the data files under one lock
+WRITE_COMMANDS: tuple[str, ...] = ("in", "out", "break")
+# Commands that lock around each read and write themselves, as they can run long
+UNLOCKED_COMMANDS: tuple[str, ...] = ("upload", "sync", "flush", "daemon", "import")
+
+# Hours in a full work day, what overtime is counted against
+WORKDAY_HOURS: float = 8.0
+
+# Heading row of the `.csv` file
+CSV_HEADER: tuple[str, ...] = (
+    "Date",
+    "Punch in",
+    "Punch out",
+    "Time (hours)",
+    "Description",
+    "Net (hours)",
+)
+# Size past which the active `.log` file is rotated into a gzip'd segment
+LOG_SEGMENT_MAX_BYTES: int = 1024 * 1024
+# Rows read from the session store at a time when streaming them
+ROWS_PER_READ: int = 4096
+# Postings of newly tagged sessions the tag index keeps in its directory before
+#    rewriting the postings file with them, see `TagIndex`
+TAG_INDEX_TAIL_MAX: int = 1024
+# Malformed lines listed by `punch import`; the rest are only counted
+IMPORT_PROBLEMS_SHOWN: int = 20
+# Status line `punch prompt` outputs unless given `--format`, see `status.show()`
+STATUS_FORMAT: str = "{state} {elapsed} {desc}"
+# Trace `--trace-json` writes, in the working directory, unless given a path
+TRACE_FILE_NAME: str = "punch-trace.json"
 
 PUNCHED_IN_STATE: str = "punched-in"
 PUNCHED_OUT_STATE: str = "punched-out"
 
+# Most rows sent to the worksheet in a single request
+UPLOAD_CHUNK_SIZE: int = 500
+# Worksheet column, after the `.csv` fields, holding the hash of each row's entry
+SYNC_HASH_COLUMN: str = "G"
+# Seconds the list of spreadsheets shared with the service account is cached for
+UPLOAD_CACHE_TTL: int = 7 * 24 * 60 * 60
+# Times a request to an upload target is retried, and the seconds waited before
+#    the first retry, doubled before each one after
+UPLOAD_RETRIES: int = 4
+UPLOAD_BACKOFF: float = 1.0
+# Longest wait between attempts of a background upload while offline, and how
+#    long it keeps trying without getting anything through before giving up
+OUTBOX_BACKOFF_MAX: float = 15 * 60
+OUTBOX_GIVE_UP: float = 6 * 60 * 60
+
 SERVICE_ACCT_JSON = "C:\\Users\\natha\\AppData\\Local\\punch\\keys\\timesheet-project-372700-6d95058d5340.json"
 
 
@@ -0,0 +1,170 @@
+"""Resident `punch daemon` and the client the CLI uses to reach it.
+
+The daemon keeps the session store, its memory maps and the rollup loaded between
+commands, and runs `in`, `out`, `state` and `show` for clients over a Unix domain
+socket. The protocol is one JSON line each way:
+
+    -> {"argv": ["state"]}
+    <- {"output": "...", "code": 0}
+
+so shell prompts can also talk to it directly, e.g. with `nc -U`.
+"""
+
+import io
+import json
+import os
+import socket
+import sys
+from contextlib import redirect_stdout
+
+from constants import DAEMON_COMMANDS, DAEMON_SOCKET_NAME, dprint, eprint
+
+# Whether this process is the daemon, so it doesn't forward commands to itself
+_serving = False
+
+
+def socket_path() -> str:
+    """Path of the daemon's socket, in the punch folder of win32 local appdata."""
+    # Not `timelog.data_file_path()`, so the client doesn't import `timelog`
+    return os.path.expandvars("%LOCALAPPDATA%\\punch\\" + DAEMON_SOCKET_NAME)
+
+
+def request(argv: list[str], timeout: float = 5.0) -> tuple[str, int] | None:
+    """Runs `punch <argv>` in the daemon, if one is running.
+
+    :returns `tuple[str, int] | None` - the command's output and exit code, or
+        None if there is no daemon to run it
+    """
+
+    if _serving or not hasattr(socket, "AF_UNIX"):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(socket_path())
+    except OSError:
+        # No daemon (or a stale socket left by one); run the command directly
+        client.close()
+        return None
+
+    with client, client.makefile("rwb") as stream:
+        stream.write(json.dumps({"argv": argv}).encode() + b"\n")
+        stream.flush()
+        reply = json.loads(stream.readline())
+    return reply["output"], reply["code"]
+
+
+def run(argv: list[str]) -> tuple[str, int]:
+    """Runs `punch <argv>` in this process.
+
+    :returns `tuple[str, int]` - the command's output and exit code
+    """
+    import punch
+
+    output = io.StringIO()
+    saved_argv = sys.argv
+    sys.argv = ["punch", *argv]
+    code = 0
+    try:
+        with redirect_stdout(output):
+            punch.main()
+    except SystemExit as exit:
+        code = exit.code or 0
+    except Exception as err:
+        # The daemon keeps serving; the client gets the error as the output
+        dprint(repr(err))
+        with redirect_stdout(output):
+            eprint(f"<{' '.join(argv[:1])}> failed in the daemon: {err}")
+        code = 1
+    finally:
+        sys.argv = saved_argv
+    return output.getvalue(), code
+
+
+class _StoreWatch:
+    """Notices writes to the session store made by other processes, e.g. a
+    `punch upload`, so the daemon reloads instead of serving stale data.
+    """
+
+    def __init__(self) -> None:
+        self.seen: tuple | None = self.version()
+
+    def version(self) -> tuple | None:
+        from timelog import find_store
+
+        try:
+            return find_store().version()
+        except FileNotFoundError:
+            return None
+
+    def reload_if_changed(self) -> None:
+        from timelog import find_log_archive, find_rollup, find_store, find_tag_index
+
+        if self.version() != self.seen:
+            dprint("Session store changed on disk, reloading.")
+            find_store().close()
+            find_store.cache_clear()
+            find_rollup.cache_clear()
+            find_tag_index.cache_clear()
+            find_log_archive.cache_clear()
+
+    def mark_seen(self) -> None:
+        self.seen = self.version()
+
+
+def serve() -> None:
+    """Serves commands on the daemon's socket until a client sends `stop`."""
+    global _serving
+
+    if not hasattr(socket, "AF_UNIX"):
+        eprint("<daemon> needs Unix domain sockets, which this system doesn't have.")
+        sys.exit(1)
+    if request(["daemon", "ping"]) is not None:
+        eprint("A punch daemon is already running.")
+        sys.exit(1)
+
+    path = socket_path()
+    # A daemon that died leaves its socket behind
+    if os.path.exists(path):
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    _serving = True
+    watch = _StoreWatch()
+    print(f"\nPunch daemon listening on {path}\n")
+
+    try:
+        while True:
+            connection, _ = server.accept()
+            with connection, connection.makefile("rwb") as stream:
+                try:
+                    argv = json.loads(stream.readline())["argv"]
+                except (ValueError, KeyError, TypeError) as err:
+                    dprint(err)
+                    continue
+
+                if argv[:2] == ["daemon", "stop"]:
+                    output, code = "\nPunch daemon stopped.\n", 0
+                elif argv[:2] == ["daemon", "ping"]:
+                    output, code = "", 0
+                elif "--profile" in argv or "--trace-json" in argv:
+                    # Timings are of the process they're taken in
+                    output, code = "\nThe daemon doesn't profile; add --direct.\n", 1
+                elif argv and argv[0] in DAEMON_COMMANDS:
+                    watch.reload_if_changed()
+                    output, code = run(argv)
+                    watch.mark_seen()
+                else:
+                    command = " ".join(argv[:1])
+                    output, code = f"\nThe daemon doesn't run <{command}>.\n", 1
+
+                stream.write(json.dumps({"output": output, "code": code}).encode())
+                stream.write(b"\n")
+                stream.flush()
+                if argv[:2] == ["daemon", "stop"]:
+                    break
+    finally:
+        server.close()
+        os.remove(path)
+        _serving = False
@@ -0,0 +1,307 @@
+"""Bulk import of `.csv` and `.log` files, e.g. other people's exports or old
+logs, into the session store.
+
+Files are parsed in a process pool, each into a list of sessions sorted by
+punch-in, then k-way merged into one sorted stream. Entries identical to one
+already in the store, or to another imported one, are dropped by comparing their
+contents within each minute of punch-ins, so overlapping exports can be imported
+together. A malformed line is reported and skipped rather than failing the rest.
+"""
+
+import csv
+import gzip
+import heapq
+import os
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import chain, groupby
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+from constants import dprint
+from tagindex import parse_tags
+from timestamps import to_epoch
+from timing import span
+
+if TYPE_CHECKING:
+    from storage import Storage
+    from timelog import TimeLog
+
+
+def normalize(
+    day: str,
+    punch_in: str,
+    punch_out: str,
+    hours: str,
+    description: str,
+    on_break: float = 0.0,
+    tags: str = "",
+) -> tuple[int, int, float, str, int, str]:
+    """Builds a session store record out of the text fields of an entry.
+
+    Descriptions are spelled as in the store, with 'NULL' for a blank one, and
+    hours are rounded to the 6 places the `.log` file keeps, so the same entry
+    read from a `.csv` and a `.log` file comes out the same. Only the `.log`
+    file keeps `tags`, as '#tag' words.
+
+    :raises `ValueError` - if a field can't be parsed, or a tag isn't one
+    :returns `tuple` - punch-in epoch, punch-out epoch, hours, description,
+        seconds on break and tags, see `Storage.extend()`
+    """
+    day = day.strip()
+    start = to_epoch(day, punch_in.strip())
+    end = to_epoch(day, punch_out.strip())
+    # Punched out past midnight
+    if end < start:
+        end = to_epoch(day, punch_out.strip(), days=1)
+    description = description.strip()
+    if not description or description == "(No Description)":
+        description = "NULL"
+    return (
+        start,
+        end,
+        round(float(hours), 6),
+        description,
+        max(round(on_break), 0),
+        " ".join(parse_tags(tags.split())),
+    )
+
+
+def identity(session: tuple) -> tuple:
+    """What makes two sessions the same entry: the `.csv` and `.log` files only
+    keep punch times to the minute, so neither do sessions read back from them.
+    """
+    punch_in, punch_out, hours, description = session[:4]
+    return punch_in // 60, punch_out // 60, round(hours, 6), description
+
+
+def parse_row(fields: list[str]) -> tuple[int, int, float, str, int, str]:
+    """Parses a single row of a `.csv` file, or of the worksheet it's uploaded to.
+
+    :raises `ValueError` - if the row isn't a closed entry
+    :returns `tuple` - the session store record, see `normalize()`
+    """
+    if len(fields) == 2:
+        raise ValueError("entry was never punched out")
+    # Rows written before breaks were tracked have no net hours
+    if len(fields) not in (5, 6):
+        raise ValueError(f"expected 2, 5 or 6 fields, got {len(fields)}")
+    on_break = 0.0
+    if len(fields) == 6:
+        on_break = (float(fields[3]) - float(fields[5])) * 60 * 60
+    return normalize(*fields[:5], on_break)
+
+
+def parse_csv(lines: Iterable[str]) -> tuple[list[tuple], list[tuple[int, str]]]:
+    """Parses the rows of a `.csv` file, see `parse_file()`."""
+    sessions: list[tuple] = []
+    problems: list[tuple[int, str]] = []
+    rows = csv.reader(lines)
+    for fields in rows:
+        if not fields or not fields[0].strip():
+            continue
+        if rows.line_num == 1 and fields[0].strip() == "Date":
+            continue
+        try:
+            sessions.append(parse_row(fields))
+        except ValueError as err:
+            problems.append((rows.line_num, str(err)))
+    return sessions, problems
+
+
+def parse_log(lines: Iterable[str]) -> tuple[list[tuple], list[tuple[int, str]]]:
+    """Parses the lines of a `.log` file, see `parse_file()`."""
+    sessions: list[tuple] = []
+    problems: list[tuple[int, str]] = []
+    # The entry being read: its first line number, date, punch in and out times,
+    #    seconds on break and tags
+    entry: list | None = None
+    break_start: int | None = None
+    for number, line in enumerate(lines, start=1):
+        label, _, value = line.strip().partition(":")
+        value = value.strip()
+        try:
+            if not label:
+                continue
+            elif label == "Punch in":
+                if entry:
+                    problems.append((entry[0], "entry was never punched out"))
+                day, clock = value.split(" ")
+                to_epoch(day, clock)
+                entry, break_start = [number, day, clock, "", 0.0, ""], None
+            elif entry is None:
+                raise ValueError(f"'{label}' line outside of an entry")
+            elif label == "Break start":
+                break_start = to_epoch(*value.split(" "))
+            elif label == "Break end":
+                if break_start is None:
+                    raise ValueError("break ended without starting")
+                entry[4] += to_epoch(*value.split(" ")) - break_start
+                break_start = None
+            elif label == "Punch out":
+                entry[3] = value.split(" ")[1]
+            elif label == "Tags":
+                entry[5] = value
+            elif label == "Hours worked":
+                if not entry[3]:
+                    raise ValueError("hours worked before punching out")
+                hours, _, description = value.partition("\t\t")
+                _, day, punch_in, punch_out, on_break, tags = entry
+                sessions.append(
+                    normalize(
+                        day, punch_in, punch_out, hours, description, on_break, tags
+                    )
+                )
+                entry = None
+            else:
+                raise ValueError(f"unknown line '{label}'")
+        except (ValueError, IndexError) as err:
+            problems.append((number, str(err) or "malformed line"))
+            # Drop the rest of a broken entry, rather than misread it
+            entry = None
+    if entry:
+        problems.append((entry[0], "entry was never punched out"))
+    return sessions, problems
+
+
+def parse_file(path: str) -> tuple[list[tuple], list[tuple[int, str]]]:
+    """Parses a `.csv` file, or a `.log` file or gzip'd log segment, into session
+    store records sorted by punch-in. Runs in a worker process, so it only
+    returns plain data.
+
+    :returns `tuple` - the sessions, and the line number and reason of every line
+        that couldn't be read
+    """
+    try:
+        if path.endswith(".gz"):
+            file = gzip.open(path, "rt", newline="")
+        else:
+            file = open(path, "r", newline="")
+        with file:
+            if path.endswith(".csv"):
+                sessions, problems = parse_csv(file)
+            else:
+                sessions, problems = parse_log(file)
+    except (OSError, UnicodeDecodeError) as err:
+        return [], [(0, str(err))]
+    sessions.sort()
+    return sessions, problems
+
+
+def new_sessions(store: "Storage", sessions: Iterable[tuple]) -> Iterator[tuple]:
+    """Drops the sessions, sorted by punch-in, that are the same entry as a record
+    already in the store or as an earlier session, see `identity()`.
+
+    Duplicates punch in within the same minute, so only the records and sessions
+    of one minute are compared at a time.
+    """
+    sessions = iter(sessions)
+    first = next(sessions, None)
+    if first is None:
+        return
+    # Records from the start of the first session's minute on
+    minute_start = datetime.fromtimestamp(first[0] // 60 * 60)
+    start = store.find_range(minute_start, minute_start).start
+    merged = heapq.merge(
+        ((record, True) for record in store.records(start)),
+        ((session, False) for session in chain([first], sessions)),
+        key=lambda item: item[0][0],
+    )
+    for _, minute in groupby(merged, key=lambda item: item[0][0] // 60):
+        minute = list(minute)
+        seen = {identity(session) for session, in_store in minute if in_store}
+        for session, in_store in minute:
+            key = identity(session)
+            if not in_store and key not in seen:
+                seen.add(key)
+                yield session
+
+
+def before_mark(store: "Storage", sessions: list[tuple]) -> int:
+    """Counts the `sessions`, sorted by punch-in, that `Storage.merge()` puts
+    before the upload mark, where they count as uploaded and are never sent to
+    the worksheet.
+    """
+    if not store.uploaded:
+        return 0
+    # Records already in the store come first among equal punch-ins, so only
+    #    sessions punched in before the last uploaded record go before the mark
+    last_uploaded = store.record(store.uploaded - 1)[0]
+    return bisect_left(sessions, last_uploaded, key=lambda session: session[0])
+
+
+def merge_sessions(
+    log: "TimeLog", sessions: Iterable[tuple], backdated: bool = True
+) -> int:
+    """Merges `sessions`, sorted by punch-in, into the session store, leaving out
+    the ones already in it (see `new_sessions()`), then brings the totals, the
+    tag index, the `.csv` file and the status cache up to date.
+
+    Unless `backdated`, sessions that would go in before the upload mark, see
+    `before_mark()`, are refused, and nothing is merged.
+
+    :raises `ValueError` - if punched-in, see `Storage.merge()`, or sessions
+        would go in before the upload mark
+    :returns `int` - the number of sessions added
+    """
+    import status
+    from locking import data_lock
+    from timelog import find_rollup, find_tag_index
+
+    with data_lock(exclusive=True):
+        added = list(new_sessions(log.store, sessions))
+        if not backdated and (backdate := before_mark(log.store, added)):
+            raise ValueError(
+                f"{backdate:,} of the entries punch in before the last uploaded one,"
+                " so they'd count as uploaded and never reach the worksheet."
+                "\n\tAdd --backdated to import them anyway."
+            )
+        # In step with the store before the merge, the totals only need the
+        #    merged sessions added, even ones that went in among the others
+        rollup, tags = find_rollup(), find_tag_index()
+        rollup.sync()
+        tags.sync()
+        log.store.merge(added)
+        rollup.count_merged(added)
+        tags.count_merged(added)
+        if added:
+            log.export_csv()
+        status.save()
+    return len(added)
+
+
+def import_files(
+    log: "TimeLog", paths: list[str], backdated: bool = False
+) -> tuple[int, int, list[str]]:
+    """Imports the entries of the `.csv` and `.log` files at `paths` into the
+    session store, then re-exports the `.csv` file. Unless `backdated`, nothing
+    is imported if any entry would go in before the upload mark, see
+    `merge_sessions()`.
+
+    Parsing runs without holding the data lock; only the merge takes it.
+
+    :raises `ValueError` - if punched-in, see `Storage.merge()`, or entries would
+        go in before the upload mark
+    :returns `tuple` - the number of entries read and of entries added, which
+        leaves out duplicates, and a 'path:line: reason' for every malformed line
+    """
+    with span("parse files"):
+        if len(paths) == 1:
+            results = [parse_file(paths[0])]
+        else:
+            workers = min(len(paths), os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(parse_file, paths))
+
+    malformed: list[str] = []
+    for path, (_, problems) in zip(paths, results):
+        malformed += [f"{path}:{number}: {reason}" for number, reason in problems]
+    read = sum(len(sessions) for sessions, _ in results)
+
+    with span("merge"):
+        added = merge_sessions(
+            log, heapq.merge(*(sessions for sessions, _ in results)), backdated
+        )
+    dprint(f"Merged {added} of {read} entries into {log.store}.")
+
+    return read, added, malformed
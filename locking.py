@@ -0,0 +1,141 @@
+"""Advisory locking and atomic writes for the punch data files.
+
+Every process that reads or writes the data files holds `data_lock()` while it
+does, so a reader never sees half of a punch and two punches never interleave.
+"""
+
+import os
+import sys
+from contextlib import contextmanager
+from typing import Iterator, TextIO
+
+from constants import LOCK_FILE_NAME
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+# The lock is re-entrant within a process: how deep, and in which mode, it is held
+_depth: int = 0
+_exclusive: bool = False
+_lock_file = None
+
+
+def _acquire(exclusive: bool) -> None:
+    global _lock_file
+    from timelog import data_file_path
+
+    _lock_file = open(data_file_path(LOCK_FILE_NAME), "a+")
+    if sys.platform == "win32":
+        # Windows only has exclusive locks; blocks for up to 10 seconds
+        msvcrt.locking(_lock_file.fileno(), msvcrt.LK_LOCK, 1)
+    else:
+        _convert(exclusive)
+
+
+def _convert(exclusive: bool) -> None:
+    # Windows locks are always exclusive, so there is nothing to convert
+    if sys.platform != "win32":
+        fcntl.flock(_lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+
+def _release() -> None:
+    global _lock_file
+    if sys.platform == "win32":
+        _lock_file.seek(0)
+        msvcrt.locking(_lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(_lock_file.fileno(), fcntl.LOCK_UN)
+    _lock_file.close()
+    _lock_file = None
+
+
+@contextmanager
+def data_lock(exclusive: bool = False) -> Iterator[None]:
+    """Holds the advisory lock on the punch data files for the `with` block:
+    shared for reading, `exclusive` for writing.
+
+    Blocks can be nested. An exclusive block inside a shared one upgrades the
+    lock for its duration; the upgrade isn't atomic, so other writers may run
+    in between and the inner block must re-read what it relies on.
+    """
+    global _depth, _exclusive
+
+    upgraded = False
+    if not _depth:
+        _acquire(exclusive)
+        _exclusive = exclusive
+    elif exclusive and not _exclusive:
+        _convert(exclusive=True)
+        _exclusive = upgraded = True
+    _depth += 1
+    try:
+        yield
+    finally:
+        _depth -= 1
+        if not _depth:
+            _release()
+        elif upgraded:
+            _convert(exclusive=False)
+            _exclusive = False
+
+
+@contextmanager
+def atomic_file(
+    path: str, newline: str | None = None, mode: str = "w"
+) -> Iterator[TextIO]:
+    """Opens a temporary file next to `path` for writing, in `mode` ('wb' for
+    bytes), and renames it over `path` at the end of the `with` block, so readers
+    see either all or none of what was written. Nothing is replaced if the block
+    raises.
+    """
+    temp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(temp_path, mode, newline=newline) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def try_lock(path: str) -> TextIO | None:
+    """Takes an exclusive lock on `path` unless another process holds it, without
+    waiting. It's held until the file returned is closed, or the process exits.
+
+    Not `data_lock()`: this one is for keeping a long-running task, e.g. a
+    background upload, to a single process.
+
+    :returns `TextIO | None` - the locked file, or None if the lock is held
+    """
+    file = open(path, "a+")
+    try:
+        if sys.platform == "win32":
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        file.close()
+        return None
+    return file
+
+
+def write_atomic(path: str, text: str) -> None:
+    """Replaces the contents of `path` with `text`, see `atomic_file()`."""
+    with atomic_file(path) as file:
+        file.write(text)
+
+
+def append_atomic(path: str, text: str) -> None:
+    """Appends `text` to `path` with a single write, so it lands all at once."""
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+    try:
+        data = text.encode()
+        written = os.write(fd, data)
+        assert written == len(data), f"Short write to `{path}`."
+    finally:
+        os.close(fd)
@@ -0,0 +1,247 @@
+"""Houses the `LogArchive` class."""
+
+import gzip
+import io
+import json
+import os
+from datetime import date
+from hashlib import blake2b
+from itertools import groupby
+from typing import Iterable, Iterator
+
+from constants import LOG_SEGMENT_MAX_BYTES, dprint
+from locking import atomic_file, write_atomic
+from timestamps import parse_day
+
+
+def entry_date(line: str) -> date | None:
+    """Gets the day of a `Punch in:` line of the `.log` file.
+
+    :returns `date | None` - the day, or None if it's another kind of line
+    """
+    if not line.startswith("Punch in:"):
+        return None
+    return date.fromordinal(parse_day(line[len("Punch in:") :].split()[0]))
+
+
+def month_of(day: date) -> str:
+    """Labels the month `day` falls in, e.g. '2026-02'."""
+    return f"{day.year}-{day.month:02}"
+
+
+class LogArchive:
+    """The `.log` file, split into the active file punches are appended to and
+    gzip'd segments of older entries, one or more per month.
+
+    Entries are rotated out of the active file once it holds entries from a past
+    month or grows past `LOG_SEGMENT_MAX_BYTES`. Segments are never changed once
+    written, and an index maps each day in them to the segment and uncompressed
+    byte offset its entries start at, so a date range is read by seeking straight
+    to it instead of reading the whole history.
+    """
+
+    def __init__(self, log_path: str, index_path: str) -> None:
+        """Loads the index from `index_path`, if there is one."""
+
+        self.log_path: str = log_path
+        self.index_path: str = index_path
+        # Month of the first entry in the active file, if known
+        self.active_month: str | None = None
+        # Oldest first: file name, first and last day, and the offset of each day
+        self.segments: list[dict] = []
+        # Size and hash of the start of the active file a rotation moved into
+        #    segments, until it's dropped from the file
+        self.rotated: dict | None = None
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as file:
+                saved = json.load(file)
+            self.active_month = saved["active_month"]
+            self.segments = saved["segments"]
+            self.rotated = saved.get("rotated")
+
+    def needs_rotation(self, day: date) -> bool:
+        """Whether the active file should be rotated before an entry on `day` is
+        appended to it.
+        """
+        if self.rotated:
+            self._drop_rotated()
+        size = os.path.getsize(self.log_path)
+        if not size:
+            return False
+        if size > LOG_SEGMENT_MAX_BYTES:
+            return True
+        if self.active_month is None:
+            self.active_month = self._first_month()
+        return self.active_month is not None and self.active_month != month_of(day)
+
+    def _first_month(self) -> str | None:
+        with open(self.log_path, "r") as file:
+            for line in file:
+                day = entry_date(line)
+                if day:
+                    return month_of(day)
+        return None
+
+    def note_entry(self, day: date) -> None:
+        """Records that an entry on `day` was appended to the active file."""
+        if self.active_month is None:
+            self.active_month = month_of(day)
+            self.save()
+
+    def rotate(self) -> None:
+        """Moves every entry in the active file into new gzip'd segments, one per
+        month, and empties the active file.
+
+        Only call while punched-out, so no entry is split across segments.
+
+        The index lists the new segments before the active file is emptied, and
+        says how much of it they hold, so if interrupted in between, the entries
+        are neither lost nor read twice, and the next rotation or punch-in drops
+        them from the active file.
+        """
+        if self.rotated:
+            self._drop_rotated()
+        with open(self.log_path, "rb") as log:
+            for month, days in groupby(self._days(log), key=lambda item: item[0]):
+                self._write_segment(month, days)
+            size = log.tell()
+        self.active_month = None
+        self.rotated = {"size": size, "digest": self._digest(size)}
+        self.save()
+        self._drop_rotated()
+
+    def _digest(self, size: int) -> str:
+        # Hash of the first `size` bytes of the active file
+        digest = blake2b(digest_size=16)
+        with open(self.log_path, "rb") as log:
+            while size > 0:
+                block = log.read(min(size, 1 << 20))
+                if not block:
+                    break
+                digest.update(block)
+                size -= len(block)
+        return digest.hexdigest()
+
+    def _holds_rotated(self) -> bool:
+        # Whether the active file still starts with what was rotated out of it
+        return bool(self.rotated) and self.rotated["digest"] == self._digest(
+            self.rotated["size"]
+        )
+
+    def _drop_rotated(self) -> None:
+        # Drops what was rotated out of the active file from its start, unless
+        #    that was done before the index could be saved
+        if self._holds_rotated():
+            with open(self.log_path, "rb") as log:
+                log.seek(self.rotated["size"])
+                rest = log.read()
+            with atomic_file(self.log_path, mode="wb") as file:
+                file.write(rest)
+        self.rotated = None
+        self.save()
+
+    def _days(self, lines: Iterable[bytes]) -> Iterator[tuple[str, date, bytes]]:
+        """Groups the lines by the day of the entry they belong to, dropping
+        anything before the first entry.
+
+        :returns `Iterator[tuple]` - month, day and the lines of each day
+        """
+        day = None
+        chunk: list[bytes] = []
+        for line in lines:
+            if line.startswith(b"Punch in:"):
+                entry_day = entry_date(line.decode())
+                if entry_day != day:
+                    if chunk:
+                        yield month_of(day), day, b"".join(chunk)
+                    day, chunk = entry_day, []
+            if day is not None:
+                chunk.append(line)
+        if chunk:
+            yield month_of(day), day, b"".join(chunk)
+
+    def _write_segment(
+        self, month: str, days: Iterable[tuple[str, date, bytes]]
+    ) -> None:
+        from timelog import data_file_path
+
+        # Named after the segments in the index, so a rotation interrupted before
+        #    saving it is retried under the same names, replacing what it wrote
+        number = 1 + sum(segment["month"] == month for segment in self.segments)
+        name = f"punch-{month}.{number}.log.gz"
+        segment: dict = {"name": name, "month": month, "days": {}}
+        offset = 0
+        with atomic_file(data_file_path(name)) as file, gzip.GzipFile(
+            fileobj=file.buffer, mode="wb", compresslevel=6
+        ) as compressed:
+            for _, day, lines in days:
+                segment["days"].setdefault(day.isoformat(), offset)
+                compressed.write(lines)
+                offset += len(lines)
+        segment["first"], segment["last"] = min(segment["days"]), max(segment["days"])
+        self.segments.append(segment)
+        dprint(f"Rotated {len(segment['days'])} days of the log into {name}.")
+
+    def lines(
+        self, since: date | None = None, until: date | None = None
+    ) -> Iterator[str]:
+        """Streams the lines of the entries punched in from `since` through
+        `until`, which default to the first and last entry, oldest first.
+        """
+        from timelog import data_file_path
+
+        # Open the active file first: entries rotated out of it while the
+        #    segments are read are still in the copy open here
+        with open(self.log_path, "rb") as raw:
+            # Skip what an interrupted rotation left in it, which is in segments
+            if self._holds_rotated():
+                raw.seek(self.rotated["size"])
+            active = io.TextIOWrapper(raw)
+            for segment in list(self.segments):
+                if (since and segment["last"] < since.isoformat()) or (
+                    until and segment["first"] > until.isoformat()
+                ):
+                    continue
+                offset = 0
+                if since:
+                    offset = next(
+                        (
+                            offset
+                            for day, offset in segment["days"].items()
+                            if day >= since.isoformat()
+                        ),
+                        0,
+                    )
+                with gzip.open(data_file_path(segment["name"]), "rb") as compressed:
+                    # Seeking a gzip file decompresses up to the offset without
+                    #    keeping what comes before it
+                    compressed.seek(offset)
+                    yield from self._in_range(
+                        (line.decode() for line in compressed), since, until
+                    )
+            yield from self._in_range(active, since, until)
+
+    def _in_range(
+        self, lines: Iterable[str], since: date | None, until: date | None
+    ) -> Iterator[str]:
+        day = None
+        for line in lines:
+            day = entry_date(line) or day
+            if day is None or (since and day < since):
+                continue
+            if until and day > until:
+                return
+            yield line if line.endswith("\n") else line + "\n"
+
+    def save(self) -> None:
+        """Writes the index to `self.index_path`."""
+        index = {
+            "active_month": self.active_month,
+            "segments": self.segments,
+            "rotated": self.rotated,
+        }
+        write_atomic(self.index_path, json.dumps(index))
+
+    def __repr__(self) -> str:
+        return f"LogArchive(log_path='{self.log_path}', segments={len(self.segments)})"
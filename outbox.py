@@ -0,0 +1,266 @@
+"""Background upload of the entries not uploaded yet, for `punch out --upload`.
+
+The outbox is the backlog `punch upload` sends: the entries of the session store
+past the upload mark, which only moves once the worksheet has acknowledged them,
+so queued entries survive crashes and reboots without a copy of their own.
+Queuing an entry is punching out; `punch out --upload` then starts `punch flush`
+in a process of its own and returns.
+
+The flusher sends whatever has queued up by the time it gets to it in a single
+request, up to `UPLOAD_CHUNK_SIZE` rows, and waits longer and longer between
+attempts while offline. Before each request it saves the hashes of the rows in
+it (see `syncing`): if the flusher dies, or the reply is lost, before the upload
+mark moves past them, the next attempt looks for them among the rows past the
+last ones the worksheet acknowledged, and only resends the ones it doesn't have,
+so no row is dropped or sent twice. Only one
+flusher runs at a time, and `punch upload` and `punch sync` don't run while it
+does.
+"""
+
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from typing import TYPE_CHECKING, Callable, TextIO
+
+from constants import (
+    FLUSH_LOCK_FILE_NAME,
+    OUTBOX_BACKOFF_MAX,
+    OUTBOX_FILE_NAME,
+    OUTBOX_GIVE_UP,
+    UPLOAD_BACKOFF,
+    UPLOAD_CACHE_FILE_NAME,
+    UPLOAD_CHUNK_SIZE,
+    dprint,
+)
+from locking import data_lock, try_lock, write_atomic
+from timelog import TimeLog, data_file_path, find_rollup
+from timing import span
+
+if TYPE_CHECKING:
+    from lib.gspread import Worksheet
+
+
+def worksheet_chosen() -> bool:
+    """Whether `punch upload` was told which worksheet to upload to, found out
+    without going online.
+    """
+    try:
+        with open(data_file_path(UPLOAD_CACHE_FILE_NAME), "r") as file:
+            cache = json.load(file)
+        return "spreadsheet_id" in cache and "worksheet_id" in cache
+    except (OSError, ValueError):
+        return False
+
+
+def claim_uploads() -> TextIO | None:
+    """Takes the lock the flusher runs under, so no flusher starts while it's
+    held; it's released when the file returned is closed, or the process exits.
+
+    :returns `TextIO | None` - the locked file, or None if a flusher is running
+    """
+    return try_lock(data_file_path(FLUSH_LOCK_FILE_NAME))
+
+
+def flusher_running() -> bool:
+    """Whether a flusher, or another upload, is running in any process."""
+    claim = claim_uploads()
+    if claim is None:
+        return True
+    claim.close()
+    return False
+
+
+def start_flusher() -> None:
+    """Starts `punch flush` in a process of its own, which carries on after this
+    one exits.
+    """
+    if getattr(sys, "frozen", False):
+        command = [sys.executable, "flush"]
+    else:
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "punch.py")
+        command = [sys.executable, script, "flush"]
+    if sys.platform == "win32":
+        detach = {
+            "creationflags": subprocess.DETACHED_PROCESS
+            | subprocess.CREATE_NEW_PROCESS_GROUP
+        }
+    else:
+        detach = {"start_new_session": True}
+    subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        **detach,
+    )
+    dprint(f"Started {command}.")
+
+
+class _InFlight:
+    """Hashes of the rows of the request being sent, saved before it's sent and
+    cleared once the upload mark has moved past them, and the number of the row
+    after the last ones the worksheet acknowledged, where they'd be.
+    """
+
+    def __init__(self) -> None:
+        self.path: str = data_file_path(OUTBOX_FILE_NAME)
+        self.digests: list[int] = []
+        self.row: int = 1
+        if os.path.exists(self.path):
+            with open(self.path, "r") as file:
+                saved = json.load(file)
+            self.digests, self.row = saved["in_flight"], saved["row"]
+
+    def save(self, digests: list[int], row: int | None = None) -> None:
+        self.digests = digests
+        self.row = row or self.row
+        write_atomic(self.path, json.dumps({"in_flight": digests, "row": self.row}))
+
+
+def row_after(reply: dict) -> int | None:
+    """Gets the number of the row after the ones an `append_rows()` reply says
+    were written, e.g. 8 for "'Sheet1'!A5:G7".
+
+    :returns `int | None` - the row, or None if the reply doesn't say
+    """
+    try:
+        return int(re.search(r"(\d+)$", reply["updates"]["updatedRange"])[1]) + 1
+    except (TypeError, KeyError):
+        return None
+
+
+def note_worksheet_end(row: int | None) -> None:
+    """Records that the rows of the chosen worksheet end before row number `row`,
+    e.g. once `punch upload` or `punch sync` appended to it, so a flusher looking
+    for a request that went unanswered only reads the rows past it.
+
+    Left alone while a request of the flusher's is in flight, whose rows could
+    come before `row`, or if `row` is None.
+    """
+    in_flight = _InFlight()
+    if row and not in_flight.digests:
+        in_flight.save([], row)
+
+
+def flush(
+    log: TimeLog,
+    open_worksheet: Callable[[], "Worksheet"],
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+    backoff: float = UPLOAD_BACKOFF,
+    max_backoff: float = OUTBOX_BACKOFF_MAX,
+    give_up: float = OUTBOX_GIVE_UP,
+) -> int:
+    """Appends the entries of `log` not uploaded yet to the worksheet
+    `open_worksheet` opens until none are left, including any punched out
+    meanwhile, at most `chunk_size` rows a request.
+
+    After a dropped connection or a rate limit, it tries again after a wait that
+    doubles from `backoff` seconds up to `max_backoff`, less a random part.
+
+    The worksheet only needs the `append_rows()` and `batch_get()` methods of
+    `gspread.Worksheet`.
+
+    :raises `Exception` - what the last attempt raised, if trying again can't
+        help or nothing got through for `give_up` seconds
+    :returns `int` - the number of rows appended
+    """
+    from syncing import hash_cell, record_hash, worksheet_hashes
+    from uploading import retryable
+
+    in_flight = _InFlight()
+    wks = None
+    appended = 0
+    delay = backoff
+    progress = time.monotonic()
+    while True:
+        # Other processes punch out meanwhile: see their writes, and don't
+        #    save the status with totals loaded before them
+        log.store.close()
+        find_rollup.cache_clear()
+        try:
+            if wks is None:
+                with span("open worksheet"):
+                    wks = open_worksheet()
+            with data_lock():
+                mark = log.store.uploaded
+                stop = len(log.store)
+                if stop and not log.store.record(-1)[1]:
+                    stop -= 1
+                stop = min(stop, mark + chunk_size)
+                digests = [
+                    record_hash(record) for record in log.store.records(mark, stop)
+                ]
+                rows = log.rows_in(mark, stop)
+
+            if in_flight.digests:
+                # The last request may have gone through unanswered: skip the
+                #    rows the worksheet has, which can only be the first ones
+                with span("worksheet hashes"):
+                    read = worksheet_hashes(wks, in_flight.row)
+                landed = set(read) & set(in_flight.digests)
+                sent = 0
+                while sent < len(digests) and digests[sent] in landed:
+                    sent += 1
+                dprint(f"{sent} rows of the last request made it to the worksheet.")
+                if sent:
+                    log.mark_uploaded(sent)
+                    log.export_csv()
+                    appended += sent
+                    progress = time.monotonic()
+                in_flight.save([], in_flight.row + len(read))
+                continue
+            if not rows:
+                return appended
+
+            in_flight.save(digests)
+            dprint(f"Appending {len(rows)} rows...")
+            with span("append_rows"):
+                reply = wks.append_rows(
+                    [row + [hash_cell(digest)] for row, digest in zip(rows, digests)],
+                    value_input_option="USER_ENTERED",
+                )
+            log.mark_uploaded(len(rows))
+            in_flight.save([], row_after(reply))
+            log.export_csv()
+            appended += len(rows)
+            delay = backoff
+            progress = time.monotonic()
+        except Exception as err:
+            if not retryable(err) or time.monotonic() - progress > give_up:
+                raise
+            wait = delay * random.uniform(0.5, 1.0)
+            dprint(f"{err!r}; trying again in {wait:.2f} s...")
+            time.sleep(wait)
+            delay = min(delay * 2, max_backoff)
+
+
+def run_flusher(
+    log: TimeLog, open_worksheet: Callable[[], "Worksheet"], **options
+) -> int | None:
+    """Flushes the outbox, see `flush()`, unless a flusher is already running.
+
+    :returns `int | None` - the number of rows appended, or None if another
+        flusher was running
+    """
+    appended = 0
+    while True:
+        claim = claim_uploads()
+        if claim is None:
+            return appended or None
+        try:
+            appended += flush(log, open_worksheet, **options)
+        finally:
+            claim.close()
+        # A punch-out between the last check and the release found this flusher
+        #    running and left its entry to it
+        log.store.close()
+        with data_lock():
+            pending = len(log.store) - log.store.uploaded
+            if pending and not log.store.record(-1)[1]:
+                pending -= 1
+        if not pending:
+            return appended
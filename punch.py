@@ -1,11 +1,19 @@
+import os
 import sys
-from datetime import datetime
+import time
+from collections.abc import Iterable
+from datetime import date, datetime, timedelta
 
-from timelog import TimeLog, LogEntry
-from uploading import Upload
 import constants as c
 from constants import PUNCHED_IN_STATE, PUNCHED_OUT_STATE, dprint, eprint
 
+# Modules are imported where used, so `punch prompt` starts up without them;
+#    `typing` alone takes longer to import than the prompt takes to run
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from lib.gspread import Worksheet
+    from timelog import TimeLog
+
 
 def display_usage() -> None:
     print(
@@ -15,56 +23,347 @@ Usage: punch <command> [options]
 Commands:
   in        Record punch-in time
   out       Record punch-out time
+  break [start|end]
+            Record the start or end of a break while punched-in
   state     Output the current state of the TimeLog
+  prompt    Output a one-line status for shell prompts (alias: status)
   upload    Upload current .csv file to Google Sheets worksheet
+  sync      Append the entries the worksheet is missing, and merge the ones
+            only it has into the TimeLog
+  flush     Upload the entries not uploaded yet, waiting out being offline;
+            what <out --upload> runs in the background
+  import <path> [<path> ...]
+            Merge the entries of other .csv and .log files into the TimeLog
   show csv  Output the contents of the csv file
+  show log  Output the log, through a pager when run in a terminal
+  report    Output the time worked, grouped by day, week, month or description
   email     Display the service email account
+  daemon [start|stop]
+            Keep punch loaded to serve in, out, state and show faster
 
 Coming soon:
-  show log          TODO - Output the contents of either the csv or log file
   edit [csv|log]    TODO - Open a program to manually edit the contents of either file
 
 Options:
   -h, --help                Show this usage menu
   --desc "[description]"    Add or replace existing work description
+  --tag [tag]               Tag the session <in> or <out>, e.g. with a client; tags
+                            are kept apart from the description and not uploaded.
+                            Or <report> only on the sessions with the tag. Can be
+                            given more than once
+  --check                   Verify the <state> totals against the whole history
+  --watch                   Keep <state> on screen, updated every second
+  --format "[template]"     Fields of the <prompt> line, out of {state}, {since},
+                            {elapsed}, {net}, {break}, {today} and {desc}
+                            (default: "{state} {elapsed} {desc}")
+  --upload                  Upload the entry in the background after <out>
+  --refresh                 Choose the spreadsheet to upload to again
+  --all-targets             <upload> to every target in upload_targets.json at once
+  --full                    Read the whole worksheet to <sync>, not just new rows
+  --backdated               <import> entries from before the last uploaded one,
+                            which then count as uploaded
+  --by [day|week|month|desc]
+                            Group <report> totals by (default: day)
+  --since YYYY-MM-DD        Start <report> or <show log> on this day
+  --until YYYY-MM-DD        End <report> or <show log> on this day
+  --direct                  Don't hand the command to a running daemon
   --debug                   Run with debug messages
+  --profile                 Output how long each phase of the command took
+  --trace-json [path]       Write a trace of the phases for chrome://tracing
+                            (default: punch-trace.json)
 """
     )
 
 
-def show_csv(log: TimeLog) -> bool:
+def get_option(name: str) -> str | None:
+    """Gets the value given after option `name` on the command line, if any; an
+    option right after it, e.g. `--direct`, isn't one.
+    """
+    if name in sys.argv and sys.argv.index(name) + 1 < len(sys.argv):
+        value = sys.argv[sys.argv.index(name) + 1]
+        if not value.startswith("-"):
+            return value
+    return None
+
+
+def get_options(name: str) -> list[str]:
+    """Gets every value given after option `name` on the command line, in order."""
+    return [value for option, value in zip(sys.argv, sys.argv[1:]) if option == name]
+
+
+def get_date_option(name: str) -> date | None:
+    """Gets the YYYY-MM-DD date given after option `name`, if any."""
+    value = get_option(name)
+    return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+
+
+def format_hours(hours: float) -> str:
+    """Formats a number of hours as H:MM."""
+    minutes = round(hours * 60)
+    return f"{minutes // 60}:{minutes % 60:02}"
+
+
+def show_totals(log: "TimeLog") -> None:
+    """Outputs the time worked (net of breaks) today and this week, the time on
+    break today and, while punched-in, the time elapsed since punch-in and when to
+    clock out to reach a full work day.
+    """
+
+    now = datetime.now()
+    today = now.date()
+    worked_today = log.rollup.day_total(today)
+    worked_week = log.rollup.week_total(today)
+    epoch_now = int(now.timestamp())
+    midnight = int(datetime.combine(today, datetime.min.time()).timestamp())
+    on_break_today = log.store.break_seconds(midnight, epoch_now, epoch_now) / 3600
+
+    if log.state == PUNCHED_IN_STATE:
+        punch_in: datetime = log.last_entry.punch_in
+        elapsed = (now - punch_in).total_seconds() / (60 * 60)
+        on_break = (
+            log.store.break_seconds(int(punch_in.timestamp()), epoch_now, epoch_now)
+            / 3600
+        )
+        # The open session counts toward the day it was punched in on
+        if punch_in.date() == today:
+            worked_today += elapsed - on_break
+        if punch_in.isocalendar()[:2] == today.isocalendar()[:2]:
+            worked_week += elapsed - on_break
+        print(f"Elapsed since punch-in:\t{format_hours(elapsed)}")
+
+    print(f"Worked today:\t\t{format_hours(worked_today)}")
+    print(f"Worked this week:\t{format_hours(worked_week)}")
+    if on_break_today:
+        print(f"On break today:\t\t{format_hours(on_break_today)}")
+
+    if log.state == PUNCHED_IN_STATE:
+        remaining = c.WORKDAY_HOURS - worked_today
+        if remaining > 0:
+            clock_out = now + timedelta(hours=remaining)
+            print(
+                f"Clock out at {clock_out.strftime('%H:%M')} to reach"
+                f" {c.WORKDAY_HOURS:g} hours today."
+            )
+        else:
+            print(f"Reached {c.WORKDAY_HOURS:g} hours today.")
+    print()
+
+
+def show_csv(log: "TimeLog") -> bool:
     """Outputs uncommitted entries in the csv file.
 
     :returns `bool` - Whether there were any uncommited entries.
     """
 
-    rows = log.get_rows()
-    if rows:
-        print("\nUncommitted timelog entries:")
-        for row in rows:
-            print("\t", end="")
-            for i, item in enumerate(row):
-                print(item, end=", " if i != len(row) - 1 else "\n")
+    # Streamed, so showing a long history doesn't load all of it at once
+    shown = False
+    for row in log.iter_rows():
+        if not shown:
+            print("\nUncommitted timelog entries:")
+            shown = True
+        print("\t", end="")
+        for i, item in enumerate(row):
+            print(item, end=", " if i != len(row) - 1 else "\n")
+    if shown:
         print()
-        return True
     else:
         print("\nNo uncommitted entries in timelog.\n")
-        return False
+    return shown
+
+
+def upload_all_targets(log: "TimeLog") -> None:
+    """Uploads the entries not uploaded yet to every upload target at once,
+    outputs how it went for each, and exits.
+    """
+    from uploading import Upload, load_targets, upload_to_targets
+
+    try:
+        targets = load_targets()
+    except ValueError as err:
+        eprint(err)
+        sys.exit(1)
+    try:
+        upload = Upload()
+        # One connection per target, all over the one authorized session
+        upload.pool_connections(len(targets))
+    except Exception as err:
+        dprint(err)
+        eprint("Please connect to the internet to use the upload function.")
+        sys.exit(1)
+
+    results = upload_to_targets(targets, upload.open_target, log)
+    dprint(f"Made {upload.requests} requests to Google APIs.")
+
+    width = max(len(result.name) for result in results)
+    print("\nUpload targets:")
+    for result in results:
+        print(
+            f"\t{result.name:<{width}}  {result.rows:>7,} rows"
+            f"  {result.requests:>3} requests  {result.seconds:7.2f} s  "
+            + (f"failed: {result.error}" if result.error else "ok")
+        )
+    if any(result.error for result in results):
+        eprint(
+            "Not every target confirmed the upload; the entries stay uncommitted.",
+            "Run <upload --all-targets> again to send each target what it's missing.",
+            sep="\n\t",
+        )
+        sys.exit(1)
+    print(
+        "\nSuccessfully uploaded all uncommitted timelog data to"
+        f" {len(results)} targets.\n"
+    )
+    sys.exit(0)
+
+
+def upload_in_background() -> None:
+    """Starts uploading the entries not uploaded yet in the background, unless
+    that's already going on, see `outbox`.
+    """
+    from outbox import flusher_running, start_flusher, worksheet_chosen
+    from uploading import signer_email
+
+    if not worksheet_chosen():
+        eprint(
+            "No spreadsheet chosen to upload to; the entry stays uncommitted.",
+            "Run <upload> once to choose one.",
+            sep="\n\t",
+        )
+        return
+    # The background upload has no one to tell, so catch what waiting won't fix
+    try:
+        signer_email()
+    except (OSError, ValueError, KeyError) as err:
+        eprint(
+            f"The service account key can't be read: {err}",
+            "The entry stays uncommitted.",
+            sep="\n\t",
+        )
+        return
+    if not flusher_running():
+        start_flusher()
+    print("Uploading in the background.\n")
+
+
+def open_chosen_worksheet() -> "Worksheet":
+    """Opens the worksheet `punch upload` was last told to upload to."""
+    from uploading import Upload
+
+    upload = Upload()
+    upload.get_available_spreadsheets()
+    if upload.wks is None:
+        raise ValueError("The chosen worksheet can't be opened.")
+    return upload.wks
+
+
+def page(lines: Iterable[str]) -> None:
+    """Outputs `lines` through `$PAGER` (`less` by default, `more` on Windows)
+    when writing to a terminal, feeding it as it reads so the lines are never
+    all held at once.
+    """
+
+    if not sys.stdout.isatty():
+        sys.stdout.writelines(lines)
+        return
+    import subprocess
+
+    default = "more" if sys.platform == "win32" else "less"
+    pager = subprocess.Popen(
+        os.environ.get("PAGER") or default, shell=True, stdin=subprocess.PIPE, text=True
+    )
+    try:
+        for line in lines:
+            pager.stdin.write(line)
+    except BrokenPipeError:
+        # The pager was quit before reaching the end
+        pass
+    finally:
+        try:
+            pager.stdin.close()
+        except BrokenPipeError:
+            pass
+        pager.wait()
 
 
 def main() -> None:
     """Main function."""
     if "--debug" in sys.argv:
         c._debug = True
+    # Shell prompts run this constantly, so it only reads the status cache,
+    #    ahead of everything the other commands load
+    if sys.argv[1:2] in (["prompt"], ["status"]):
+        import status
+
+        try:
+            print(status.show(get_option("--format") or c.STATUS_FORMAT))
+        except (KeyError, ValueError, IndexError) as err:
+            eprint(f"Invalid <{sys.argv[1]}> format: {err}")
+            sys.exit(1)
+        sys.exit(0)
+
+    if "--profile" in sys.argv or "--trace-json" in sys.argv:
+        import timing
+
+        trace_path = None
+        if "--trace-json" in sys.argv:
+            trace_path = get_option("--trace-json") or c.TRACE_FILE_NAME
+        timing.enable("--profile" in sys.argv, trace_path)
+
+    # Hand the command to a running `punch daemon`, if there is one; not
+    #    `show log`, whose output is paged here rather than sent back at once,
+    #    `state --watch`, which never finishes, nor a command being profiled,
+    #    whose timings are of this process
+    if (
+        len(sys.argv) > 1
+        and sys.argv[1] in c.DAEMON_COMMANDS
+        and sys.argv[1:3] != ["show", "log"]
+        and "--watch" not in sys.argv
+        and "--direct" not in sys.argv
+        and "--profile" not in sys.argv
+        and "--trace-json" not in sys.argv
+    ):
+        import daemon
+
+        reply = daemon.request(sys.argv[1:])
+        if reply is not None:
+            output, code = reply
+            print(output, end="")
+            sys.exit(code)
     dprint(f"{sys.argv=}")
 
+    from contextlib import nullcontext
+
+    from locking import data_lock
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    # Rotated log segments never change, so paging the log needs no lock; the
+    #    live view of the state locks around each reload, not for hours on end
+    if (
+        command in c.UNLOCKED_COMMANDS
+        or sys.argv[1:3] == ["show", "log"]
+        or sys.argv[1:2] == ["state"]
+        and "--watch" in sys.argv
+    ):
+        lock = nullcontext()
+    else:
+        # Punches check the state and write under one exclusive lock, so two
+        #    punches can't both pass the check; other commands read under a shared one
+        lock = data_lock(exclusive=command in c.WRITE_COMMANDS)
+    with lock:
+        dispatch()
+
+
+def dispatch() -> None:
+    """Runs the command given on the command line."""
+    import timing
+    from timelog import LogEntry, TimeLog, find_log_archive
+
     log = TimeLog()
     entry = LogEntry(log.csv_file_path)
 
     try:
         if "--desc" in sys.argv and sys.argv[sys.argv.index("--desc") + 1]:
-            # Descriptions with commas cause a bug with getting the entries from `.csv` TODO better solution
-            entry.description = sys.argv[sys.argv.index("--desc") + 1].replace(",", ";")
+            entry.description = sys.argv[sys.argv.index("--desc") + 1]
         else:
             entry.read_desc()
 
@@ -82,12 +381,17 @@ def main() -> None:
                 entry.date = entry.punch_in.strftime("%D")
                 # Enter Punch-in time str
                 entry.punch_in_time = entry.punch_in.strftime("%H:%M")
+                # Tags are kept with the description, to be read at punch-out
+                if get_options("--tag"):
+                    from tagindex import parse_tags
+
+                    entry.tags = parse_tags(get_options("--tag"))
                 # Write to log and csv
                 entry.log_punch_in()
                 # Display to user
                 print(f"\nPUNCH IN AT {entry.date} {entry.punch_in_time}\n")
-                # Store the description
-                if entry.description:
+                # Store the description and tags
+                if entry.description or entry.tags:
                     entry.store_desc()
             else:
                 log.display_state()
@@ -101,37 +405,83 @@ def main() -> None:
                 entry.date = log.last_entry.date
                 # Enter Punch-in time str
                 entry.punch_in_time = log.last_entry.punch_in_time
-                # Convert to datetime object and enter
-                entry.punch_in = entry.convert_str_to_datetime(entry.punch_in_time)
+                # Enter Punch-in datetime
+                entry.punch_in = log.last_entry.punch_in
 
                 # Record Punch-out datetime
                 time_out: datetime = datetime.now()
+                # Punching out ends the break, if on one
+                if log.on_break:
+                    entry.log_break_end(time_out)
                 # Enter Punch-out datetime
                 entry.punch_out = time_out
                 # Enter Punch-out time str
                 entry.punch_out_time = entry.punch_out.strftime("%H:%M")
-                # Write to log and next value in csv line
-                entry.log_punch_out()
                 # Display to user
                 print(f"\nPUNCH OUT AT {entry.date} {entry.punch_out_time}")
 
                 # Calculate and enter timedelta
                 entry.get_timedelta()
                 # Calculate and enter time-hours
-                entry.work_hours = entry.work_time.seconds / (60 * 60)
+                entry.work_hours = entry.work_time.total_seconds() / (60 * 60)
                 # Calculate time-minutes
-                work_mins = entry.work_time.seconds / 60
-                # Write to log and rest of line in csv
+                work_mins = entry.work_time.total_seconds() / 60
+                # Keep the tags from punch-in, which aren't read with `--desc`,
+                #    and add any given at punch-out
+                tags = get_options("--tag")
+                if tags or "--desc" in sys.argv:
+                    from tagindex import parse_tags
+
+                    punched_in = LogEntry(log.csv_file_path)
+                    punched_in.read_desc()
+                    entry.tags = parse_tags(punched_in.tags + tags)
+                # Write the punch-out to log and rest of line in csv
                 entry.log_work_time()
                 # Display to user
-                print(f"Time delta: H:{entry.work_hours:.2f} / M:{work_mins:.1f}\n")
+                print(f"Time delta: H:{entry.work_hours:.2f} / M:{work_mins:.1f}")
+                if entry.net_hours != entry.work_hours:
+                    print(f"Net of breaks: H:{entry.net_hours:.2f}")
+                print()
+                if "--upload" in sys.argv:
+                    upload_in_background()
             else:
                 log.display_state()
                 print()
             sys.exit(0)
 
+        elif sys.argv[1] == "break":
+            if log.state != PUNCHED_IN_STATE:
+                log.display_state()
+                sys.exit(0)
+            now = datetime.now()
+            # `start` if left out
+            action = sys.argv[2] if len(sys.argv) > 2 else "start"
+            if action.startswith("--"):
+                action = "start"
+            try:
+                if action == "start":
+                    entry.log_break_start(now)
+                    print(f"\nBREAK START AT {now.strftime('%D %H:%M')}\n")
+                elif action == "end":
+                    entry.log_break_end(now)
+                    print(f"\nBREAK END AT {now.strftime('%D %H:%M')}\n")
+                else:
+                    raise Exception
+            except ValueError as err:
+                eprint(err)
+                sys.exit(1)
+            sys.exit(0)
+
         elif sys.argv[1] == "state":
+            if "--watch" in sys.argv:
+                from watching import watch_state
+
+                watch_state()
+                sys.exit(0)
             log.display_state()
+            if log.on_break:
+                start = datetime.fromtimestamp(log.store.last_break()[0])
+                print(f"On a break since {start.strftime('%H:%M')}.\n")
             if log.state == PUNCHED_IN_STATE:
                 print(
                     "Data from last entry:",
@@ -150,6 +500,16 @@ def main() -> None:
                         sep="\n",
                     )
             print()
+            show_totals(log)
+            if "--check" in sys.argv:
+                from timelog import find_tag_index
+
+                mismatches = log.rollup.check() + find_tag_index().check()
+                for mismatch in mismatches:
+                    eprint(mismatch, end="\n")
+                if mismatches:
+                    sys.exit(1)
+                print("Totals match a full recompute of the history.\n")
             sys.exit(0)
 
         elif sys.argv[1] == "upload":
@@ -164,16 +524,28 @@ def main() -> None:
                 sys.exit(0)
 
             dprint("Checking if timelog has entries...")
-            rows = log.get_rows()
-            if not rows:
+            pending = len(log.store) - log.store.uploaded
+            if not pending:
                 print("\nNothing to upload: no entries in timelog.\n")
                 sys.exit(0)
 
             show_csv(log)
 
+            # Imported here so offline commands never load the upload stack
+            from outbox import claim_uploads
+            from uploading import Upload, signer_email, upload_log
+
+            # Held until exit, so a background upload can't send the same rows
+            if claim_uploads() is None:
+                print("The entries are already being uploaded in the background.\n")
+                sys.exit(0)
+
+            if "--all-targets" in sys.argv:
+                upload_all_targets(log)
+
             dprint("Checking if service account is linked with speadsheet(s)...")
             try:
-                upload = Upload()
+                upload = Upload(refresh="--refresh" in sys.argv)
                 upload.get_available_spreadsheets()
                 if not upload.spreadsheet:
                     eprint(
@@ -181,22 +553,164 @@ def main() -> None:
                         "accessible to Google Service Account.",
                         "To use this feature, please share the spreadsheet\n\t"
                         "with Service Account email:\n\t"
-                        f"{upload.gc.auth.signer_email}\n",
+                        f"{signer_email()}\n",
                         sep="\n\t",
                     )
                     sys.exit(0)
 
                 dprint(f"Appending to {upload.spreadsheet=}")
-                upload.append(rows)
-                log.clear_csv()
+                upload_log(upload.wks, log)
                 dprint("Appended and cleared csv file.")
+                dprint(f"Made {upload.requests} requests to Google APIs.")
                 print("\nSuccessfully uploaded all uncommitted timelog data.\n")
                 sys.exit(0)
             except Exception as err:
                 dprint(err)
+                remaining = len(log.store) - log.store.uploaded
+                if remaining < pending:
+                    print(
+                        f"\nUploaded {pending - remaining} of {pending} rows.",
+                        "Run <upload> again to send the rest.",
+                    )
                 eprint("Please connect to the internet to use the upload function.")
                 sys.exit(1)
 
+        elif sys.argv[1] == "sync":
+            if log.state == PUNCHED_IN_STATE:
+                eprint(
+                    "<sync> command unavailable while punched-in.",
+                    "Punch out before attempting to sync timelog data.",
+                    sep="\n\t",
+                    end="\n",
+                )
+                log.display_state()
+                sys.exit(0)
+
+            # Imported here so offline commands never load the upload stack
+            from outbox import claim_uploads
+            from syncing import sync_log
+            from uploading import Upload, signer_email
+
+            # Held until exit, so a background upload can't send the same rows
+            if claim_uploads() is None:
+                print(
+                    "\nEntries are being uploaded in the background;"
+                    " run <sync> once they are.\n"
+                )
+                sys.exit(0)
+
+            try:
+                upload = Upload(refresh="--refresh" in sys.argv)
+                upload.get_available_spreadsheets()
+                if not upload.spreadsheet:
+                    eprint(
+                        "<sync> command unavailable when no spreadsheets are\n\t"
+                        "accessible to Google Service Account.",
+                        "To use this feature, please share the spreadsheet\n\t"
+                        "with Service Account email:\n\t"
+                        f"{signer_email()}\n",
+                        sep="\n\t",
+                    )
+                    sys.exit(0)
+
+                appended, merged, malformed = sync_log(
+                    upload.wks,
+                    log,
+                    f"{upload.spreadsheet.id}/{upload.wks.id}",
+                    full="--full" in sys.argv,
+                )
+                dprint(f"Made {upload.requests} requests to Google APIs.")
+            except (ValueError, RuntimeError) as err:
+                eprint(err, "Run <sync> again.", sep="\n\t")
+                sys.exit(1)
+            except Exception as err:
+                dprint(err)
+                eprint("Please connect to the internet to use the sync function.")
+                sys.exit(1)
+
+            if malformed:
+                shown = malformed[: c.IMPORT_PROBLEMS_SHOWN]
+                if len(malformed) > len(shown):
+                    shown.append(f"... and {len(malformed) - len(shown)} more")
+                eprint(f"Skipped {len(malformed)} unreadable rows:", *shown, sep="\n\t")
+            print(
+                f"\nAppended {appended:,} entries to the worksheet and merged"
+                f" {merged:,} from it.\n"
+            )
+            sys.exit(0)
+
+        elif sys.argv[1] == "flush":
+            from outbox import run_flusher, worksheet_chosen
+
+            if not worksheet_chosen():
+                eprint(
+                    "No spreadsheet chosen to upload to.",
+                    "Run <upload> once to choose one.",
+                    sep="\n\t",
+                )
+                sys.exit(1)
+            try:
+                appended = run_flusher(log, open_chosen_worksheet)
+            except Exception as err:
+                dprint(repr(err))
+                eprint(
+                    f"Uploading in the background failed: {err}",
+                    "The entries stay uncommitted; run <upload> to send them.",
+                    sep="\n\t",
+                )
+                sys.exit(1)
+            if appended is None:
+                print("\nThe entries are already being uploaded in the background.\n")
+            else:
+                print(f"\nUploaded {appended:,} entries.\n")
+            sys.exit(0)
+
+        elif sys.argv[1] == "import":
+            # Options go after the paths
+            paths: list[str] = []
+            for arg in sys.argv[2:]:
+                if arg.startswith("--"):
+                    break
+                paths.append(arg)
+            if not paths:
+                raise Exception
+            if log.state == PUNCHED_IN_STATE:
+                eprint(
+                    "<import> command unavailable while punched-in.",
+                    "Punch out before attempting to import timelog data.",
+                    sep="\n\t",
+                    end="\n",
+                )
+                log.display_state()
+                sys.exit(0)
+
+            from importing import import_files
+
+            started = time.perf_counter()
+            try:
+                read, added, malformed = import_files(
+                    log, paths, "--backdated" in sys.argv
+                )
+            except ValueError as err:
+                eprint(err)
+                sys.exit(1)
+            seconds = time.perf_counter() - started
+
+            if malformed:
+                shown = malformed[: c.IMPORT_PROBLEMS_SHOWN]
+                if len(malformed) > len(shown):
+                    shown.append(f"... and {len(malformed) - len(shown)} more")
+                eprint(f"Skipped {len(malformed)} malformed lines:", *shown, sep="\n\t")
+            rows = read + len(malformed)
+            print(
+                f"\nImported {added:,} of {read:,} entries from {len(paths)} files;"
+                f" skipped {read - added:,} duplicates.",
+                f"Read {rows:,} rows in {seconds:.2f} s"
+                f" ({rows / max(seconds, 1e-9):,.0f} rows/s).\n",
+                sep="\n",
+            )
+            sys.exit(0)
+
         elif sys.argv[1] == "show":
             if len(sys.argv) <= 2:
                 raise Exception
@@ -207,12 +721,49 @@ def main() -> None:
                     print("<upload> to push rows to google spreadsheet.\n")
                 sys.exit(0)
             elif sys.argv[2] == "log":
-                ...
+                page(
+                    find_log_archive().lines(
+                        get_date_option("--since"), get_date_option("--until")
+                    )
+                )
+                sys.exit(0)
             else:
                 raise Exception
 
+        elif sys.argv[1] == "report":
+            from report import Report
+            from timelog import find_tag_index
+
+            since, until = get_date_option("--since"), get_date_option("--until")
+            with timing.span("report"):
+                # Sessions with tags are looked up in the tag index, not scanned for
+                if get_options("--tag"):
+                    report = find_tag_index().report(get_options("--tag"), since, until)
+                else:
+                    report = Report(log.store, since, until)
+                try:
+                    report.display(get_option("--by") or "day")
+                except ValueError as err:
+                    eprint(err)
+                    sys.exit(1)
+            sys.exit(0)
+
+        elif sys.argv[1] == "daemon":
+            import daemon
+
+            if len(sys.argv) <= 2 or sys.argv[2] == "start":
+                daemon.serve()
+            elif sys.argv[2] == "stop":
+                reply = daemon.request(["daemon", "stop"])
+                print(reply[0] if reply else "\nNo punch daemon is running.\n")
+            else:
+                raise Exception
+            sys.exit(0)
+
         elif sys.argv[1] == "email":
-            print(f"\nService account email:\n{Upload().gc.auth.signer_email}\n")
+            from uploading import signer_email
+
+            print(f"\nService account email:\n{signer_email()}\n")
         else:
             raise Exception
     except Exception as err:
@@ -222,4 +773,9 @@ def main() -> None:
 
 
 if __name__ == "__main__":
+    # `import` parses in worker processes, which frozen builds must bootstrap
+    if getattr(sys, "frozen", False):
+        import multiprocessing
+
+        multiprocessing.freeze_support()
     main()
@@ -0,0 +1,191 @@
+"""Houses the `Report` class."""
+
+import math
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, time, timedelta
+
+from constants import WORKDAY_HOURS
+from storage import Storage
+
+GROUPINGS: tuple[str, ...] = ("day", "week", "month", "desc")
+
+
+def week_label(day: date) -> str:
+    """Labels the ISO week `day` falls in, e.g. '2026-W07'."""
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02}"
+
+
+class Report:
+    """Totals of the time worked over a range of the history, grouped by day, week,
+    month or description.
+
+    Works on the columns of the session store rather than on `LogEntry`s: records
+    are sorted by punch-in, so each day is a contiguous slice of the columns, found
+    by binary search and summed in a single call. Weeks and months are rolled up
+    from the days.
+
+    Hours are net of breaks; each session records its time on break.
+    """
+
+    def __init__(
+        self,
+        store: Storage,
+        since: date | None = None,
+        until: date | None = None,
+        sessions: tuple[array, array] | None = None,
+    ) -> None:
+        """Totals the closed sessions punched in from `since` through `until`,
+        which default to the first and last day in the history.
+
+        Given `sessions`, the punch-in epochs and net hours of closed sessions
+        sorted by punch-in, e.g. those with a tag (see `TagIndex.sessions()`),
+        totals those instead of reading the store; they can't be grouped by
+        description then.
+        """
+
+        self.store: Storage = store
+        stop = len(store)
+        # Leave out the open session, if punched-in
+        if stop and not store.record(-1)[1]:
+            stop -= 1
+
+        self.since: date | None = since
+        self.until: date | None = until
+        # Tags the sessions were picked by, to title the report with
+        self.tags: list[str] = []
+        # Each day with sessions: date, number of sessions, net hours
+        self.days: list[tuple[date, int, float]] = []
+        # Index into `self.days` of each row in the columns below
+        self.row_days: array = array("l")
+        # Hours of each row, breaks included, and seconds on break
+        self.hours: array = array("d")
+        self.on_break: array = array("I")
+        # Positions in the store of the rows, None if given the sessions
+        self.found: range | None = range(0)
+        if sessions is not None:
+            self.found = None
+            punch_ins, self.hours = sessions
+            self.on_break = array("I", bytes(4 * len(punch_ins)))
+            if not punch_ins:
+                return
+            first, last = punch_ins[0], punch_ins[-1]
+        elif not stop:
+            return
+        else:
+            first, last = store.record(0)[0], store.record(stop - 1)[0]
+
+        if self.since is None:
+            self.since = datetime.fromtimestamp(first).date()
+        if self.until is None:
+            self.until = datetime.fromtimestamp(last).date()
+        if self.found is not None:
+            found = store.find_range(
+                datetime.combine(self.since, time()),
+                datetime.combine(self.until + timedelta(days=1), time()),
+            )
+            self.found = found = range(found.start, min(found.stop, stop))
+            punch_ins, _, self.hours = store.columns(found.start, found.stop)
+            self.on_break = store.session_break_seconds(found.start, found.stop)
+
+        day = self.since
+        lo = 0
+        while day <= self.until and lo < len(punch_ins):
+            next_day = day + timedelta(days=1)
+            hi = bisect_left(
+                punch_ins, int(datetime.combine(next_day, time()).timestamp()), lo=lo
+            )
+            if hi > lo:
+                hours = math.fsum(self.hours[lo:hi]) - sum(self.on_break[lo:hi]) / 3600
+                self.row_days.extend(array("l", [len(self.days)]) * (hi - lo))
+                self.days.append((day, hi - lo, hours))
+            lo = hi
+            day = next_day
+
+    def totals(self, by: str = "day") -> list[tuple[str, int, int, float]]:
+        """Totals the sessions per `by`, one of `GROUPINGS`.
+
+        :raises `ValueError` - if `by` isn't one of `GROUPINGS`, or is 'desc' on a
+            report given its sessions
+        :returns `list[tuple]` - label, number of sessions, number of days worked
+            and hours, for each group
+        """
+
+        if by not in GROUPINGS:
+            raise ValueError(
+                f"Reports can't be grouped by '{by}', only by {', '.join(GROUPINGS)}."
+            )
+        if by == "desc" and self.found is None:
+            raise ValueError("Reports on tags can't be grouped by description.")
+        if by == "desc":
+            return self._totals_by_desc()
+
+        groups: dict[str, list] = {}
+        for day, sessions, hours in self.days:
+            if by == "day":
+                label = day.isoformat()
+            elif by == "week":
+                label = week_label(day)
+            else:
+                label = f"{day.year}-{day.month:02}"
+            group = groups.setdefault(label, [label, 0, 0, 0.0])
+            group[1] += sessions
+            group[2] += 1
+            group[3] += hours
+        return [tuple(group) for group in groups.values()]
+
+    def _totals_by_desc(self) -> list[tuple[str, int, int, float]]:
+        descriptions = self.store.descriptions(self.found.start, self.found.stop)
+        groups: dict[str, list] = {}
+        days_worked: dict[str, set] = {}
+        for description, row_day, hours, seconds in zip(
+            descriptions, self.row_days, self.hours, self.on_break
+        ):
+            group = groups.get(description)
+            if group is None:
+                group = groups[description] = [description, 0, 0, 0.0]
+                days_worked[description] = set()
+            group[1] += 1
+            group[3] += hours - seconds / 3600
+            days_worked[description].add(row_day)
+        for description, group in groups.items():
+            group[2] = len(days_worked[description])
+        return sorted(
+            (tuple(group) for group in groups.values()), key=lambda group: -group[3]
+        )
+
+    def display(self, by: str = "day") -> None:
+        """Outputs the totals per `by` with averages and overtime to the screen.
+
+        Overtime is counted against `WORKDAY_HOURS` per day worked.
+
+        :raises `ValueError` - if the report can't be grouped by `by`, see
+            `totals()`
+        """
+
+        totals = self.totals(by)
+        if not self.days:
+            print("\nNo entries to report on.\n")
+            return
+
+        width = max(len("Total"), *(len(label) for label, *_ in totals))
+        tagged = "".join(f" #{tag}" for tag in self.tags)
+        print(f"\nTime worked{tagged} by {by}, {self.since} to {self.until}:\n")
+        print(
+            f"\t{by.capitalize():<{width}}  Sessions  Days     Hours  Avg/day  Overtime"
+        )
+        for label, sessions, days, hours in totals + [
+            (
+                "Total",
+                sum(sessions for _, sessions, _ in self.days),
+                len(self.days),
+                sum(hours for *_, hours in self.days),
+            )
+        ]:
+            overtime = hours - WORKDAY_HOURS * days
+            print(
+                f"\t{label:<{width}}  {sessions:>8}  {days:>4}  {hours:>8.2f}"
+                f"  {hours / days:>7.2f}  {overtime:>+8.2f}"
+            )
+        print()
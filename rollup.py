@@ -0,0 +1,143 @@
+"""Houses the `Rollup` class."""
+
+import json
+import math
+import os
+from datetime import date, datetime
+
+from constants import dprint
+from locking import write_atomic
+from report import Report, week_label
+from storage import Storage
+
+
+class Rollup:
+    """Per-day and per-week totals of the hours worked, kept up to date as sessions
+    are closed, so `punch state` can show totals without scanning the history.
+
+    The totals are a cache of the session store: they remember how many closed
+    sessions they count, catch up on any sessions closed since, and are rebuilt
+    from the store when missing or out of step with it.
+    """
+
+    def __init__(self, path: str, store: Storage) -> None:
+        """Loads the totals from `path` and brings them up to date with `store`."""
+
+        self.path: str = path
+        self.store: Storage = store
+        # Number of closed sessions, from the start of the store, counted
+        self.counted: int = 0
+        # Hours worked, net of breaks, per ISO day and per ISO week
+        self.days: dict[str, float] = {}
+        self.weeks: dict[str, float] = {}
+
+        if os.path.exists(self.path):
+            with open(self.path, "r") as file:
+                saved = json.load(file)
+            self.counted = saved["counted"]
+            self.days = saved["days"]
+            self.weeks = saved["weeks"]
+        self.sync()
+
+    def closed_sessions(self) -> int:
+        """Number of closed sessions in the store; only the last can be open."""
+        closed = len(self.store)
+        if closed and not self.store.record(-1)[1]:
+            closed -= 1
+        return closed
+
+    def sync(self) -> None:
+        """Adds the sessions closed since the totals were saved, or rebuilds the
+        totals if they count sessions the store doesn't have.
+        """
+
+        closed = self.closed_sessions()
+        if self.counted == closed:
+            return
+        if self.counted > closed or not self.counted:
+            self.rebuild()
+            return
+        on_break = self.store.session_break_seconds(self.counted, closed)
+        for (punch_in, _, hours, _), seconds in zip(
+            self.store.records(self.counted, closed), on_break
+        ):
+            self.add(datetime.fromtimestamp(punch_in).date(), hours - seconds / 3600)
+        self.counted = closed
+        self.save()
+
+    def count_merged(self, sessions: list[tuple]) -> None:
+        """Adds closed sessions just merged into the store, wherever they went in,
+        see `Storage.merge()`. The totals must have been in step with the store
+        before the merge.
+        """
+        for session in sessions:
+            on_break = session[4] if len(session) > 4 else 0
+            self.add(
+                datetime.fromtimestamp(session[0]).date(), session[2] - on_break / 3600
+            )
+        self.counted += len(sessions)
+        self.save()
+
+    def add(self, day: date, hours: float) -> None:
+        """Counts `hours` worked, net of breaks, in a session punched in on `day`."""
+        key = day.isoformat()
+        self.days[key] = self.days.get(key, 0.0) + hours
+        key = week_label(day)
+        self.weeks[key] = self.weeks.get(key, 0.0) + hours
+
+    def rebuild(self) -> None:
+        """Recomputes the totals from every closed session in the store."""
+        dprint("Rebuilding the rollup from the session store.")
+        self.days, self.weeks = self.recompute()
+        self.counted = self.closed_sessions()
+        self.save()
+
+    def recompute(self) -> tuple[dict[str, float], dict[str, float]]:
+        """Totals the hours per day and per week over the whole store.
+
+        :returns `tuple[dict, dict]` - hours per ISO day and per ISO week
+        """
+        days: dict[str, float] = {}
+        weeks: dict[str, float] = {}
+        for day, _, hours in Report(self.store).days:
+            days[day.isoformat()] = hours
+            weeks[week_label(day)] = weeks.get(week_label(day), 0.0) + hours
+        return days, weeks
+
+    def check(self) -> list[str]:
+        """Verifies the totals against a full recompute from the store.
+
+        :returns `list[str]` - a description of every total that doesn't match
+        """
+
+        mismatches: list[str] = []
+        closed = self.closed_sessions()
+        if self.counted != closed:
+            mismatches.append(f"Counts {self.counted} sessions, the store has {closed}.")
+        days, weeks = self.recompute()
+        for saved, recomputed in ((self.days, days), (self.weeks, weeks)):
+            for key in sorted(saved.keys() | recomputed.keys()):
+                if not math.isclose(
+                    saved.get(key, 0.0), recomputed.get(key, 0.0), abs_tol=1e-6
+                ):
+                    mismatches.append(
+                        f"{key}: {saved.get(key, 0.0):.6f} hours,"
+                        f" recomputed {recomputed.get(key, 0.0):.6f}"
+                    )
+        return mismatches
+
+    def day_total(self, day: date) -> float:
+        """Hours worked in the sessions punched in on `day`."""
+        return self.days.get(day.isoformat(), 0.0)
+
+    def week_total(self, day: date) -> float:
+        """Hours worked in the sessions punched in during the week of `day`."""
+        return self.weeks.get(week_label(day), 0.0)
+
+    def save(self) -> None:
+        """Writes the totals to `self.path`."""
+        totals = {"counted": self.counted, "days": self.days, "weeks": self.weeks}
+        write_atomic(self.path, json.dumps(totals))
+
+    def __repr__(self) -> str:
+        return f"Rollup(path='{self.path}', counted={self.counted})"
@@ -0,0 +1,325 @@
+"""Houses the `SqliteStore` class."""
+
+import heapq
+import os
+import sqlite3
+from array import array
+from datetime import datetime
+from typing import Iterator
+
+from storage import Storage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    -- Position in punch-in order, from 0
+    id INTEGER PRIMARY KEY,
+    punch_in INTEGER NOT NULL,
+    -- 0 while punched-in
+    punch_out INTEGER NOT NULL,
+    hours REAL NOT NULL,
+    description TEXT NOT NULL,
+    -- Seconds spent on break
+    on_break INTEGER NOT NULL DEFAULT 0,
+    -- Tags joined by spaces, '' if none
+    tags TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS sessions_punch_in ON sessions (punch_in);
+CREATE INDEX IF NOT EXISTS sessions_description ON sessions (description);
+CREATE TABLE IF NOT EXISTS breaks (
+    -- Position in order of start, from 0
+    id INTEGER PRIMARY KEY,
+    started INTEGER NOT NULL,
+    -- 0 while on break
+    ended INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS breaks_started ON breaks (started);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class SqliteStore(Storage):
+    """Store of punch sessions in a SQLite database, for ad-hoc queries over the
+    history, e.g. `sqlite3 punch.db "SELECT description, sum(hours) FROM sessions
+    GROUP BY description"`.
+
+    Each session's id is its position in punch-in order, so positions are
+    primary key lookups, and dates are found through the index on punch-in
+    epochs; descriptions are indexed too, and tags are a column of their own.
+    Breaks are a second table laid out the same way, and the upload mark is kept
+    in `meta`.
+
+    The database is in WAL mode, so readers don't wait on a writer, and many
+    sessions are written in a single transaction.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Opens the database at `path`, creating it if it doesn't exist."""
+
+        self.path: str = path
+        self.paths: list[str] = [path]
+        self._connection: sqlite3.Connection | None = None
+        # Whether the database was just created, i.e. needs migrating into
+        self.created: bool = not os.path.exists(self.path)
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            # Databases created before tags were kept have no column for them
+            columns = self.connection.execute("PRAGMA table_info(sessions)")
+            if "tags" not in [column[1] for column in columns]:
+                self.connection.execute(
+                    "ALTER TABLE sessions ADD COLUMN tags TEXT NOT NULL DEFAULT ''"
+                )
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Connection to the database, opened on first use."""
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            # Durable at checkpoints rather than every commit, which WAL keeps safe
+            self._connection.execute("PRAGMA synchronous = NORMAL")
+        return self._connection
+
+    def _scalar(self, query: str, *args) -> int:
+        return self.connection.execute(query, args).fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._scalar("SELECT coalesce(max(id) + 1, 0) FROM sessions")
+
+    @property
+    def uploaded(self) -> int:
+        """Number of sessions, from the start, that were already uploaded."""
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = 'uploaded'"
+        ).fetchone()
+        return row[0] if row else 0
+
+    @uploaded.setter
+    def uploaded(self, count: int) -> None:
+        with self.connection:
+            self._set_uploaded(count)
+
+    def _set_uploaded(self, count: int) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('uploaded', ?)", (count,)
+        )
+
+    def record(self, index: int) -> tuple[int, int, float, str]:
+        """Gets a single session, see `Storage.record()`."""
+        if index < 0:
+            index += len(self)
+        row = self.connection.execute(
+            "SELECT punch_in, punch_out, hours, description FROM sessions"
+            " WHERE id = ?",
+            (index,),
+        ).fetchone()
+        if row is None:
+            raise IndexError(f"No session at {index}.")
+        return row
+
+    def records(self, start: int = 0, stop: int | None = None) -> Iterator[tuple]:
+        """Yields the sessions in `[start, stop)`, see `record()`."""
+        yield from self._select("punch_in, punch_out, hours, description", start, stop)
+
+    def _select(self, columns: str, start: int, stop: int | None) -> sqlite3.Cursor:
+        if stop is None:
+            stop = len(self)
+        return self.connection.execute(
+            f"SELECT {columns} FROM sessions WHERE id >= ? AND id < ? ORDER BY id",
+            (start, stop),
+        )
+
+    def columns(self, start: int = 0, stop: int | None = None) -> tuple[array, ...]:
+        """Gets the sessions in `[start, stop)` as columns, see
+        `Storage.columns()`.
+        """
+        rows = self._select("punch_in, punch_out, hours", start, stop).fetchall()
+        return (
+            array("q", [row[0] for row in rows]),
+            array("q", [row[1] for row in rows]),
+            array("d", [row[2] for row in rows]),
+        )
+
+    def descriptions(self, start: int = 0, stop: int | None = None) -> list[str]:
+        """Gets the descriptions of the sessions in `[start, stop)`."""
+        return [row[0] for row in self._select("description", start, stop)]
+
+    def tags(self, start: int = 0, stop: int | None = None) -> list[str]:
+        """Gets the tags of the sessions in `[start, stop)`, see `Storage.tags()`."""
+        return [row[0] for row in self._select("tags", start, stop)]
+
+    def session_break_seconds(self, start: int = 0, stop: int | None = None) -> array:
+        """Gets the seconds spent on break in each session in `[start, stop)`, see
+        `Storage.session_break_seconds()`.
+        """
+        return array("I", [row[0] for row in self._select("on_break", start, stop)])
+
+    def _position(self, table: str, column: str, epoch: int, count: int) -> int:
+        # Position of the first row with `column` at or after `epoch`: rows are
+        #    in order of `column`, so it's the first entry of its index from there
+        row = self.connection.execute(
+            f"SELECT id FROM {table} WHERE {column} >= ?"
+            f" ORDER BY {column}, id LIMIT 1",
+            (epoch,),
+        ).fetchone()
+        return row[0] if row else count
+
+    def find_range(self, since: datetime, until: datetime) -> range:
+        """Finds the sessions punched in at or after `since` and before `until`.
+
+        :returns `range` - positions of the matching sessions
+        """
+        count = len(self)
+        start = self._position("sessions", "punch_in", int(since.timestamp()), count)
+        stop = self._position("sessions", "punch_in", int(until.timestamp()), count)
+        return range(start, max(start, stop))
+
+    def extend(self, sessions: list[tuple]) -> None:
+        """Appends many sessions in one transaction, see `Storage.extend()`."""
+        with self.connection:
+            self._insert(len(self), sessions)
+
+    def _insert(self, start: int, sessions: list[tuple]) -> None:
+        self.connection.executemany(
+            "INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    start + i,
+                    punch_in,
+                    punch_out,
+                    hours,
+                    description,
+                    rest[0] if rest else 0,
+                    rest[1] if len(rest) > 1 else "",
+                )
+                for i, (punch_in, punch_out, hours, description, *rest) in (
+                    enumerate(sessions)
+                )
+            ),
+        )
+
+    def close_last(
+        self,
+        punch_out: int,
+        hours: float,
+        description: str,
+        on_break: int = 0,
+        tags: str = "",
+    ) -> None:
+        """Fills in the punch-out of the open session, see `Storage.close_last()`."""
+        with self.connection:
+            self.connection.execute(
+                "UPDATE sessions SET punch_out = ?, hours = ?, description = ?,"
+                " on_break = ?, tags = ? WHERE id = (SELECT max(id) FROM sessions)",
+                (punch_out, hours, description, on_break, tags),
+            )
+
+    def merge(self, sessions: list[tuple]) -> None:
+        """Merges closed sessions in among the others, see `Storage.merge()`.
+
+        Sessions punched in after the last one are simply appended. Otherwise
+        the sessions from the first one's place on are renumbered, in one
+        transaction.
+        """
+        if not sessions:
+            return
+        count = len(self)
+        if count and not self.record(-1)[1]:
+            raise ValueError("Sessions can only be merged in while punched-out.")
+        row = self.connection.execute(
+            "SELECT id FROM sessions WHERE punch_in <= ?"
+            " ORDER BY punch_in DESC, id DESC LIMIT 1",
+            (sessions[0][0],),
+        ).fetchone()
+        split = row[0] + 1 if row else 0
+        if split == count:
+            self.extend(sessions)
+            return
+
+        uploaded = self.uploaded
+        tail = self._select(
+            "punch_in, punch_out, hours, description, on_break, tags", split, count
+        ).fetchall()
+        # Sessions already in the store come first among equal punch-ins
+        merged = heapq.merge(
+            ((session, split + number) for number, session in enumerate(tail, 1)),
+            ((session, None) for session in sessions),
+            key=lambda item: item[0][0],
+        )
+        rows: list[tuple] = []
+        for session, number in merged:
+            rows.append(session)
+            # Right after the last uploaded session
+            if number == uploaded:
+                uploaded = split + len(rows)
+        with self.connection:
+            self.connection.execute("DELETE FROM sessions WHERE id >= ?", (split,))
+            self._insert(split, rows)
+            self._set_uploaded(uploaded)
+
+    def break_count(self) -> int:
+        """Number of breaks."""
+        return self._scalar("SELECT coalesce(max(id) + 1, 0) FROM breaks")
+
+    def last_break(self) -> tuple[int, int] | None:
+        """Gets the latest break, as start and end epochs (end 0 while on break)."""
+        return self.connection.execute(
+            "SELECT started, ended FROM breaks ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+
+    def break_columns(
+        self, start: int = 0, stop: int | None = None
+    ) -> tuple[array, array]:
+        """Gets the breaks in `[start, stop)` as columns, see
+        `Storage.break_columns()`.
+        """
+        if stop is None:
+            stop = self.break_count()
+        rows = self.connection.execute(
+            "SELECT started, ended FROM breaks WHERE id >= ? AND id < ? ORDER BY id",
+            (start, stop),
+        ).fetchall()
+        return (
+            array("q", [row[0] for row in rows]),
+            array("q", [row[1] for row in rows]),
+        )
+
+    def find_breaks(self, since: int, until: int) -> range:
+        """Finds the breaks started at or after epoch `since` and before `until`.
+
+        :returns `range` - positions of the matching breaks
+        """
+        count = self.break_count()
+        start = self._position("breaks", "started", since, count)
+        stop = self._position("breaks", "started", until, count)
+        return range(start, max(start, stop))
+
+    def _end_last_break(self, end: int) -> None:
+        with self.connection:
+            self.connection.execute(
+                "UPDATE breaks SET ended = ? WHERE id = (SELECT max(id) FROM breaks)",
+                (end,),
+            )
+
+    def extend_breaks(self, breaks: list[tuple[int, int]]) -> None:
+        """Appends breaks, as start and end epochs, after every break in the store."""
+        with self.connection:
+            start = self.break_count()
+            self.connection.executemany(
+                "INSERT INTO breaks VALUES (?, ?, ?)",
+                ((start + i, began, ended) for i, (began, ended) in enumerate(breaks)),
+            )
+
+    def version(self) -> tuple:
+        """SQLite's count of the changes other connections committed."""
+        return (self._scalar("PRAGMA data_version"),)
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __repr__(self) -> str:
+        return f"SqliteStore(path='{self.path}', sessions={len(self)})"
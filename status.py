@@ -0,0 +1,228 @@
+"""Status line for shell prompts and status bars, e.g. `punch prompt` in PS1.
+
+Prompts run it hundreds of times an hour, so rather than opening the session
+store it reads a small cache file that every punch rewrites. The cache records
+the modification time and size of each session store file as of when it was
+written; if any of them changed since, e.g. by an import or another backend, the
+cache is rebuilt from the store. Reading the cache only takes the standard
+library's `os` and `time`, which are loaded at startup anyway.
+
+The cache holds one field per line: the store files' versions, the state, the
+punch-in epoch of the last session, the start of the break going on (0 if none),
+the seconds on break earlier in the open session, the day the total is for, the
+hours worked that day in closed sessions, and the last closed session's
+description.
+"""
+
+import os
+import time
+
+import constants as c
+from constants import PUNCHED_IN_STATE, PUNCHED_OUT_STATE
+
+FIELDS: int = 8
+
+
+def _data_path(file_name: str) -> str:
+    # Not `timelog.data_file_path()`, so reading the cache doesn't import `timelog`
+    return os.path.expandvars("%LOCALAPPDATA%\\punch\\" + file_name)
+
+
+def sources() -> list[str]:
+    """Paths of the files the status is read from: the session store's, and the
+    punch-in description's.
+    """
+    if c.STORE_BACKEND == "sqlite":
+        # Commits land in the write-ahead log until it's checkpointed
+        names = [c.STORE_DB_FILE_NAME, c.STORE_DB_FILE_NAME + "-wal"]
+    else:
+        names = [c.STORE_FILE_NAME, c.STORE_DESC_FILE_NAME, c.STORE_BREAKS_FILE_NAME]
+    return [_data_path(name) for name in [*names, c.DESC_FILE_NAME]]
+
+
+def _version() -> str:
+    # Modification time and size of each file of the session store, '-' if missing
+    stats: list[str] = []
+    for path in sources()[:-1]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stats.append("-")
+            continue
+        stats.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+    return " ".join(stats)
+
+
+def load() -> list[str] | None:
+    """Reads the status cache.
+
+    :returns `list[str] | None` - the fields, or None if the cache is missing or
+        older than the session store
+    """
+    try:
+        with open(_data_path(c.STATUS_FILE_NAME), "r") as file:
+            fields = file.read().split("\n", FIELDS - 1)
+    except OSError:
+        return None
+    if len(fields) != FIELDS or fields[0] != _version():
+        return None
+    return fields
+
+
+def save() -> list[str]:
+    """Rebuilds the status cache from the session store. Every command that
+    writes to the store calls it once done.
+
+    :returns `list[str]` - the fields, see `load()`
+    """
+    from datetime import date
+
+    from locking import data_lock, write_atomic
+    from timelog import find_rollup, find_store
+
+    with data_lock():
+        # Taken before reading, so a write landing in between leaves the cache
+        #    stale rather than wrong
+        version = _version()
+        store = find_store()
+        now = int(time.time())
+        state, description = PUNCHED_OUT_STATE, ""
+        punch_in = break_start = on_break = 0
+        if len(store):
+            punch_in, punch_out, _, description = store.record(-1)
+            if not punch_out:
+                state, description = PUNCHED_IN_STATE, ""
+                last = store.last_break()
+                if last and not last[1] and last[0] >= punch_in:
+                    break_start = last[0]
+                on_break = store.break_seconds(punch_in, break_start or now, now)
+        today = date.today()
+        fields = [
+            version,
+            state,
+            f"{punch_in}",
+            f"{break_start}",
+            f"{on_break}",
+            today.isoformat(),
+            f"{find_rollup().day_total(today)}",
+            description,
+        ]
+        write_atomic(_data_path(c.STATUS_FILE_NAME), "\n".join(fields))
+    return fields
+
+
+def _clock(seconds: float) -> str:
+    # H:MM, as `punch state` shows times
+    minutes = round(seconds / 60)
+    return f"{minutes // 60}:{minutes % 60:02}"
+
+
+def _punch_in_description() -> str:
+    # Kept in its own file until punch-out, see `LogEntry.store_desc()`
+    try:
+        with open(_data_path(c.DESC_FILE_NAME), "r") as file:
+            return file.readline().strip()
+    except OSError:
+        return ""
+
+
+class Status:
+    """The status as of the last write to the session store, which the time
+    since is worked out from.
+    """
+
+    __slots__ = (
+        "state",
+        "punch_in",
+        "break_start",
+        "on_break",
+        "day",
+        "worked",
+        "description",
+    )
+
+    def __init__(self, fields: list[str]) -> None:
+        """Parses the fields of the status cache, see `load()`."""
+        _, state, punch_in, break_start, on_break, day, worked, description = fields
+        self.state: str = state
+        # Epochs of the last punch-in and of the start of the break going on
+        self.punch_in: int = int(punch_in)
+        self.break_start: int = int(break_start)
+        # Seconds on break in the open session before the break going on
+        self.on_break: int = int(on_break)
+        # Day `worked` is the seconds worked in closed sessions of, less breaks
+        self.day: str = day
+        self.worked: float = float(worked) * 60 * 60
+        self.description: str = "" if description == "NULL" else description
+        if state == PUNCHED_IN_STATE:
+            description = _punch_in_description()
+            self.description = "" if description == "(No Description)" else description
+
+    def elapsed(self, now: float) -> float:
+        """Seconds since punch-in, 0 while punched-out."""
+        return now - self.punch_in if self.state == PUNCHED_IN_STATE else 0.0
+
+    def net(self, now: float) -> float:
+        """Seconds since punch-in, less the time on break."""
+        on_break = self.on_break + (now - self.break_start if self.break_start else 0)
+        return self.elapsed(now) - on_break if self.state == PUNCHED_IN_STATE else 0.0
+
+    def worked_today(self, now: float) -> float:
+        """Seconds worked on the day of `now`, less breaks."""
+        today = time.strftime("%Y-%m-%d", time.localtime(now))
+        worked = self.worked if self.day == today else 0.0
+        # The open session counts toward the day it was punched in on
+        if (
+            self.state == PUNCHED_IN_STATE
+            and time.strftime("%Y-%m-%d", time.localtime(self.punch_in)) == today
+        ):
+            worked += self.net(now)
+        return worked
+
+    def fields(self, now: float) -> dict[str, str]:
+        """Gets the fields a status line can show, see `show()`."""
+        values = {
+            "state": self.state,
+            "since": "",
+            "elapsed": "",
+            "net": "",
+            "break": "",
+            "today": _clock(self.worked_today(now)),
+            "desc": self.description,
+        }
+        if self.state == PUNCHED_IN_STATE:
+            values.update(
+                since=time.strftime("%H:%M", time.localtime(self.punch_in)),
+                elapsed=_clock(self.elapsed(now)),
+                net=_clock(self.net(now)),
+            )
+            if self.break_start:
+                values["break"] = "on break"
+        return values
+
+
+def current() -> Status:
+    """Gets the status from the cache, rebuilding it if it's stale."""
+    fields = load()
+    if fields is None:
+        from timelog import TimeLog
+
+        # Migrates the history into the store if this is the first run
+        TimeLog()
+        fields = save()
+    return Status(fields)
+
+
+def show(template: str, now: float | None = None) -> str:
+    """Fills in `template`, e.g. '{state} {elapsed} {desc}', with the current
+    status. Fields are `state`, `since` (the punch-in time), `elapsed` (time
+    since punch-in), `net` (the same, less breaks), `break` ('on break' while on
+    one), `today` (time worked today, less breaks) and `desc`; the ones about the
+    open session are blank while punched-out.
+
+    :raises `KeyError` - if `template` has an unknown field
+    :returns `str` - the status line
+    """
+    values = current().fields(time.time() if now is None else now)
+    # Drop the spaces around blank fields
+    return " ".join(part for part in template.format_map(values).split(" ") if part)
@@ -0,0 +1,260 @@
+"""Houses the `Storage` class, the interface of the session store backends."""
+
+from abc import ABC, abstractmethod
+from array import array
+from datetime import datetime
+from typing import Iterator
+
+from constants import ROWS_PER_READ, dprint
+
+
+class Storage(ABC):
+    """History of punch sessions and of the breaks taken in them, which the
+    `.log` and `.csv` files are exports of.
+
+    Sessions are kept in punch-in order and addressed by their position in it,
+    so a date range is a contiguous `range` of positions; breaks likewise, in
+    order of their start. Only the last session can be open, and only the last
+    break, inside it.
+
+    Backends are the binary `SessionStore` and the SQLite `SqliteStore`, picked
+    by `STORE_BACKEND`.
+    """
+
+    # Whether the store was just created, i.e. needs migrating into
+    created: bool
+    # Paths of the files the store is kept in
+    paths: list[str]
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of sessions."""
+
+    @property
+    @abstractmethod
+    def uploaded(self) -> int:
+        """Number of sessions, from the start, that were already uploaded."""
+
+    @uploaded.setter
+    @abstractmethod
+    def uploaded(self, count: int) -> None:
+        pass
+
+    @abstractmethod
+    def record(self, index: int) -> tuple[int, int, float, str]:
+        """Gets a single session.
+
+        :returns `tuple` - punch-in epoch, punch-out epoch (0 while punched-in),
+            hours and description
+        """
+
+    @abstractmethod
+    def records(self, start: int = 0, stop: int | None = None) -> Iterator[tuple]:
+        """Yields the sessions in `[start, stop)`, see `record()`."""
+
+    @abstractmethod
+    def columns(self, start: int = 0, stop: int | None = None) -> tuple[array, ...]:
+        """Gets the sessions in `[start, stop)` as columns, without building a
+        tuple per session.
+
+        :returns `tuple[array, ...]` - punch-in epochs, punch-out epochs and hours
+        """
+
+    @abstractmethod
+    def descriptions(self, start: int = 0, stop: int | None = None) -> list[str]:
+        """Gets the descriptions of the sessions in `[start, stop)`."""
+
+    @abstractmethod
+    def tags(self, start: int = 0, stop: int | None = None) -> list[str]:
+        """Gets the tags of the sessions in `[start, stop)`, each session's joined
+        by spaces, '' if it has none. Tags are kept apart from the description.
+        """
+
+    @abstractmethod
+    def session_break_seconds(self, start: int = 0, stop: int | None = None) -> array:
+        """Gets the seconds spent on break in each session in `[start, stop)`, as a
+        column, see `columns()`. Open sessions count 0 until punched out.
+        """
+
+    @abstractmethod
+    def find_range(self, since: datetime, until: datetime) -> range:
+        """Finds the sessions punched in at or after `since` and before `until`.
+
+        :returns `range` - positions of the matching sessions
+        """
+
+    def append(
+        self,
+        punch_in: int,
+        punch_out: int = 0,
+        hours: float = 0.0,
+        description: str = "",
+    ) -> None:
+        """Appends a session; a `punch_out` of 0 leaves it open."""
+        self.extend([(punch_in, punch_out, hours, description)])
+
+    @abstractmethod
+    def extend(self, sessions: list[tuple]) -> None:
+        """Appends many sessions at once, see `append()`. Each session is a tuple of
+        punch-in epoch, punch-out epoch, hours, description and, optionally,
+        seconds on break and tags, see `tags()`.
+        """
+
+    @abstractmethod
+    def close_last(
+        self,
+        punch_out: int,
+        hours: float,
+        description: str,
+        on_break: int = 0,
+        tags: str = "",
+    ) -> None:
+        """Fills in the punch-out, the seconds spent `on_break` and the `tags`, see
+        `tags()`, of the open session at the end of the store.
+        """
+
+    @abstractmethod
+    def merge(self, sessions: list[tuple]) -> None:
+        """Adds closed sessions, sorted by punch-in, in among the others so they
+        stay in punch-in order, see `extend()`. The upload mark stays after the
+        same sessions, so sessions merged in before it count as uploaded.
+
+        :raises `ValueError` - if the last session is open
+        """
+
+    @abstractmethod
+    def break_count(self) -> int:
+        """Number of breaks."""
+
+    @abstractmethod
+    def last_break(self) -> tuple[int, int] | None:
+        """Gets the latest break, as start and end epochs (end 0 while on break)."""
+
+    @abstractmethod
+    def break_columns(
+        self, start: int = 0, stop: int | None = None
+    ) -> tuple[array, array]:
+        """Gets the breaks in `[start, stop)` as columns, see `columns()`.
+
+        :returns `tuple[array, array]` - start epochs and end epochs
+        """
+
+    @abstractmethod
+    def find_breaks(self, since: int, until: int) -> range:
+        """Finds the breaks started at or after epoch `since` and before `until`.
+
+        :returns `range` - positions of the matching breaks
+        """
+
+    def break_seconds(self, since: int, until: int, now: int) -> int:
+        """Totals the time on break between epochs `since` and `until`, counting
+        a break still going on up to `now`.
+        """
+        found = self.find_breaks(since, until)
+        # A break started before `since` may still run into the range
+        first = max(found.start - 1, 0)
+        starts, ends = self.break_columns(first, found.stop)
+        return sum(
+            max(0, min(end or now, until) - max(start, since))
+            for start, end in zip(starts, ends)
+        )
+
+    def start_break(self, start: int) -> None:
+        """Starts a break in the open session at the end of the store.
+
+        :raises `ValueError` - if there is no open session, a break is already
+            going on, or the break would overlap the session's previous one
+        """
+        if not len(self) or self.record(-1)[1]:
+            raise ValueError("Breaks can only start while punched-in.")
+        last = self.last_break()
+        if last and not last[1]:
+            raise ValueError("Already on a break.")
+        if start < self.record(-1)[0] or (last and start < last[1]):
+            raise ValueError("A break can't start before the punch-in or last break.")
+        self.extend_breaks([(start, 0)])
+
+    def end_break(self, end: int) -> None:
+        """Ends the break going on in the open session.
+
+        :raises `ValueError` - if there is no break going on, or `end` is before
+            its start
+        """
+        last = self.last_break()
+        if not last or last[1]:
+            raise ValueError("Not on a break.")
+        if end < last[0]:
+            raise ValueError("A break can't end before it started.")
+        self._end_last_break(end)
+
+    @abstractmethod
+    def _end_last_break(self, end: int) -> None:
+        pass
+
+    @abstractmethod
+    def extend_breaks(self, breaks: list[tuple[int, int]]) -> None:
+        """Appends breaks, as start and end epochs, after every break in the store."""
+
+    @abstractmethod
+    def version(self) -> tuple:
+        """Identifies the state of the store on disk; it changes whenever another
+        process writes to it.
+        """
+
+    @abstractmethod
+    def close(self) -> None:
+        """Releases the files; the store reopens them when next used."""
+
+
+def migrate(
+    store: Storage,
+    log_sessions: list,
+    csv_sessions: list,
+    breaks: list[tuple[int, int]] | None = None,
+) -> None:
+    """Fills an empty store with the sessions found in existing `.log`/`.csv` files.
+
+    The `.log` file holds the whole history, while the `.csv` file only holds
+    the sessions that are not uploaded yet; those are the last ones in the log.
+
+    Each session is a tuple as taken by `Storage.extend()`. Only the `.log`
+    file records `breaks`, as start and end epochs, and tags.
+    """
+
+    assert not len(store), "Only an empty store can be migrated into."
+    uploaded = log_sessions[: max(len(log_sessions) - len(csv_sessions), 0)]
+    # Only the `.log` file records breaks and tags, so take the time on break and
+    #    tags of the sessions not uploaded yet from the same sessions in the log
+    logged = {session[0]: session[4:] for session in log_sessions[len(uploaded) :]}
+    csv_sessions = [
+        (*session[:4], *logged.get(session[0], ())) for session in csv_sessions
+    ]
+    history = uploaded + csv_sessions
+    store.extend(history)
+    store.uploaded = len(history) - len(csv_sessions)
+    if breaks:
+        store.extend_breaks(breaks)
+    dprint(f"Migrated {len(history)} sessions, {store.uploaded} already uploaded.")
+
+
+def transfer(source: Storage, target: Storage) -> None:
+    """Copies every session and break of `source`, and its upload mark, into the
+    empty `target`, `ROWS_PER_READ` sessions at a time.
+    """
+    assert not len(target), "Only an empty store can be transferred into."
+    count = len(source)
+    for start in range(0, count, ROWS_PER_READ):
+        stop = min(start + ROWS_PER_READ, count)
+        target.extend(
+            [
+                (*record, seconds, tags)
+                for record, seconds, tags in zip(
+                    source.records(start, stop),
+                    source.session_break_seconds(start, stop),
+                    source.tags(start, stop),
+                )
+            ]
+        )
+    target.uploaded = source.uploaded
+    target.extend_breaks(list(zip(*source.break_columns())))
+    dprint(f"Transferred {count} sessions from {source} to {target}.")
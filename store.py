@@ -0,0 +1,433 @@
+"""Houses the `SessionStore` class."""
+
+import heapq
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Iterator
+
+from locking import atomic_file
+from storage import Storage
+
+# magic, format version, record size, number of uploaded records
+HEADER = struct.Struct("<4sHHQ16x")
+# punch-in epoch, punch-out epoch (0 while punched-in), hours,
+#    description offset, description length, seconds on break; the last
+#    field was padding before breaks were tracked, so old records read as 0
+RECORD = struct.Struct("<qqdQII")
+PUNCH_IN = struct.Struct("<q")
+# break start epoch, break end epoch (0 while on break)
+BREAK = struct.Struct("<qq")
+# Ends the description in the description file when the session has tags, which
+#    follow it; descriptions written before tags were kept have none
+TAGS_SEPARATOR = "\x1f"
+
+MAGIC = b"PNCH"
+VERSION = 1
+
+
+class SessionStore(Storage):
+    """Append-only store of punch sessions made of fixed-width binary records.
+
+    Records are appended in punch-in order, and imported ones merged in among
+    them, so the data file doubles as its own date index: lookups by date range
+    are a binary search over the records.
+    Descriptions live in a separate file and records point into it; a session's
+    tags follow its description there, see `TAGS_SEPARATOR`.
+
+    Breaks live in a third file, as pairs of start and end epochs. Every break
+    falls inside a session and they are appended in time order, so the breaks
+    are sorted too, and the breaks in any time range are found by binary search.
+    Each closed session also records its total time on break, so totals over
+    many sessions never need to visit their breaks.
+    """
+
+    def __init__(self, data_path: str, desc_path: str, breaks_path: str) -> None:
+        """Opens the store, creating its files if they don't exist."""
+
+        self.data_path: str = data_path
+        self.desc_path: str = desc_path
+        self.breaks_path: str = breaks_path
+        self.paths: list[str] = [data_path, desc_path, breaks_path]
+        self._map: mmap.mmap | None = None
+        self._desc_map: mmap.mmap | None = None
+        self._breaks_map: mmap.mmap | bytes | None = None
+        # Whether the files were just created, i.e. the store needs migrating into
+        self.created: bool = not os.path.exists(self.data_path)
+
+        if self.created:
+            with open(self.data_path, "wb") as file:
+                file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, 0))
+        if not os.path.exists(self.desc_path):
+            open(self.desc_path, "x").close()
+        if not os.path.exists(self.breaks_path):
+            open(self.breaks_path, "x").close()
+
+        magic, version, record_size, _ = HEADER.unpack_from(self.view)
+        assert (
+            magic == MAGIC and version == VERSION and record_size == RECORD.size
+        ), f"`{self.data_path}` is not a version {VERSION} session store."
+
+    @property
+    def view(self) -> mmap.mmap:
+        """Read-only memory map of the data file, remapped after every write."""
+        if self._map is None:
+            with open(self.data_path, "rb") as file:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    @property
+    def desc_view(self) -> mmap.mmap:
+        """Read-only memory map of the description file."""
+        if self._desc_map is None:
+            with open(self.desc_path, "rb") as file:
+                self._desc_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._desc_map
+
+    @property
+    def breaks_view(self) -> mmap.mmap | bytes:
+        """Read-only memory map of the breaks file."""
+        if self._breaks_map is None:
+            with open(self.breaks_path, "rb") as file:
+                # An empty file can't be mapped
+                if os.fstat(file.fileno()).st_size:
+                    self._breaks_map = mmap.mmap(
+                        file.fileno(), 0, access=mmap.ACCESS_READ
+                    )
+                else:
+                    self._breaks_map = b""
+        return self._breaks_map
+
+    def _unmap(self) -> None:
+        """Drops the memory maps so the files can be written to."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._desc_map is not None:
+            self._desc_map.close()
+            self._desc_map = None
+        if isinstance(self._breaks_map, mmap.mmap):
+            self._breaks_map.close()
+        self._breaks_map = None
+
+    def __len__(self) -> int:
+        return (len(self.view) - HEADER.size) // RECORD.size
+
+    @property
+    def uploaded(self) -> int:
+        """Number of records, from the start, that were already uploaded."""
+        return HEADER.unpack_from(self.view)[3]
+
+    @uploaded.setter
+    def uploaded(self, count: int) -> None:
+        self._unmap()
+        with open(self.data_path, "r+b") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, count))
+
+    def record(self, index: int) -> tuple[int, int, float, str]:
+        """Gets a single record.
+
+        :returns `tuple` - punch-in epoch, punch-out epoch (0 while punched-in),
+            hours and description
+        """
+        if index < 0:
+            index += len(self)
+        punch_in, punch_out, hours, desc_offset, desc_length, _ = RECORD.unpack_from(
+            self.view, HEADER.size + index * RECORD.size
+        )
+        description = self._read_desc(desc_offset, desc_length)
+        return punch_in, punch_out, hours, description.partition(TAGS_SEPARATOR)[0]
+
+    def records(self, start: int = 0, stop: int | None = None) -> Iterator[tuple]:
+        """Yields the records in `[start, stop)`, see `record()`."""
+        if stop is None:
+            stop = len(self)
+        view = self.view
+        read_desc = self._read_desc
+        raw = view[HEADER.size + start * RECORD.size : HEADER.size + stop * RECORD.size]
+        for punch_in, punch_out, hours, offset, length, _ in RECORD.iter_unpack(raw):
+            description = read_desc(offset, length).partition(TAGS_SEPARATOR)[0]
+            yield punch_in, punch_out, hours, description
+
+    def columns(self, start: int = 0, stop: int | None = None) -> tuple[array, ...]:
+        """Gets the records in `[start, stop)` as columns, without building a
+        tuple per record.
+
+        :returns `tuple[array, ...]` - punch-in epochs, punch-out epochs and hours
+        """
+        if stop is None:
+            stop = len(self)
+        raw = self.view[
+            HEADER.size + start * RECORD.size : HEADER.size + stop * RECORD.size
+        ]
+        # The first fields are 8 bytes wide, so each column is a strided slice
+        #    over the record read as 8-byte values
+        fields = RECORD.size // 8
+        words, floats = array("q", raw), array("d", raw)
+        if sys.byteorder == "big":
+            words.byteswap()
+            floats.byteswap()
+        return words[0::fields], words[1::fields], floats[2::fields]
+
+    def _halves(self, raw: bytes) -> array:
+        # The record read as 4-byte values
+        halves = array("I", raw)
+        if sys.byteorder == "big":
+            halves.byteswap()
+        return halves
+
+    def descriptions(self, start: int = 0, stop: int | None = None) -> list[str]:
+        """Gets the descriptions of the records in `[start, stop)`."""
+        return [
+            description.partition(TAGS_SEPARATOR)[0]
+            for description in self._descriptions(start, stop)
+        ]
+
+    def tags(self, start: int = 0, stop: int | None = None) -> list[str]:
+        """Gets the tags of the records in `[start, stop)`, see `Storage.tags()`."""
+        return [
+            description.partition(TAGS_SEPARATOR)[2]
+            for description in self._descriptions(start, stop)
+        ]
+
+    def _descriptions(self, start: int, stop: int | None) -> list[str]:
+        # The descriptions of the records in `[start, stop)`, with their tags
+        if stop is None:
+            stop = len(self)
+        raw = self.view[
+            HEADER.size + start * RECORD.size : HEADER.size + stop * RECORD.size
+        ]
+        words = array("q", raw)
+        if sys.byteorder == "big":
+            words.byteswap()
+        fields = RECORD.size // 8
+        offsets = words[3::fields]
+        lengths = self._halves(raw)[2 * fields - 2 :: 2 * fields]
+        read_desc = self._read_desc
+        return [read_desc(offset, length) for offset, length in zip(offsets, lengths)]
+
+    def _read_desc(self, offset: int, length: int) -> str:
+        # An empty description file can't be mapped, so check the length first
+        if not length:
+            return ""
+        return self.desc_view[offset : offset + length].decode()
+
+    def find_range(self, since: datetime, until: datetime) -> range:
+        """Finds the records punched in at or after `since` and before `until`.
+
+        :returns `range` - indexes of the matching records
+        """
+
+        keys = _Keys(self.view, HEADER.size, RECORD.size, len(self))
+        start = bisect_left(keys, int(since.timestamp()))
+        stop = bisect_left(keys, int(until.timestamp()), lo=start)
+        return range(start, stop)
+
+    def extend(self, sessions: list[tuple]) -> None:
+        """Appends many records at once, see `Storage.extend()`."""
+        self._unmap()
+        records = self._pack(sessions)
+        with open(self.data_path, "ab") as file:
+            file.write(b"".join(records))
+
+    def _pack(self, sessions: list[tuple]) -> list[bytes]:
+        # Appends the descriptions of the sessions and packs their records
+        records: list[bytes] = []
+        descriptions = bytearray()
+        with open(self.desc_path, "ab") as desc_file:
+            desc_offset = desc_file.tell()
+            for punch_in, punch_out, hours, description, *rest in sessions:
+                if len(rest) > 1 and rest[1]:
+                    description += TAGS_SEPARATOR + rest[1]
+                encoded = description.encode()
+                records.append(
+                    RECORD.pack(
+                        punch_in,
+                        punch_out,
+                        hours,
+                        desc_offset,
+                        len(encoded),
+                        rest[0] if rest else 0,
+                    )
+                )
+                descriptions += encoded
+                desc_offset += len(encoded)
+            desc_file.write(descriptions)
+        return records
+
+    def merge(self, sessions: list[tuple]) -> None:
+        """Merges closed sessions in among the records, see `Storage.merge()`.
+
+        Sessions punched in after the last record are simply appended. Otherwise
+        the records from the first session's place on are rewritten and the data
+        file is replaced in one step; descriptions are only ever appended, so a
+        crash midway leaves the old records intact.
+        """
+        if not sessions:
+            return
+        count = len(self)
+        if count and not self.record(-1)[1]:
+            raise ValueError("Sessions can only be merged in while punched-out.")
+        keys = _Keys(self.view, HEADER.size, RECORD.size, count)
+        split = bisect_right(keys, sessions[0][0])
+        if split == count:
+            self.extend(sessions)
+            return
+
+        uploaded = self.uploaded
+        head = self.view[HEADER.size : HEADER.size + split * RECORD.size]
+        tail = self.view[HEADER.size + split * RECORD.size :]
+        self._unmap()
+        added = self._pack(sessions)
+        # Records already in the store come first among equal punch-ins
+        # Punch-in, how many records of the store it's in, and the record itself
+        existing = (
+            (
+                PUNCH_IN.unpack_from(tail, offset)[0],
+                split + number,
+                tail[offset : offset + RECORD.size],
+            )
+            for number, offset in enumerate(range(0, len(tail), RECORD.size), 1)
+        )
+        merged = heapq.merge(
+            existing,
+            ((session[0], None, record) for session, record in zip(sessions, added)),
+            key=lambda item: item[0],
+        )
+        records: list[bytes] = []
+        for _, number, record in merged:
+            records.append(record)
+            # Right after the last uploaded record
+            if number == uploaded:
+                uploaded = split + len(records)
+        with atomic_file(self.data_path, mode="wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, uploaded))
+            file.write(head)
+            file.write(b"".join(records))
+
+    def close_last(
+        self,
+        punch_out: int,
+        hours: float,
+        description: str,
+        on_break: int = 0,
+        tags: str = "",
+    ) -> None:
+        """Fills in the punch-out, the seconds spent `on_break` and the `tags` of
+        the open record at the end of the store.
+        """
+        punch_in, _, _, _ = self.record(-1)
+        self._unmap()
+        if tags:
+            description += TAGS_SEPARATOR + tags
+        desc_offset, desc_length = self._write_desc(description)
+        with open(self.data_path, "r+b") as file:
+            file.seek(-RECORD.size, os.SEEK_END)
+            file.write(
+                RECORD.pack(
+                    punch_in, punch_out, hours, desc_offset, desc_length, on_break
+                )
+            )
+
+    def _write_desc(self, description: str) -> tuple[int, int]:
+        if not description:
+            return 0, 0
+        encoded = description.encode()
+        with open(self.desc_path, "ab") as file:
+            offset = file.tell()
+            file.write(encoded)
+        return offset, len(encoded)
+
+    def break_count(self) -> int:
+        """Number of breaks."""
+        return len(self.breaks_view) // BREAK.size
+
+    def last_break(self) -> tuple[int, int] | None:
+        """Gets the latest break, as start and end epochs (end 0 while on break)."""
+        count = self.break_count()
+        if not count:
+            return None
+        return BREAK.unpack_from(self.breaks_view, (count - 1) * BREAK.size)
+
+    def break_columns(
+        self, start: int = 0, stop: int | None = None
+    ) -> tuple[array, array]:
+        """Gets the breaks in `[start, stop)` as columns, see `columns()`.
+
+        :returns `tuple[array, array]` - start epochs and end epochs
+        """
+        if stop is None:
+            stop = self.break_count()
+        words = array("q", self.breaks_view[start * BREAK.size : stop * BREAK.size])
+        if sys.byteorder == "big":
+            words.byteswap()
+        return words[0::2], words[1::2]
+
+    def find_breaks(self, since: int, until: int) -> range:
+        """Finds the breaks started at or after epoch `since` and before `until`.
+
+        :returns `range` - indexes of the matching breaks
+        """
+        keys = _Keys(self.breaks_view, 0, BREAK.size, self.break_count())
+        start = bisect_left(keys, since)
+        return range(start, bisect_left(keys, until, lo=start))
+
+    def session_break_seconds(self, start: int = 0, stop: int | None = None) -> array:
+        """Gets the seconds spent on break in each session in `[start, stop)`, as a
+        column, see `columns()`. Open sessions count 0 until punched out.
+        """
+        if stop is None:
+            stop = len(self)
+        raw = self.view[
+            HEADER.size + start * RECORD.size : HEADER.size + stop * RECORD.size
+        ]
+        fields = RECORD.size // 4
+        return self._halves(raw)[fields - 1 :: fields]
+
+    def _end_last_break(self, end: int) -> None:
+        start, _ = self.last_break()
+        self._unmap()
+        with open(self.breaks_path, "r+b") as file:
+            file.seek(-BREAK.size, os.SEEK_END)
+            file.write(BREAK.pack(start, end))
+
+    def extend_breaks(self, breaks: list[tuple[int, int]]) -> None:
+        """Appends breaks, as start and end epochs, after every break in the store."""
+        self._unmap()
+        with open(self.breaks_path, "ab") as file:
+            file.write(b"".join(BREAK.pack(start, end) for start, end in breaks))
+
+    def version(self) -> tuple:
+        """The modification times and sizes of the data and breaks files."""
+        stats = [os.stat(path) for path in (self.data_path, self.breaks_path)]
+        return tuple((stat.st_mtime_ns, stat.st_size) for stat in stats)
+
+    def close(self) -> None:
+        self._unmap()
+
+    def __repr__(self) -> str:
+        return f"SessionStore(data_path='{self.data_path}', records={len(self)})"
+
+
+class _Keys:
+    """Sequence view of the first field of fixed-width records, e.g. the punch-in
+    epochs of the sessions or the start epochs of the breaks, for `bisect`.
+    """
+
+    def __init__(self, view, offset: int, record_size: int, length: int) -> None:
+        self.view = view
+        self.offset = offset
+        self.record_size = record_size
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index: int) -> int:
+        offset = self.offset + index * self.record_size
+        return PUNCH_IN.unpack_from(self.view, offset)[0]
+
@@ -0,0 +1,384 @@
+"""Two-way sync of the session store with the worksheet, for `punch sync`.
+
+Every row `punch` appends to the worksheet carries the hash of its entry in
+`SYNC_HASH_COLUMN`, see `entry_hash()`. A sync reads only the dates and hashes of
+the rows the worksheet gained since the last sync, appends the entries it's
+missing and merges the ones only it has into the store. The hashes of both sides
+are cached in the punch folder and brought up to date rather than recomputed, so
+once the first sync is done, the requests made and the rows sent and read scale
+with the differences rather than the history. Rows without a hash, e.g. typed in
+by hand, are read in full once and hashed from their fields.
+"""
+
+from array import array
+from datetime import date, timedelta
+from hashlib import blake2b
+from typing import TYPE_CHECKING, Iterator
+
+import constants as c
+from constants import (
+    ROWS_PER_READ,
+    SYNC_HASH_COLUMN,
+    SYNC_LOCAL_FILE_NAME,
+    SYNC_REMOTE_FILE_NAME,
+    UPLOAD_CHUNK_SIZE,
+    dprint,
+)
+from importing import merge_sessions, parse_row
+from locking import atomic_file, data_lock
+from outbox import note_worksheet_end
+from timelog import TimeLog, data_file_path, find_rollup
+from timing import span
+
+if TYPE_CHECKING:
+    from lib.gspread import Worksheet
+    from storage import Storage
+
+# Most ranges read from the worksheet in a single request
+RANGES_PER_READ: int = 100
+# Day 0 of the serial numbers the worksheet keeps dates as
+SERIAL_EPOCH: date = date(1899, 12, 30)
+
+
+def entry_hash(punch_in: int, punch_out: int, description: str) -> int:
+    """Hashes an entry by what identifies it: its punch times to the minute, which
+    is all the worksheet keeps, and its description.
+
+    :returns `int` - a non-zero 64-bit hash; 0 stands for rows that aren't entries
+    """
+    key = f"{punch_in // 60} {punch_out // 60} {description}".encode()
+    return int.from_bytes(blake2b(key, digest_size=8).digest(), "little") or 1
+
+
+def record_hash(record: tuple) -> int:
+    """Hashes a session store record, see `entry_hash()`; 0 while it's open."""
+    punch_in, punch_out, _, description = record
+    return entry_hash(punch_in, punch_out, description) if punch_out else 0
+
+
+def hash_cell(digest: int) -> str:
+    """Spells a hash for the worksheet; the '#' keeps it from being read as a
+    number.
+    """
+    return f"#{digest:016x}"
+
+
+def _cell_hash(cells: list[str]) -> int | None:
+    # The hash in a row of the hash column, None if it's blank or not a hash
+    if cells and len(cells[0]) == 17 and cells[0].startswith("#"):
+        try:
+            return int(cells[0][1:], 16)
+        except ValueError:
+            return None
+    return None
+
+
+def _runs(indices: list[int]) -> list[range]:
+    # Runs of consecutive indices, in order
+    runs: list[range] = []
+    for index in indices:
+        if runs and runs[-1].stop == index:
+            runs[-1] = range(runs[-1].start, index + 1)
+        else:
+            runs.append(range(index, index + 1))
+    return runs
+
+
+def _positions(digests: array, wanted: set[int]) -> list[int]:
+    # Positions of the `wanted` hashes, in order, one per hash; searched from the
+    #    end, where new entries are, and only until they are all found
+    found: dict[int, int] = {}
+    index = len(digests)
+    while index and len(found) < len(wanted):
+        index -= 1
+        if digests[index] in wanted:
+            found.setdefault(digests[index], index)
+    return sorted(found.values())
+
+
+def _shared_run(local: array, remote: array, offset: int) -> int:
+    # Length of the run of hashes at the start of `local` that `remote` holds
+    #    from `offset` on, in the same order; arrays compare in C, so it's found a
+    #    block of `ROWS_PER_READ` at a time, then by bisecting the first that
+    #    differs, rather than by walking the hashes
+    length = min(len(local), len(remote) - offset)
+    same = 0
+    while same < length:
+        differs = min(same + ROWS_PER_READ, length)
+        if local[same:differs] != remote[offset + same : offset + differs]:
+            break
+        same = differs
+    else:
+        return length
+    while differs - same > 1:
+        middle = (same + differs) // 2
+        if local[same:middle] == remote[offset + same : offset + middle]:
+            same = middle
+        else:
+            differs = middle
+    return same
+
+
+class Hashes:
+    """Hashes of a run of rows, cached in a file under a `key` naming what they
+    are hashes of: the key on the first line, then the hashes.
+    """
+
+    def __init__(self, path: str, key: str) -> None:
+        """Loads the hashes cached at `path`, if they are of `key`."""
+        self.path: str = path
+        self.key: str = key
+        self.digests: array = array("Q")
+        # Number of hashes, from the start, the file holds as they are here
+        self.saved: int = 0
+        try:
+            with open(path, "rb") as file:
+                if file.readline().rstrip(b"\n") == key.encode():
+                    self.digests.frombytes(file.read())
+        except (OSError, ValueError) as err:
+            dprint(f"Rebuilding '{path}': {err}")
+            self.digests = array("Q")
+        self.saved = len(self.digests)
+
+    def save(self, start: int = 0) -> None:
+        """Writes the hashes from position `start` on to the cache file, in place
+        of the ones it has from there on. The file is only rewritten in full, see
+        `atomic_file()`, if it doesn't hold the hashes before `start`; a write cut
+        short leaves it a partial hash long, so it's rebuilt next time.
+        """
+        if 0 < start <= self.saved:
+            with open(self.path, "r+b") as file:
+                file.seek(len(self.key.encode()) + 1 + start * self.digests.itemsize)
+                file.truncate()
+                self.digests[start:].tofile(file)
+        else:
+            with atomic_file(self.path, mode="wb") as file:
+                file.write(self.key.encode() + b"\n")
+                self.digests.tofile(file)
+        self.saved = len(self.digests)
+
+    def __repr__(self) -> str:
+        return f"Hashes(path='{self.path}', key='{self.key}', {len(self.digests)})"
+
+
+def local_hashes(store: "Storage") -> Hashes:
+    """Gets the hash of every session in the store, by position, from the cache
+    brought up to date with the store.
+
+    The store only grows at the end, except when entries are merged in among the
+    others, which shifts every later one; so the cached hashes are kept up to the
+    first that no longer matches its session, found by bisecting, and only the
+    sessions from there on are hashed.
+    """
+    cache = Hashes(data_file_path(SYNC_LOCAL_FILE_NAME), c.STORE_BACKEND)
+    digests = cache.digests
+    with data_lock():
+        count = len(store)
+        valid = min(len(digests), count)
+        if valid and record_hash(store.record(valid - 1)) != digests[valid - 1]:
+            low, high = 0, valid - 1
+            while low < high:
+                middle = (low + high) // 2
+                if record_hash(store.record(middle)) == digests[middle]:
+                    low = middle + 1
+                else:
+                    high = middle
+            valid = low
+        if valid == len(digests) == count:
+            return cache
+        dprint(f"Hashing sessions {valid} to {count}...")
+        del digests[valid:]
+        cache.saved = min(cache.saved, valid)
+        for block in range(valid, count, ROWS_PER_READ):
+            stop = min(block + ROWS_PER_READ, count)
+            punch_ins, punch_outs, _ = store.columns(block, stop)
+            digests.extend(
+                entry_hash(punch_in, punch_out, description) if punch_out else 0
+                for punch_in, punch_out, description in zip(
+                    punch_ins, punch_outs, store.descriptions(block, stop)
+                )
+            )
+    cache.save(valid)
+    return cache
+
+
+def _read_hashes(wks: "Worksheet", row: int) -> tuple[list, list]:
+    # The date and hash columns, from row number `row` on, in one request
+    dates, cells = wks.batch_get(
+        [f"A{row}:A", f"{SYNC_HASH_COLUMN}{row}:{SYNC_HASH_COLUMN}"]
+    )
+    return list(dates), list(cells)
+
+
+def worksheet_hashes(wks: "Worksheet", row: int) -> list[int]:
+    """Reads the hash column of `wks` from row number `row` on, in one request.
+    Rows without a hash hash to 0.
+    """
+    (cells,) = wks.batch_get([f"{SYNC_HASH_COLUMN}{row}:{SYNC_HASH_COLUMN}"])
+    return [_cell_hash(list(row_cells)) or 0 for row_cells in cells]
+
+
+def _csv_fields(cells: list) -> list[str]:
+    # The `.csv` fields of a row read unformatted. Rows are entered as if typed
+    #    in, so the worksheet keeps dates as days since `SERIAL_EPOCH`, times as
+    #    fractions of a day and numbers as numbers, whatever it shows them as
+    fields: list[str] = []
+    for column, cell in enumerate(cells):
+        if isinstance(cell, bool):
+            cell = str(cell).upper()
+        elif isinstance(cell, (int, float)) and column == 0:
+            cell = (SERIAL_EPOCH + timedelta(days=int(cell))).strftime("%m/%d/%y")
+        elif isinstance(cell, (int, float)) and column in (1, 2):
+            minutes = round(cell % 1 * 24 * 60) % (24 * 60)
+            cell = f"{minutes // 60:02}:{minutes % 60:02}"
+        fields.append(str(cell))
+    return fields
+
+
+def _read_rows(wks: "Worksheet", indices: list[int]) -> Iterator[tuple[int, list]]:
+    # The `.csv` fields of the rows at `indices`, in order, a range per run of
+    #    consecutive rows
+    runs = _runs(indices)
+    for batch in range(0, len(runs), RANGES_PER_READ):
+        ranges = runs[batch : batch + RANGES_PER_READ]
+        # Unformatted, as the worksheet's display formats depend on its locale
+        values = wks.batch_get(
+            [f"A{run.start + 1}:F{run.stop}" for run in ranges],
+            value_render_option="UNFORMATTED_VALUE",
+            date_time_render_option="SERIAL_NUMBER",
+        )
+        for run, rows in zip(ranges, values):
+            rows = list(rows)
+            for offset, index in enumerate(run):
+                yield index, _csv_fields(rows[offset]) if offset < len(rows) else []
+
+
+def remote_hashes(wks: "Worksheet", key: str, full: bool = False) -> Hashes:
+    """Gets the hash of every row of the worksheet named `key`, by row, from the
+    cache brought up to date with the worksheet. Rows that aren't entries, e.g. a
+    heading, hash to 0.
+
+    Rows are only ever appended to the worksheet, so it's read from the last
+    cached row on. If that row no longer holds what was cached for it, the
+    worksheet was edited and is read again from the top; `full` always is.
+    """
+    cache = Hashes(data_file_path(SYNC_REMOTE_FILE_NAME), key)
+    digests = cache.digests
+    if full:
+        del digests[:]
+    if digests:
+        dates, cells = _read_hashes(wks, len(digests))
+        cell = _cell_hash(cells[0] if cells else [])
+        if not (dates and dates[0]) or cell not in (None, digests[-1]):
+            dprint("The worksheet was edited since the last sync, reading it all.")
+            del digests[:]
+        else:
+            dates, cells = dates[1:], cells[1:]
+    if not digests:
+        dates, cells = _read_hashes(wks, 1)
+
+    start = len(digests)
+    unhashed: list[int] = []
+    for offset in range(max(len(dates), len(cells))):
+        digest = _cell_hash(cells[offset] if offset < len(cells) else [])
+        if digest is None:
+            unhashed.append(len(digests))
+        digests.append(digest or 0)
+    dprint(f"Read {max(len(dates), len(cells))} new rows, {len(unhashed)} unhashed.")
+    for index, fields in _read_rows(wks, unhashed):
+        try:
+            digests[index] = record_hash(parse_row(fields)[:4])
+        except ValueError:
+            pass
+    cache.save(start)
+    return cache
+
+
+def sync_log(
+    wks: "Worksheet",
+    log: TimeLog,
+    key: str,
+    full: bool = False,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> tuple[int, int, list[str]]:
+    """Makes the worksheet named `key` and the session store hold the same
+    entries: appends the ones the worksheet is missing, in chunks of at most
+    `chunk_size` rows, and merges the ones only it has into the store. Every entry
+    then counts as uploaded, so the `.csv` file is left empty.
+
+    Each chunk is recorded in the cache of the worksheet's hashes as soon as it's
+    acknowledged, and a chunk that was appended but not acknowledged is found in
+    the worksheet next time, so running it again never sends a row twice.
+
+    `wks` only needs the `append_rows()` and `batch_get()` methods of
+    `gspread.Worksheet`.
+
+    :raises `ValueError` - if punched-in, see `Storage.merge()`
+    :raises `RuntimeError` - if the history is changed while syncing
+    :returns `tuple` - the number of rows appended and of entries merged in, and
+        a 'row N: reason' for every worksheet row that couldn't be read
+    """
+    with span("remote hashes"):
+        remote = remote_hashes(wks, key, full)
+    with span("local hashes"):
+        local = local_hashes(log.store)
+    # Entries are uploaded in the store's order, so past its heading the
+    #    worksheet mostly holds the same hashes in the same order; only what
+    #    follows that shared run needs comparing
+    offset = 0
+    while offset < len(remote.digests) and not remote.digests[offset]:
+        offset += 1
+    shared = _shared_run(local.digests, remote.digests, offset)
+    dprint(f"{shared} entries are in the same order on both sides.")
+    in_local = set(local.digests[shared:])
+    in_remote = set(remote.digests[offset + shared :])
+    in_local.discard(0)
+    in_remote.discard(0)
+
+    positions = _positions(local.digests, in_local - in_remote)
+    appended = 0
+    for chunk in range(0, len(positions), chunk_size):
+        indices = positions[chunk : chunk + chunk_size]
+        with data_lock():
+            if any(
+                record_hash(log.store.record(index)) != local.digests[index]
+                for index in indices
+            ):
+                raise RuntimeError("The history changed during the sync.")
+            rows = [
+                row
+                for run in _runs(indices)
+                for row in log.rows_in(run.start, run.stop)
+            ]
+        digests = [local.digests[index] for index in indices]
+        dprint(f"Appending {len(rows)} rows...")
+        with span("append_rows"):
+            wks.append_rows(
+                [row + [hash_cell(digest)] for row, digest in zip(rows, digests)],
+                value_input_option="USER_ENTERED",
+            )
+        remote.digests.extend(digests)
+        remote.save(len(remote.digests) - len(digests))
+        appended += len(rows)
+    # The hashes are of every row of the worksheet, from the first
+    note_worksheet_end(len(remote.digests) + 1)
+
+    sessions: list[tuple] = []
+    malformed: list[str] = []
+    with span("read rows"):
+        wanted = _positions(remote.digests, in_remote - in_local)
+        for index, fields in _read_rows(wks, wanted):
+            try:
+                sessions.append(parse_row(fields))
+            except ValueError as err:
+                malformed.append(f"row {index + 1}: {err}")
+    merged = 0
+    if sessions:
+        with span("merge"):
+            merged = merge_sessions(log, sorted(sessions))
+
+    with data_lock(exclusive=True):
+        closed = find_rollup().closed_sessions()
+        log.mark_uploaded(max(closed - log.store.uploaded, 0))
+        log.export_csv()
+    return appended, merged, malformed
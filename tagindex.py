@@ -0,0 +1,395 @@
+"""Houses the `TagIndex` class."""
+
+import json
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, time, timedelta
+from hashlib import blake2b
+from typing import Iterable
+
+from constants import ROWS_PER_READ, TAG_INDEX_TAIL_MAX, dprint
+from locking import atomic_file, write_atomic
+from report import Report
+from storage import Storage
+
+# A tag is a letter, then any letters, digits, '_', '.' or '-', e.g. 'acme'
+TAG = re.compile(r"[^\W\d_][\w.-]*")
+# magic, format version, generation of the directory the postings belong to
+HEADER = struct.Struct("<4sHQ")
+# punch-in epoch, hours worked net of breaks, key of the session
+POSTING = struct.Struct("<qdq")
+
+MAGIC = b"PTAG"
+VERSION = 3
+
+
+def parse_tags(tags: Iterable[str]) -> list[str]:
+    """Spells `tags` as the session store keeps them: lowercased, without a
+    leading '#', each once, in order.
+
+    :raises `ValueError` - if a tag isn't a letter followed by letters, digits,
+        '_', '.' or '-'
+    """
+    parsed: dict[str, None] = {}
+    for tag in tags:
+        tag = tag.removeprefix("#").lower()
+        if not TAG.fullmatch(tag):
+            raise ValueError(
+                f"Invalid tag '{tag}': tags are a letter followed by letters,"
+                " digits, '_', '.' or '-'."
+            )
+        parsed[tag] = None
+    return list(parsed)
+
+
+def session_key(description: str, tags: str) -> int:
+    """Hashes the description and tags of a session to a signed 64-bit key.
+    Sessions punched in at the same time are told apart by their key; ones it
+    doesn't tell apart have the same tags.
+    """
+    digest = blake2b(f"{description}\n{tags}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def _words(epochs: array, hours: array, keys: array) -> array:
+    # Postings as the 8-byte words of the file, epochs, hours and keys interleaved
+    words = array("q", bytes(POSTING.size * len(epochs)))
+    words[0::3] = epochs
+    words[1::3] = array("q", hours.tobytes())
+    words[2::3] = keys
+    if sys.byteorder == "big":
+        words.byteswap()
+    return words
+
+
+def _columns(raw: bytes) -> tuple[array, array, array]:
+    # Postings read from the file, as epochs, hours and keys
+    words, floats = array("q", raw), array("d", raw)
+    if sys.byteorder == "big":
+        words.byteswap()
+        floats.byteswap()
+    return words[0::3], floats[1::3], words[2::3]
+
+
+def _empty() -> tuple[array, array, array]:
+    # No postings, as epochs, hours and keys
+    return array("q"), array("d"), array("q")
+
+
+class TagIndex:
+    """Inverted index from each tag to the sessions tagged with it, kept up to date
+    as sessions are closed, so a report on a tag never scans the history.
+
+    Sessions are identified by their punch-in epoch and their key, see
+    `session_key()`, which stay the same when imported sessions are merged in
+    among them, and each posting also holds the session's net hours, so totals
+    don't visit the store at all. Tags are read from the store's own field for
+    them, see `Storage.tags()`, never from descriptions. Postings live in
+    a binary file, grouped by tag and sorted by punch-in within each group, and a
+    JSON directory maps each tag to its group. Postings of sessions closed since
+    are kept in a tail in the directory and folded into the groups once there are
+    more than `TAG_INDEX_TAIL_MAX`, so a punch-out only rewrites the directory.
+
+    Like the rollup, the index is a cache of the session store: it catches up on
+    the sessions closed since it was saved and is rebuilt from the store when
+    missing or out of step with it.
+    """
+
+    def __init__(self, path: str, postings_path: str, store: Storage) -> None:
+        """Loads the directory from `path` and brings the index up to date with
+        `store`.
+        """
+
+        self.path: str = path
+        self.postings_path: str = postings_path
+        self.store: Storage = store
+        # Number of closed sessions, from the start of the store, indexed
+        self.counted: int = 0
+        # Bumped whenever the postings file is rewritten, and saved in both files,
+        #    so a directory left behind by an interrupted write is noticed
+        self.generation: int = 0
+        # Position in the postings file of each tag's group and its length
+        self.groups: dict[str, list[int]] = {}
+        # Tag, punch-in epoch, net hours and session key of postings not in the
+        #    groups yet
+        self.tail: list[tuple] = []
+
+        if os.path.exists(self.path):
+            with open(self.path, "r") as file:
+                saved = json.load(file)
+            self.counted = saved["counted"]
+            self.generation = saved["generation"]
+            self.groups = saved["groups"]
+            self.tail = saved["tail"]
+            if self._postings_generation() != self.generation:
+                dprint("The tag index postings don't match their directory.")
+                self.counted, self.groups, self.tail = 0, {}, []
+        self.sync()
+
+    def _postings_generation(self) -> int | None:
+        # Generation of the postings file, None if it's missing or not one
+        try:
+            with open(self.postings_path, "rb") as file:
+                header = file.read(HEADER.size)
+        except FileNotFoundError:
+            return None
+        if len(header) < HEADER.size:
+            return None
+        magic, version, generation = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            return None
+        return generation
+
+    def closed_sessions(self) -> int:
+        """Number of closed sessions in the store; only the last can be open."""
+        closed = len(self.store)
+        if closed and not self.store.record(-1)[1]:
+            closed -= 1
+        return closed
+
+    def sync(self) -> None:
+        """Indexes the sessions closed since the index was saved, or rebuilds it if
+        it counts sessions the store doesn't have.
+        """
+
+        closed = self.closed_sessions()
+        if self.counted == closed:
+            return
+        if self.counted > closed or not self.counted:
+            self.rebuild()
+            return
+        for tag, columns in self._gather(self.counted, closed).items():
+            self.tail.extend((tag, *posting) for posting in zip(*columns))
+        self.counted = closed
+        self.save()
+
+    def count_merged(self, sessions: list[tuple]) -> None:
+        """Indexes closed sessions just merged into the store, wherever they went
+        in, see `Storage.merge()`. The index must have been in step with the store
+        before the merge.
+        """
+        for session in sessions:
+            tags = session[5] if len(session) > 5 else ""
+            if not tags:
+                continue
+            net = session[2] - session[4] / 3600
+            key = session_key(session[3], tags)
+            self.tail.extend((tag, session[0], net, key) for tag in tags.split())
+        self.counted += len(sessions)
+        self.save()
+
+    def _gather(self, start: int, stop: int) -> dict[str, tuple[array, ...]]:
+        # Postings of the closed sessions in `[start, stop)`: punch-in epochs,
+        #    sorted, net hours and session keys, per tag, `ROWS_PER_READ`
+        #    sessions at a time
+        postings: dict[str, tuple[array, ...]] = {}
+        # Descriptions and tags repeat a lot, so each pair is only hashed once,
+        #    into its key and the groups of its tags; bounded, in case every
+        #    description is different
+        parsed: dict[tuple[str, str], tuple[int, list[tuple[array, ...]]]] = {}
+        for block in range(start, stop, ROWS_PER_READ):
+            end = min(block + ROWS_PER_READ, stop)
+            block_tags = self.store.tags(block, end)
+            # Blocks without tagged sessions need nothing else read
+            if not any(block_tags):
+                continue
+            descriptions = self.store.descriptions(block, end)
+            punch_ins, _, hours = self.store.columns(block, end)
+            on_break = self.store.session_break_seconds(block, end)
+            if len(parsed) > 64 * ROWS_PER_READ:
+                parsed.clear()
+            for row, tags in enumerate(block_tags):
+                if not tags:
+                    continue
+                found = parsed.get((descriptions[row], tags))
+                if found is None:
+                    found = parsed[descriptions[row], tags] = (
+                        session_key(descriptions[row], tags),
+                        [postings.setdefault(tag, _empty()) for tag in tags.split()],
+                    )
+                key, groups = found
+                net = hours[row] - on_break[row] / 3600
+                for epochs, nets, keys in groups:
+                    epochs.append(punch_ins[row])
+                    nets.append(net)
+                    keys.append(key)
+        return postings
+
+    def rebuild(self) -> None:
+        """Rebuilds the index from every closed session in the store."""
+        dprint("Rebuilding the tag index from the session store.")
+        self.counted = self.closed_sessions()
+        self.tail = []
+        self._write(self._gather(0, self.counted))
+        self.save()
+
+    def recompute(self) -> dict[str, tuple[array, ...]]:
+        """Gathers the postings of every tag over the whole store.
+
+        :returns `dict` - punch-in epochs, sorted, net hours and session keys, per
+            tag
+        """
+        return self._gather(0, self.closed_sessions())
+
+    def compact(self) -> None:
+        """Folds the tail into the groups, rewriting the postings file."""
+
+        postings = {tag: self._group(tag) for tag in self.groups}
+        added: dict[str, list] = {}
+        for tag, *posting in self.tail:
+            added.setdefault(tag, []).append(posting)
+        for tag, tail in added.items():
+            epochs, hours, keys = postings.get(tag, _empty())
+            # Merged sessions can go in among the others, so sort unless the tail
+            #    only comes after the group, in order
+            in_order = all(a[0] <= b[0] for a, b in zip(tail, tail[1:]))
+            if not in_order or (epochs and tail[0][0] < epochs[-1]):
+                tail = sorted(
+                    [*zip(epochs, hours, keys), *tail], key=lambda item: item[0]
+                )
+                epochs, hours, keys = _empty()
+            epochs.extend(epoch for epoch, _, _ in tail)
+            hours.extend(net for _, net, _ in tail)
+            keys.extend(key for _, _, key in tail)
+            postings[tag] = epochs, hours, keys
+        self._write(postings)
+        self.tail = []
+
+    def _write(self, postings: dict[str, tuple[array, ...]]) -> None:
+        # Replaces the postings file with `postings`, grouped by tag
+        self.generation += 1
+        self.groups = {}
+        position = 0
+        with atomic_file(self.postings_path, mode="wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, self.generation))
+            for tag in sorted(postings):
+                epochs, hours, keys = postings[tag]
+                file.write(_words(epochs, hours, keys).tobytes())
+                self.groups[tag] = [position, len(epochs)]
+                position += len(epochs)
+        dprint(f"Wrote {position} postings of {len(self.groups)} tags.")
+
+    def _group(self, tag: str) -> tuple[array, array, array]:
+        # Epochs, hours and keys of the postings in the group of `tag`
+        if tag not in self.groups:
+            return _empty()
+        position, count = self.groups[tag]
+        with open(self.postings_path, "rb") as file:
+            file.seek(HEADER.size + position * POSTING.size)
+            return _columns(file.read(count * POSTING.size))
+
+    def sessions(
+        self, tag: str, since: date | None = None, until: date | None = None
+    ) -> tuple[array, array, array]:
+        """Gets the sessions tagged with `tag` punched in from `since` through
+        `until`, each defaulting to no limit.
+
+        :returns `tuple[array, array, array]` - punch-in epochs, sorted, net
+            hours and session keys
+        """
+
+        tag = tag.removeprefix("#").lower()
+        epochs, hours, keys = self._group(tag)
+        low = int(datetime.combine(since, time()).timestamp()) if since else None
+        high = (
+            int(datetime.combine(until + timedelta(days=1), time()).timestamp())
+            if until
+            else None
+        )
+        start = bisect_left(epochs, low) if low is not None else 0
+        stop = bisect_left(epochs, high) if high is not None else len(epochs)
+        epochs, hours, keys = epochs[start:stop], hours[start:stop], keys[start:stop]
+
+        tail = [
+            (epoch, net, key)
+            for name, epoch, net, key in self.tail
+            if name == tag
+            and (low is None or epoch >= low)
+            and (high is None or epoch < high)
+        ]
+        if tail:
+            merged = sorted(
+                [*zip(epochs, hours, keys), *tail], key=lambda item: item[0]
+            )
+            epochs = array("q", [epoch for epoch, _, _ in merged])
+            hours = array("d", [net for _, net, _ in merged])
+            keys = array("q", [key for _, _, key in merged])
+        return epochs, hours, keys
+
+    def report(
+        self, tags: list[str], since: date | None = None, until: date | None = None
+    ) -> Report:
+        """Totals the sessions tagged with every one of `tags` punched in from
+        `since` through `until`, see `Report`.
+        """
+
+        epochs, hours, keys = self.sessions(tags[0], since, until)
+        for tag in tags[1:]:
+            # Sessions punched in at the same time are told apart by their key
+            others, _, other_keys = self.sessions(tag, since, until)
+            tagged = set(zip(others, other_keys))
+            kept = [
+                row
+                for row, session in enumerate(zip(epochs, keys))
+                if session in tagged
+            ]
+            epochs = array("q", [epochs[row] for row in kept])
+            hours = array("d", [hours[row] for row in kept])
+            keys = array("q", [keys[row] for row in kept])
+        report = Report(self.store, since, until, sessions=(epochs, hours))
+        report.tags = [tag.removeprefix("#").lower() for tag in tags]
+        return report
+
+    def check(self) -> list[str]:
+        """Verifies the index against a full recompute from the store.
+
+        :returns `list[str]` - a description of every tag that doesn't match
+        """
+
+        mismatches: list[str] = []
+        closed = self.closed_sessions()
+        if self.counted != closed:
+            mismatches.append(
+                f"The tag index counts {self.counted} sessions, the store has {closed}."
+            )
+        recomputed = self.recompute()
+        tags = self.groups.keys() | {post[0] for post in self.tail} | recomputed.keys()
+        for tag in sorted(tags):
+            indexed = sorted(
+                (epoch, round(net, 6), key)
+                for epoch, net, key in zip(*self.sessions(tag))
+            )
+            expected = sorted(
+                (epoch, round(net, 6), key)
+                for epoch, net, key in zip(*recomputed.get(tag, _empty()))
+            )
+            if indexed != expected:
+                mismatches.append(
+                    f"#{tag}: {len(indexed)} sessions indexed,"
+                    f" recomputed {len(expected)}"
+                )
+        return mismatches
+
+    def save(self) -> None:
+        """Writes the directory to `self.path`, folding the tail into the groups
+        first if it's grown past `TAG_INDEX_TAIL_MAX`.
+        """
+        if len(self.tail) > TAG_INDEX_TAIL_MAX:
+            self.compact()
+        directory = {
+            "counted": self.counted,
+            "generation": self.generation,
+            "groups": self.groups,
+            "tail": self.tail,
+        }
+        write_atomic(self.path, json.dumps(directory))
+
+    def __repr__(self) -> str:
+        return (
+            f"TagIndex(path='{self.path}', counted={self.counted},"
+            f" tags={len(self.groups)}, tail={len(self.tail)})"
+        )
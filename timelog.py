@@ -1,57 +1,303 @@
 """Houses the `TimeLog` and `LogEntry` classes."""
 
+import csv
+import io
 import os
+import sys
 from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Iterable, Iterator
+import constants as c
 from constants import (
+    CSV_HEADER,
+    ROWS_PER_READ,
     LOG_FILE_NAME,
+    LOG_INDEX_FILE_NAME,
     CSV_FILE_NAME,
     DESC_FILE_NAME,
+    STORE_FILE_NAME,
+    STORE_DESC_FILE_NAME,
+    STORE_BREAKS_FILE_NAME,
+    STORE_DB_FILE_NAME,
+    STORE_BACKENDS,
+    ROLLUP_FILE_NAME,
+    TAG_INDEX_FILE_NAME,
+    TAG_POSTINGS_FILE_NAME,
     PUNCHED_IN_STATE,
     PUNCHED_OUT_STATE,
     dprint,
 )
+from logarchive import LogArchive
+from locking import append_atomic, atomic_file, data_lock, write_atomic
+from rollup import Rollup
+import status
+from storage import Storage, migrate, transfer
+from tagindex import TagIndex
+from timestamps import format_column, format_epoch, to_epoch
+from timing import span, timed
+
+
+@lru_cache(maxsize=None)
+@timed("resolve path")
+def data_file_path(file_name: str) -> str:
+    """Resolves the path to a file in the punch folder of win32 local appdata.
+
+    Cached, so each path is only resolved once per process.
+
+    :returns `str` - the absolute path to the file
+    """
+    return os.path.expandvars("%LOCALAPPDATA%\\punch\\" + file_name)
+
+
+def csv_line(fields: Iterable[str]) -> str:
+    """Formats `fields` as one line of the `.csv` file, without a line ending.
+
+    Fields holding commas, quotes or line breaks are quoted, so descriptions
+    can hold any text.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow(fields)
+    return buffer.getvalue()
+
+
+@lru_cache(maxsize=None)
+@timed("open store")
+def find_store() -> Storage:
+    """Opens the session store of `STORE_BACKEND` in win32 local appdata, creating
+    it if needed.
+
+    Cached, so the store is only opened once per process.
+    """
+    return open_backend(c.STORE_BACKEND)
+
+
+def open_backend(backend: str) -> Storage:
+    """Opens the session store of `backend`, one of `STORE_BACKENDS`, creating it
+    if needed.
+    """
+    if backend == "sqlite":
+        # Imported here so the binary store never loads sqlite3
+        from sqlitestore import SqliteStore
+
+        return SqliteStore(data_file_path(STORE_DB_FILE_NAME))
+    from store import SessionStore
+
+    return SessionStore(
+        data_file_path(STORE_FILE_NAME),
+        data_file_path(STORE_DESC_FILE_NAME),
+        data_file_path(STORE_BREAKS_FILE_NAME),
+    )
+
+
+def backend_exists(backend: str) -> bool:
+    """Whether the store of `backend` was ever created."""
+    name = STORE_DB_FILE_NAME if backend == "sqlite" else STORE_FILE_NAME
+    return os.path.exists(data_file_path(name))
+
+
+@lru_cache(maxsize=None)
+@timed("load rollup")
+def find_rollup() -> Rollup:
+    """Opens the per-day and per-week totals in win32 local appdata, building them
+    from the session store if needed.
+
+    Cached, so the totals are only loaded once per process.
+    """
+    return Rollup(data_file_path(ROLLUP_FILE_NAME), find_store())
+
+
+@lru_cache(maxsize=None)
+@timed("load tag index")
+def find_tag_index() -> TagIndex:
+    """Opens the index of the sessions with each tag in win32 local appdata,
+    building it from the session store if needed.
+
+    Cached, so the index is only loaded once per process.
+    """
+    return TagIndex(
+        data_file_path(TAG_INDEX_FILE_NAME),
+        data_file_path(TAG_POSTINGS_FILE_NAME),
+        find_store(),
+    )
+
+
+@lru_cache(maxsize=None)
+@timed("load log index")
+def find_log_archive() -> LogArchive:
+    """Opens the `.log` file and its rotated segments in win32 local appdata.
+
+    Cached, so the index is only loaded once per process.
+    """
+    return LogArchive(LogEntry.find_log_file(), data_file_path(LOG_INDEX_FILE_NAME))
 
 
 class TimeLog:
     def __init__(self):
-        """Handles operations having to do with all LogEntries currently recorded
-        in the `.csv` file.
+        """Handles operations having to do with all LogEntries recorded in the
+        session store, which the `.csv` file is an export of.
         """
         # TODO: make TimeLog add up all the time worked over each entry
         #    in the log and get the total
 
-        self.csv_file_path: str = self.find_csv_file()
-        self.entries: list[LogEntry] = self.record_entries()
-        self.last_entry: LogEntry | None = None
-        if self.entries:
-            self.last_entry = self.entries[-1]
+        # The first run creates and migrates the store, which needs writing
+        with data_lock(exclusive=not backend_exists(c.STORE_BACKEND)):
+            self.csv_file_path: str = self.find_csv_file()
+            self.store: Storage = self.open_store()
+            # Built lazily; only commands that need every row pay for them
+            self._entries: list[LogEntry] | None = None
+            self.last_entry: LogEntry | None = None
+            if len(self.store):
+                self.last_entry = self.entries_in(len(self.store) - 1)[0]
+            last_break = self.store.last_break()
 
         dprint("TimeLog.last_entry =", self.last_entry, sep=" ")
 
         self.state: str = self.check_state()
+        # The last break can only be open while punched-in
+        self.on_break: bool = self.state == PUNCHED_IN_STATE and bool(
+            last_break and not last_break[1]
+        )
+
+    @property
+    def entries(self) -> list["LogEntry"]:
+        """All entries not uploaded yet (the `.csv` view), built on first access."""
+        if self._entries is None:
+            with data_lock():
+                self._entries = self.entries_in(self.store.uploaded)
+        return self._entries
+
+    @property
+    def rollup(self) -> Rollup:
+        """Per-day and per-week totals of the hours worked, loaded on first access."""
+        return find_rollup()
+
+    def entries_between(self, since: datetime, until: datetime) -> list["LogEntry"]:
+        """Gets every entry in the history punched in at or after `since` and
+        before `until`, uploaded or not.
+
+        :returns list[LogEntry] - the matching entries
+        """
+        found = self.store.find_range(since, until)
+        return self.entries_in(found.start, found.stop)
+
+    def entries_in(self, start: int, stop: int | None = None) -> list["LogEntry"]:
+        """Builds the entries of the session store records in `[start, stop)`.
+
+        :returns list[LogEntry] - the entries
+        """
+        on_break = self.store.session_break_seconds(start, stop)
+        return [
+            self.entry_from_record(record, seconds)
+            for record, seconds in zip(self.store.records(start, stop), on_break)
+        ]
+
+    def rows_in(self, start: int, stop: int) -> list[list[str]]:
+        """Builds the `.csv` rows of the session store records in `[start, stop)`,
+        the same as `LogEntry.to_row()` would, straight from the store's columns
+        rather than through a `LogEntry` and two `datetime`s per record.
+
+        :returns list[list[str]] - the rows
+        """
+        punch_ins, punch_outs, hours = self.store.columns(start, stop)
+        on_break = self.store.session_break_seconds(start, stop)
+        descriptions = self.store.descriptions(start, stop)
+        days, ins = format_column(punch_ins)
+        _, outs = format_column(punch_outs)
+        return [
+            [day, punch_in, punch_out, f"{worked}", description, f"{net}"]
+            if closed
+            else [day, punch_in]
+            for day, punch_in, punch_out, worked, description, net, closed in zip(
+                days,
+                ins,
+                outs,
+                hours,
+                descriptions,
+                [worked - seconds / 3600 for worked, seconds in zip(hours, on_break)],
+                punch_outs,
+            )
+        ]
+
+    def open_store(self) -> Storage:
+        """Opens the session store, filling it the first time it is created: from
+        the store of the other backend if there is one, else by migrating the
+        existing `.log` and `.csv` files.
+
+        :returns `Storage` - the store
+        """
 
+        store = find_store()
+        if store.created:
+            with span("migrate"):
+                previous = [
+                    backend
+                    for backend in STORE_BACKENDS
+                    if backend != c.STORE_BACKEND and backend_exists(backend)
+                ]
+                if previous:
+                    source = open_backend(previous[0])
+                    transfer(source, store)
+                    source.close()
+                    # Set the old files aside, so switching back copies again
+                    for path in source.paths:
+                        os.replace(path, path + ".old")
+                else:
+                    log_entries = self.read_log_entries()
+                    migrate(
+                        store,
+                        [entry.to_session() for entry in log_entries],
+                        [entry.to_session() for entry in self.record_entries()],
+                        [
+                            (start, end or 0)
+                            for entry in log_entries
+                            for start, end in entry.breaks
+                        ],
+                    )
+            store.created = False
+        return store
+
+    def entry_from_record(
+        self, record: tuple, break_seconds: float = 0.0
+    ) -> "LogEntry":
+        """Builds a `LogEntry` out of a session store record, and the time spent on
+        break in the session.
+        """
+
+        punch_in, punch_out, hours, description = record
+        entry: LogEntry = LogEntry(self.csv_file_path)
+        entry.punch_in = datetime.fromtimestamp(punch_in)
+        entry.date, entry.punch_in_time = format_epoch(punch_in)
+        # IF the session is closed
+        if punch_out:
+            entry.punch_out = datetime.fromtimestamp(punch_out)
+            _, entry.punch_out_time = format_epoch(punch_out)
+            entry.work_hours = hours
+            entry.net_hours = hours - break_seconds / 3600
+            entry.description = sys.intern(description)
+        return entry
+
+    @timed("find_csv_file")
     def find_csv_file(self) -> str:
         """Finds the path to the `.csv` file in win32 local appdata.
 
         :returns `str` - the absolute path to the `.csv` file
         """
 
-        csv_file_path = os.path.expandvars("%LOCALAPPDATA%\\punch\\" + CSV_FILE_NAME)
+        csv_file_path = data_file_path(CSV_FILE_NAME)
         # IF no csv file, create one with heading
         if not os.path.exists(csv_file_path):
-            file = open(csv_file_path, "w")
-            file.write("Date,Punch in,Punch out,Time (hours),Description")
-            file.close()
+            write_atomic(csv_file_path, csv_line(CSV_HEADER))
         # IF csv file has no heading, write heading
         else:
             with open(csv_file_path, "r") as r_file:
-                if not r_file.readline().strip():
-                    with open(csv_file_path, "w") as w_file:
-                        w_file.write("Date,Punch in,Punch out,Time (hours),Description")
+                missing_heading = not r_file.readline().strip()
+            if missing_heading:
+                write_atomic(csv_file_path, csv_line(CSV_HEADER))
         # dprint("IN find_csv_file(): file_path =", csv_file_path, sep=" ")
 
         return csv_file_path
 
+    @timed("parse csv")
     def record_entries(self) -> list:
         """Get all the entries from the `.csv` file and record them in a list.
 
@@ -60,42 +306,83 @@ class TimeLog:
 
         entries: list[LogEntry] = []
 
-        with open(self.csv_file_path, "r") as file:
+        with open(self.csv_file_path, "r", newline="") as file:
+            rows = csv.reader(file)
             # Skip header line
-            next(file)
-            for line in file:
-                dprint(f"{line = }")
-                if (not line.strip()):
-                    continue
-                entry: LogEntry = LogEntry(self)
-                # IF entry has all 5 data
-                if len(line.strip().split(",")) == 5:
-                    (
-                        date,
-                        punch_in_time,
-                        punch_out_time,
-                        work_hours,
-                        description,
-                    ) = line.strip().split(",")
-
-                    entry.date = date
-                    entry.punch_in_time = punch_in_time
-                    entry.punch_out_time = punch_out_time
-                    entry.work_hours = float(work_hours)
-                    entry.description = description
-
-                # IF entry only has 2 data
-                elif len(line.strip().split(",")) == 2:
-                    (entry.date, entry.punch_in_time) = line.strip().split(",")
-                else:
-                    assert (
-                        False
-                    ), "Entry from the `.csv` file should have either 5 data or 2 data."
+            next(rows, None)
+            for fields in rows:
+                entry = self.parse_row(fields)
+                if entry:
+                    entries.append(entry)
 
+        return entries
+
+    @timed("parse log")
+    def read_log_entries(self) -> list:
+        """Get all the entries from the `.log` file and its rotated segments, which
+        unlike the `.csv` file also hold the entries that were already uploaded.
+
+        :returns list[LogEntry] - the list of LogEntries
+        """
+
+        entries: list[LogEntry] = []
+
+        for line in find_log_archive().lines():
+            label, _, value = line.strip().partition(":")
+            value = value.strip()
+            if label == "Punch in":
+                entry: LogEntry = LogEntry(self.csv_file_path)
+                entry.date, entry.punch_in_time = value.split(" ")
                 entries.append(entry)
+            elif label == "Break start" and entries:
+                entries[-1].breaks.append((to_epoch(*value.split(" ")), None))
+            elif label == "Break end" and entries and entries[-1].breaks:
+                entries[-1].breaks[-1] = (
+                    entries[-1].breaks[-1][0],
+                    to_epoch(*value.split(" ")),
+                )
+            elif label == "Punch out" and entries:
+                entries[-1].punch_out_time = value.split(" ")[1]
+            elif label == "Tags" and entries:
+                entries[-1].tags = [tag.removeprefix("#") for tag in value.split()]
+            elif label == "Hours worked" and entries:
+                work_hours, _, description = value.partition("\t\t")
+                entries[-1].work_hours = float(work_hours)
+                # The `.csv` file spells a blank description as 'NULL'
+                entries[-1].description = (
+                    "NULL" if description == "(No Description)" else description
+                )
 
         return entries
 
+    def parse_row(self, fields: list[str]) -> "LogEntry | None":
+        """Builds a `LogEntry` out of a single row of the `.csv` file.
+
+        :returns `LogEntry | None` - the entry, or None if the row is blank
+        """
+
+        if not fields or not fields[0].strip():
+            return None
+        # Rows written before breaks were tracked have no net hours
+        assert len(fields) in (
+            6,
+            5,
+            2,
+        ), "Entry from the `.csv` file should have either 6, 5 or 2 data."
+
+        entry: LogEntry = LogEntry(self.csv_file_path)
+        # Dates and descriptions repeat across many rows, so share one copy of each
+        entry.date = sys.intern(fields[0].strip())
+        entry.punch_in_time = sys.intern(fields[1].strip())
+        # IF entry has all 5 data
+        if len(fields) >= 5:
+            entry.punch_out_time = sys.intern(fields[2].strip())
+            entry.work_hours = float(fields[3])
+            entry.description = sys.intern(fields[4].strip())
+            entry.net_hours = float(fields[5]) if len(fields) == 6 else entry.work_hours
+
+        return entry
+
     def check_state(self) -> str:
         """Checks the status of the last entry to see if it has data related
         to the state.
@@ -119,30 +406,89 @@ class TimeLog:
         elif self.state == PUNCHED_OUT_STATE:
             print("<out> command unavailable. Try 'punch in [--desc \"\"]'\n")
 
-    def get_rows(self) -> list:
-        """Gets rows from `.csv` (for uploading to spreadsheet)"""
-        rows = []
-        with open(self.csv_file_path, "r") as file:
-            lines = file.read().splitlines()
-            for line in lines:
-                # Skip heading
-                if line.startswith("Date"):
-                    continue
-                date, p_i_time, p_o_time, hours, desc = line.split(",")
-                rows.append([date, p_i_time, p_o_time, hours, desc])
-        dprint(f"{rows=}")
+    def iter_rows(self, limit: int | None = None) -> Iterator[list[str]]:
+        """Streams the `.csv` rows of the entries not uploaded yet (for uploading
+        to spreadsheet), reading `ROWS_PER_READ` records from the store at a time
+        so memory use doesn't grow with the history.
+
+        The rows are the ones not uploaded when iteration starts; moving the
+        upload mark while iterating doesn't skip or repeat any.
+
+        :param limit: `int | None` - yield at most this many rows
+        """
+        with data_lock():
+            start = self.store.uploaded
+            stop = len(self.store)
+        if limit is not None:
+            stop = min(start + limit, stop)
+        for block in range(start, stop, ROWS_PER_READ):
+            # Only hold the lock while reading, not while the caller works
+            with data_lock():
+                rows = self.rows_in(block, min(block + ROWS_PER_READ, stop))
+            yield from rows
+
+    @timed("get_rows")
+    def get_rows(self, limit: int | None = None) -> list:
+        """Gets the `.csv` rows of the entries not uploaded yet, see `iter_rows()`.
+
+        :param limit: `int | None` - get at most this many rows
+        """
+        rows = list(self.iter_rows(limit))
+        dprint(f"Got {len(rows)} rows.")
         return rows
 
+    def mark_uploaded(self, count: int) -> None:
+        """Moves the upload mark past the next `count` entries not uploaded yet.
+
+        The mark is stored with the entries, so it survives a failed upload.
+        """
+        with data_lock(exclusive=True):
+            self.store.uploaded += count
+            status.save()
+        self._entries = None
+
+    def export_csv(self) -> None:
+        """Rewrites the `.csv` file with the entries not uploaded yet, replacing it
+        in one step so readers never see it half-written.
+        """
+        with data_lock(exclusive=True), atomic_file(
+            self.csv_file_path, newline=""
+        ) as file:
+            # Rows are separated, not terminated, by line breaks, so that
+            #    punch-outs can be appended to the last row
+            writer = csv.writer(file, lineterminator="")
+            writer.writerow(CSV_HEADER)
+            for row in self.iter_rows():
+                file.write("\n")
+                writer.writerow(row)
+
     def clear_csv(self):
-        """Clears the `.csv` file of values.
+        """Marks every entry as uploaded and clears the `.csv` file of values.
 
         Called after uploading information to Google Sheets wks.
         """
-        with open(self.csv_file_path, "w") as file:
-            file.write("Date,Punch in,Punch out,Time (hours),Description")
+        with data_lock(exclusive=True):
+            self.mark_uploaded(len(self.store) - self.store.uploaded)
+            self.export_csv()
 
 
 class LogEntry:
+    __slots__ = (
+        "csv_file_path",
+        "log_file_path",
+        "date",
+        "punch_in",
+        "punch_in_time",
+        "punch_out",
+        "punch_out_time",
+        "work_time",
+        "work_hours",
+        "net_hours",
+        "breaks",
+        "description",
+        "tags",
+    )
+
     def __init__(self, csv_path: str) -> None:
         """Records and stores data for a single entry to be written to a log."""
 
@@ -159,16 +505,27 @@ class LogEntry:
 
         self.work_time: timedelta = None
         self.work_hours: float = None
+        # Hours worked, less the time spent on break
+        self.net_hours: float = None
+        # Start and end of each break, the end None while on break
+        self.breaks: list[tuple[int, int | None]] = []
 
         self.description: str = ""
+        # Kept apart from the description, so they're never uploaded with it
+        self.tags: list[str] = []
 
-    def find_log_file(self) -> str:
+    @staticmethod
+    @lru_cache(maxsize=None)
+    @timed("find_log_file")
+    def find_log_file() -> str:
         """Finds the path to the `.log` file relative to the location of the script.
 
+        Cached, so the file is only looked up once per process.
+
         :returns `str` - the absolute path to the `.log` file
         """
 
-        log_file_path = os.path.expandvars("%LOCALAPPDATA%\\punch\\" + LOG_FILE_NAME)
+        log_file_path = data_file_path(LOG_FILE_NAME)
 
         if not os.path.exists(log_file_path):
             file = open(log_file_path, "x")
@@ -178,31 +535,60 @@ class LogEntry:
 
         return log_file_path
 
+    @timed("write entry")
     def log_punch_in(self) -> None:
-        """Writes a punch-in to `.log`and `.csv` files."""
+        """Writes a punch-in to `.log`and `.csv` files, each in a single append,
+        rotating older entries out of the `.log` file first if it's time to.
+        """
+
+        with data_lock(exclusive=True):
+            archive = find_log_archive()
+            if archive.needs_rotation(self.punch_in.date()):
+                with span("rotate log"):
+                    archive.rotate()
+
+            # Write to the .log file, on a line of its own unless it's the first
+            separator = "\n" if os.path.getsize(self.log_file_path) else ""
+            append_atomic(
+                self.log_file_path,
+                f"{separator}Punch in:\t\t{self.date} {self.punch_in_time}",
+            )
 
-        # Write to the .log file
-        with open(self.log_file_path, "a") as w_log_file:
-            r_log_file = open(self.log_file_path, "r")
-            if r_log_file.readline().strip():
-                w_log_file.write("\n")
-            r_log_file.close()
-            w_log_file.write(f"Punch in:\t\t{self.date} {self.punch_in_time}")
+            archive.note_entry(self.punch_in.date())
 
-        # Write to the .csv file
-        with open(self.csv_file_path, "a") as w_csv_file:
-            w_csv_file.write(f"\n{self.date},{self.punch_in_time}")
+            # Write to the .csv file
+            append_atomic(self.csv_file_path, f"\n{self.date},{self.punch_in_time}")
 
-    def log_punch_out(self) -> None:
-        """Writes a punch-out to `.log` and `.csv` files."""
+            # Open a session in the store
+            find_store().append(int(self.punch_in.timestamp()))
+            status.save()
 
-        # Write to the .log file
-        with open(self.log_file_path, "a") as log_file:
-            log_file.write(f"\nPunch out:\t\t{self.date} {self.punch_out_time}")
+    @timed("write entry")
+    def log_break_start(self, start: datetime) -> None:
+        """Writes the start of a break to the `.log` file and the session store.
 
-        # Write to the .csv file
-        with open(self.csv_file_path, "a") as csv_file:
-            csv_file.write(f",{self.punch_out_time},")
+        :raises `ValueError` - if the break can't start, see
+            `Storage.start_break()`
+        """
+        with data_lock(exclusive=True):
+            find_store().start_break(int(start.timestamp()))
+            append_atomic(
+                self.log_file_path, f"\nBreak start:\t{start.strftime('%D %H:%M')}"
+            )
+            status.save()
+
+    @timed("write entry")
+    def log_break_end(self, end: datetime) -> None:
+        """Writes the end of a break to the `.log` file and the session store.
+
+        :raises `ValueError` - if not on a break, see `Storage.end_break()`
+        """
+        with data_lock(exclusive=True):
+            find_store().end_break(int(end.timestamp()))
+            append_atomic(
+                self.log_file_path, f"\nBreak end:\t\t{end.strftime('%D %H:%M')}"
+            )
+            status.save()
 
     def get_timedelta(self) -> None:
         """Calculates and stores in self the time delta (difference) between
@@ -210,24 +596,61 @@ class LogEntry:
         """
         self.work_time = self.punch_out - self.punch_in
 
+    @timed("write entry")
     def log_work_time(self) -> None:
-        """Writes the punch in/out time difference to the log and csv files."""
+        """Writes the punch-out and the punch in/out time difference to the log and
+        csv files, each in a single append, so a punch-out is never half-written.
+        """
 
-        # Handle a blank description for user-friendly log file
-        if not self.description:
-            self.description = "(No Description)"
-        # Write to the log file
-        with open(self.log_file_path, "a") as log_file:
-            log_file.write(
-                f"\nHours worked:\t{self.work_hours:.6f}\t\t{self.description}\n"
+        with data_lock(exclusive=True):
+            store = find_store()
+            punch_in = int(self.punch_in.timestamp())
+            punch_out = int(self.punch_out.timestamp())
+            on_break = store.break_seconds(punch_in, punch_out, punch_out)
+            self.net_hours = self.work_hours - on_break / (60 * 60)
+
+            # Handle a blank description for user-friendly log file
+            if not self.description:
+                self.description = "(No Description)"
+            # Write to the log file
+            tagged = "".join(f" #{tag}" for tag in self.tags)
+            append_atomic(
+                self.log_file_path,
+                f"\nPunch out:\t\t{self.date} {self.punch_out_time}"
+                + (f"\nTags:\t\t\t{tagged.lstrip()}" if tagged else "")
+                + f"\nHours worked:\t{self.work_hours:.6f}\t\t{self.description}\n",
+            )
+
+            # Handle a blank description for csv file
+            if self.description == "(No Description)":
+                self.description = "NULL"
+            # Write to the csv file
+            append_atomic(
+                self.csv_file_path,
+                ","
+                + csv_line(
+                    [
+                        self.punch_out_time,
+                        f"{self.work_hours}",
+                        self.description,
+                        f"{self.net_hours}",
+                    ]
+                ),
             )
 
-        # Handle a blank description for csv file
-        if self.description == "(No Description)":
-            self.description = "NULL"
-        # Write to the csv file
-        with open(self.csv_file_path, "a") as csv_file:
-            csv_file.write(f"{self.work_hours},{self.description}")
+            # Close the open session in the store
+            store.close_last(
+                punch_out,
+                self.work_hours,
+                self.description,
+                on_break,
+                " ".join(self.tags),
+            )
+            # Count the closed session in the per-day and per-week totals, and
+            #    index it under its tags
+            find_rollup().sync()
+            find_tag_index().sync()
+            status.save()
 
         # Save 'NULL' as description
 
@@ -242,40 +665,82 @@ class LogEntry:
         except:
             pass
 
+    @timed("description file")
     def store_desc(self) -> None:
-        """Writes the punch-in description to a temporary `.txt` file, to be read later
-        if the program runs from the punched-in state.
+        """Writes the punch-in description, and the tags on a second line, to a
+        temporary `.txt` file, to be read later if the program runs from the
+        punched-in state.
         """
-        with open(
-            os.path.expandvars("%LOCALAPPDATA%\\punch\\" + DESC_FILE_NAME), "w"
-        ) as file:
-            file.write(self.description)
+        text = self.description
+        if self.tags:
+            text += "\n" + " ".join(self.tags)
+        write_atomic(data_file_path(DESC_FILE_NAME), text)
 
+    @timed("description file")
     def read_desc(self) -> None:
-        """Reads the punch-in description from the `.txt` file if there is one."""
-        desc_file_path = os.path.expandvars("%LOCALAPPDATA%\\punch\\" + DESC_FILE_NAME)
+        """Reads the punch-in description and tags from the `.txt` file if there is
+        one.
+        """
+        desc_file_path = data_file_path(DESC_FILE_NAME)
         if os.path.exists(desc_file_path):
             with open(desc_file_path, "r") as file:
                 self.description = file.readline().strip()
+                self.tags = file.readline().split()
         else:
             self.description = "(No Description)"
 
+    @timed("description file")
     def del_desc(self) -> None:
         """Deletes the temporary description `.txt` file."""
-        desc_file_path = os.path.expandvars("%LOCALAPPDATA%\\punch\\" + DESC_FILE_NAME)
+        desc_file_path = data_file_path(DESC_FILE_NAME)
         os.remove(desc_file_path)
 
+    def to_session(self) -> tuple[int, int, float, str, int, str]:
+        """Converts the str information contained in the `LogEntry` to a
+        session store record, see `Storage.extend()`.
+        """
+        punch_in = to_epoch(self.date, self.punch_in_time)
+        if not self.punch_out_time:
+            return punch_in, 0, 0.0, "", 0, ""
+        punch_out = to_epoch(self.date, self.punch_out_time)
+        # Punched out past midnight
+        if punch_out < punch_in:
+            punch_out = to_epoch(self.date, self.punch_out_time, days=1)
+        on_break = sum(end - start for start, end in self.breaks if end)
+        return (
+            punch_in,
+            punch_out,
+            self.work_hours,
+            self.description,
+            on_break,
+            " ".join(self.tags),
+        )
+
+    def to_row(self) -> list[str]:
+        """Gets the `.csv` row of the entry."""
+        if not self.punch_out_time:
+            return [self.date, self.punch_in_time]
+        return [
+            self.date,
+            self.punch_in_time,
+            self.punch_out_time,
+            f"{self.work_hours}",
+            self.description,
+            f"{self.net_hours}",
+        ]
+
     def convert_str_to_datetime(self, punch_time: str) -> datetime:
-        """Calls the `datetime.strptime()` function to convert the str information
-        contained in the `LogEntry` to a `datetime` object.
+        """Converts the str information contained in the `LogEntry` to a `datetime`
+        object.
         """
-        punch_datetime_str: str = f"{self.date} {punch_time}"
-        return datetime.strptime(punch_datetime_str, "%m/%d/%y %H:%M")
+        return datetime.fromtimestamp(to_epoch(self.date, punch_time))
 
     def __repr__(self) -> str:
         attrs = f"date='{self.date}', "
         attrs += f"punch_in_time='{self.punch_in_time}', "
         attrs += f"punch_out_time='{self.punch_out_time}', "
         attrs += f"work_hours={self.work_hours}, "
-        attrs += f"description='{self.description}'"
+        attrs += f"net_hours={self.net_hours}, "
+        attrs += f"description='{self.description}', "
+        attrs += f"tags={self.tags}"
         return f"LogEntry({attrs})"
@@ -0,0 +1,147 @@
+"""Conversions between epoch seconds, which the session store keeps, and the
+`%m/%d/%y` dates and `%H:%M` times the `.csv` and `.log` files spell them as.
+
+`strptime()` and `strftime()` are among the slowest calls in the standard
+library, and an aggregate over the history makes one per row. The strings here
+have a fixed width, so they are parsed by slicing, and since many rows share a
+day or a time of day, each distinct string is only converted once.
+
+Epochs are turned into local time a day at a time where they come in order,
+and otherwise a quarter hour at a time: UTC offsets are all but always whole
+quarter hours, so the date and offset are the same for every epoch in a quarter
+hour, and only the minute needs working out per epoch. Days and quarter hours
+the offset shifts in are converted epoch by epoch.
+"""
+
+import sys
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Iterable
+
+SECONDS_PER_DAY: int = 24 * 60 * 60
+QUARTER: int = 15 * 60
+
+# Every `%H:%M` time, by minute of the day
+_CLOCKS: list[str] = [f"{minute // 60:02}:{minute % 60:02}" for minute in range(1440)]
+
+
+@lru_cache(maxsize=4096)
+def parse_day(text: str) -> int:
+    """Parses a `%m/%d/%y` date.
+
+    :raises `ValueError` - if `text` isn't a date
+    :returns `int` - the proleptic Gregorian ordinal of the day
+    """
+    if len(text) == 8 and text[2] == text[5] == "/" and text.replace("/", "").isdigit():
+        year = int(text[6:8])
+        # `%y` puts 69-99 in the 1900s and 00-68 in the 2000s
+        year += 1900 if year >= 69 else 2000
+        return date(year, int(text[0:2]), int(text[3:5])).toordinal()
+    # Not zero-padded, say; rare enough to leave to `strptime()`
+    return datetime.strptime(text, "%m/%d/%y").toordinal()
+
+
+@lru_cache(maxsize=1440)
+def parse_clock(text: str) -> int:
+    """Parses a `%H:%M` time.
+
+    :raises `ValueError` - if `text` isn't a time of day
+    :returns `int` - seconds since midnight
+    """
+    if len(text) == 5 and text[2] == ":" and text.replace(":", "").isdigit():
+        hour, minute = int(text[0:2]), int(text[3:5])
+        if hour < 24 and minute < 60:
+            return hour * 60 * 60 + minute * 60
+        raise ValueError(f"time '{text}' is not a time of day")
+    moment = datetime.strptime(text, "%H:%M")
+    return moment.hour * 60 * 60 + moment.minute * 60
+
+
+@lru_cache(maxsize=4096)
+def _midnight(day: int) -> tuple[int, bool]:
+    # Epoch of the local midnight starting the day, and whether the UTC offset
+    #    changes during the day, i.e. it isn't 24 hours long
+    midnight = datetime.fromordinal(day)
+    start = int(midnight.timestamp())
+    end = int((midnight + timedelta(days=1)).timestamp())
+    return start, end - start != SECONDS_PER_DAY
+
+
+def local_epoch(day: int, seconds: int) -> int:
+    """Gets the epoch of the local time `seconds` after midnight starting `day`,
+    a proleptic Gregorian ordinal, the same as `datetime.timestamp()` would.
+    """
+    start, shifts = _midnight(day)
+    if shifts:
+        # Whether the time falls before or after the shift takes the time zone
+        moment = datetime.fromordinal(day) + timedelta(seconds=seconds)
+        return int(moment.timestamp())
+    return start + seconds
+
+
+def to_epoch(day: str, clock: str, days: int = 0) -> int:
+    """Gets the epoch of a `%m/%d/%y` date and `%H:%M` time, `days` later.
+
+    :raises `ValueError` - if either can't be parsed
+    """
+    return local_epoch(parse_day(day) + days, parse_clock(clock))
+
+
+@lru_cache(maxsize=4096)
+def _day_span(day: int) -> tuple[str, int, int]:
+    # Date of the day, and the epochs it spans, or none if its UTC offset shifts
+    start, shifts = _midnight(day)
+    moment = date.fromordinal(day)
+    text = sys.intern(f"{moment.month:02}/{moment.day:02}/{moment.year % 100:02}")
+    return text, start, start if shifts else start + SECONDS_PER_DAY
+
+
+@lru_cache(maxsize=1 << 16)
+def _quarter(quarter: int) -> tuple[str, int] | None:
+    # Local date and second of the day the quarter hour starts at, or None if
+    #    the UTC offset shifts during it or it runs into the next day
+    moment = datetime.fromtimestamp(quarter * QUARTER)
+    last = datetime.fromtimestamp(quarter * QUARTER + QUARTER - 1)
+    if last.day != moment.day or last - moment != timedelta(seconds=QUARTER - 1):
+        return None
+    day = f"{moment.month:02}/{moment.day:02}/{moment.year % 100:02}"
+    # Shared by the rows of a day, so keep one copy
+    return sys.intern(day), moment.hour * 60 * 60 + moment.minute * 60 + moment.second
+
+
+def format_epoch(epoch: int) -> tuple[str, str]:
+    """Gets the `%m/%d/%y` date and `%H:%M` time of `epoch`, in local time."""
+    found = _quarter(epoch // QUARTER)
+    if found is None:
+        moment = datetime.fromtimestamp(epoch)
+        day = _day_span(moment.toordinal())[0]
+        return day, _CLOCKS[moment.hour * 60 + moment.minute]
+    day, second = found
+    return day, _CLOCKS[(second + epoch % QUARTER) // 60]
+
+
+def format_column(epochs: Iterable[int]) -> tuple[list[str], list[str]]:
+    """Gets the dates and times of a column of epochs, see `format_epoch()`.
+
+    Consecutive epochs in the same local day, as in a column sorted by time, only
+    look the day up once.
+
+    :returns `tuple[list[str], list[str]]` - the dates and the times
+    """
+    clocks = _CLOCKS
+    days: list[str] = []
+    times: list[str] = []
+    # Date of the day the last epoch fell in, and the epochs the day spans
+    day, start, stop = "", 0, 0
+    for epoch in epochs:
+        if not start <= epoch < stop:
+            day, start, stop = _day_span(datetime.fromtimestamp(epoch).toordinal())
+            # The UTC offset shifts during the day, or around its midnight
+            if not start <= epoch < stop:
+                day, clock = format_epoch(epoch)
+                days.append(day)
+                times.append(clock)
+                continue
+        days.append(day)
+        times.append(clocks[(epoch - start) // 60])
+    return days, times
@@ -0,0 +1,131 @@
+"""Lightweight timing spans around the phases of a punch.
+
+Spans are only recorded once `enable()` is called (by `--profile` or
+`--trace-json`); until then `span()` hands back a shared no-op and `timed`
+functions only pay for one flag check, so the spans can stay in production builds.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+_enabled = False
+# Name, start and duration in ns and thread of every finished span
+_spans: list[tuple[str, int, int, int]] = []
+_started: int = 0
+
+
+class _Span:
+    """Records the time between entering and exiting it as a span."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.start: int = 0
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        _spans.append(
+            (
+                self.name,
+                self.start,
+                time.perf_counter_ns() - self.start,
+                threading.get_ident(),
+            )
+        )
+
+
+class _NoSpan:
+    """Stands in for `_Span` while timing is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str) -> _Span | _NoSpan:
+    """Times the `with` block as a span called `name`."""
+    return _Span(name) if _enabled else _NO_SPAN
+
+
+def timed(name: str):
+    """Decorator that times each call to the function as a span called `name`."""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def enable(profile: bool = False, trace_path: str | None = None) -> None:
+    """Starts recording spans, and at exit prints a per-phase breakdown if
+    `profile` and writes a trace to `trace_path` if given.
+    """
+    global _enabled, _started
+    _enabled = True
+    _started = time.perf_counter_ns()
+    if profile:
+        atexit.register(print_profile)
+    if trace_path:
+        atexit.register(write_trace, trace_path)
+
+
+def print_profile() -> None:
+    """Outputs the number of calls and total time of each phase to the screen."""
+    wall = time.perf_counter_ns() - _started
+    phases: dict[str, list[int]] = {}
+    # Phases are listed in the order they started
+    for name, _, duration, _ in sorted(_spans, key=lambda span: span[1]):
+        phase = phases.setdefault(name, [0, 0])
+        phase[0] += 1
+        phase[1] += duration
+
+    width = max([len("Phase")] + [len(name) for name in phases])
+    print(f"\nProfile ({wall / 1e6:.3f} ms of wall time):\n")
+    print(f"\t{'Phase':<{width}}  Calls    Total ms  % of wall")
+    for name, (calls, duration) in phases.items():
+        print(
+            f"\t{name:<{width}}  {calls:>5}  {duration / 1e6:>10.3f}"
+            f"  {duration / wall:>9.1%}"
+        )
+    print()
+
+
+def write_trace(path: str) -> None:
+    """Writes the spans as a Chrome trace, which chrome://tracing, Perfetto and
+    speedscope can open.
+    """
+    events = [
+        {
+            "name": name,
+            "ph": "X",
+            "ts": (start - _started) / 1000,
+            "dur": duration / 1000,
+            "pid": os.getpid(),
+            "tid": thread,
+        }
+        for name, start, duration, thread in _spans
+    ]
+    with open(path, "w") as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
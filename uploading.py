@@ -1,8 +1,39 @@
-"""Houses the `Upload` class."""
+"""Houses the `Upload` and `Target` classes."""
 
+import json
+import os
+import random
 import sys
-from lib.gspread import service_account, Client, Spreadsheet, Worksheet
-from constants import SERVICE_ACCT_JSON, dprint, eprint
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from itertools import islice
+from typing import TYPE_CHECKING, Callable
+
+from constants import (
+    SERVICE_ACCT_JSON,
+    UPLOAD_BACKOFF,
+    UPLOAD_CACHE_FILE_NAME,
+    UPLOAD_CACHE_TTL,
+    UPLOAD_CHUNK_SIZE,
+    UPLOAD_PROGRESS_FILE_NAME,
+    UPLOAD_RETRIES,
+    UPLOAD_TARGETS_FILE_NAME,
+    dprint,
+)
+from locking import data_lock, write_atomic
+from timelog import TimeLog, data_file_path
+from timing import span
+
+if TYPE_CHECKING:
+    from lib.gspread import Client, Spreadsheet, Worksheet
+
+
+def signer_email() -> str:
+    """Reads the service account email from its key file, without going online."""
+    with open(SERVICE_ACCT_JSON, "r") as file:
+        return json.load(file)["client_email"]
 
 
 class Upload:
@@ -10,25 +41,120 @@ class Upload:
     selected google sheet.
     """
 
-    def __init__(self):
-        """Constructs an instance of `Upload`"""
+    def __init__(self, refresh: bool = False):
+        """Constructs an instance of `Upload`
+
+        :param refresh: `bool` - ignore the cached spreadsheet choice and list
+        """
+        # Imported here so that importing this module stays cheap
+        with span("gspread import"):
+            from lib.gspread import service_account
 
         # Service account client.
-        self.gc: Client = service_account(filename=SERVICE_ACCT_JSON)
-        # List of available spreadsheets.
-        self.spreadsheets: list[Spreadsheet] = self.gc.openall()
+        with span("gspread auth"):
+            self.gc: Client = service_account(filename=SERVICE_ACCT_JSON)
+        # Number of requests made to the Google APIs.
+        self.requests: int = 0
+        self._requests_lock = threading.Lock()
+        self._count_requests()
+
+        self.refresh: bool = refresh
+        self.cache_file_path: str = data_file_path(UPLOAD_CACHE_FILE_NAME)
+        self.cache: dict = self.read_cache()
+        # List of available spreadsheets, as `id`, `title` and `url`.
+        self.spreadsheets: list[dict] = []
         # The current working spreadsheet
         self.spreadsheet: Spreadsheet = None
         self.wks: Worksheet = None
-        
+
+    def _count_requests(self) -> None:
+        """Counts every request the client makes in `self.requests`."""
+        request = self.gc.request
+
+        def counted_request(*args, **kwargs):
+            # Uploads to several targets make requests from several threads
+            with self._requests_lock:
+                self.requests += 1
+            return request(*args, **kwargs)
+
+        self.gc.request = counted_request
+
+    def pool_connections(self, count: int) -> None:
+        """Lets the client's authorized session keep up to `count` connections
+        open, so that many threads can share it without reconnecting.
+        """
+        from requests.adapters import HTTPAdapter
+
+        adapter = HTTPAdapter(pool_connections=count, pool_maxsize=count)
+        self.gc.session.mount("https://", adapter)
+
+    def open_target(self, target: "Target") -> "Worksheet":
+        """Opens the worksheet of `target`."""
+        with span("open spreadsheet"):
+            spreadsheet = self.gc.open_by_key(target.spreadsheet)
+            if target.worksheet is None:
+                return spreadsheet.sheet1
+            return spreadsheet.worksheet(target.worksheet)
+
+    def read_cache(self) -> dict:
+        """Reads the cached spreadsheet choice and spreadsheet list, if any."""
+        if self.refresh or not os.path.exists(self.cache_file_path):
+            return {}
+        with open(self.cache_file_path, "r") as file:
+            return json.load(file)
+
+    def write_cache(self) -> None:
+        """Caches the spreadsheet choice and spreadsheet list."""
+        write_atomic(self.cache_file_path, json.dumps(self.cache, indent=2))
+
     def get_available_spreadsheets(self):
+        # Reuse the last choice if there is one; it only takes opening it by key
+        if "spreadsheet_id" in self.cache:
+            with span("open spreadsheet"):
+                self.spreadsheet = self.gc.open_by_key(self.cache["spreadsheet_id"])
+                self.wks = self.spreadsheet.get_worksheet_by_id(
+                    self.cache["worksheet_id"]
+                )
+            return
+
+        self.spreadsheets = self.list_spreadsheets()
         # Show available spreadsheets to update.
         if self.spreadsheets:
             print("Available spreadsheets:")
             for index, wks in enumerate(self.spreadsheets):
-                print(f"\n{{{index}}}\tTitle:\t{wks.title}\n\tURL:\t{wks.url}\n")
-            self.spreadsheet = self.spreadsheets[self._get_wks_index()]
-            self.wks = self.spreadsheet.sheet1
+                print(f"\n{{{index}}}\tTitle:\t{wks['title']}\n\tURL:\t{wks['url']}\n")
+            chosen = self.spreadsheets[self._get_wks_index()]
+            with span("open spreadsheet"):
+                self.spreadsheet = self.gc.open_by_key(chosen["id"])
+                self.wks = self.spreadsheet.sheet1
+
+            self.cache["spreadsheet_id"] = self.spreadsheet.id
+            self.cache["worksheet_id"] = self.wks.id
+            self.write_cache()
+
+    def list_spreadsheets(self) -> list[dict]:
+        """Lists the spreadsheets shared with the service account, from the cache
+        if it is younger than `UPLOAD_CACHE_TTL`.
+        """
+        discovered_at = self.cache.get("discovered_at", 0)
+        if time.time() - discovered_at < UPLOAD_CACHE_TTL:
+            dprint("Using cached spreadsheet list.")
+            return self.cache["spreadsheets"]
+
+        with span("list spreadsheets"):
+            files = self.gc.list_spreadsheet_files()
+        spreadsheets = [
+            {
+                "id": file["id"],
+                "title": file["name"],
+                "url": f"https://docs.google.com/spreadsheets/d/{file['id']}",
+            }
+            for file in files
+        ]
+        self.cache["spreadsheets"] = spreadsheets
+        self.cache["discovered_at"] = time.time()
+        self.write_cache()
+        return spreadsheets
 
     def _get_wks_index(self) -> int:
         """Get which spreadsheet to update."""
@@ -76,3 +202,269 @@ class Upload:
         attrs += f"spreadsheet={self.spreadsheet}, "
         attrs += f"wks={self.wks}"
         return f"Upload({attrs})"
+
+
+def upload_log(
+    wks: "Worksheet", log: TimeLog, chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> int:
+    """Appends the entries of `log` not uploaded yet to `wks`, in chunks of at most
+    `chunk_size` rows.
+
+    The log's upload mark moves past each chunk as soon as the worksheet
+    acknowledges it, so an interrupted upload resumes from the first
+    unacknowledged chunk and never resends acknowledged rows. The `.csv` file is
+    rewritten with whatever is left, even if the upload fails.
+
+    Each row carries the hash of its entry after the `.csv` fields, for `punch
+    sync` to tell which entries the worksheet has, see `syncing`.
+
+    `wks` only needs an `append_rows()` method like `gspread.Worksheet`'s.
+
+    :returns `int` - the number of rows uploaded
+    """
+    from outbox import note_worksheet_end, row_after
+    from syncing import hash_cell, record_hash
+
+    uploaded = 0
+    # Chunks are pulled straight from the stream, so only one is in memory
+    stream = log.iter_rows()
+    try:
+        while rows := list(islice(stream, chunk_size)):
+            dprint(f"Appending rows {uploaded} to {uploaded + len(rows)}...")
+            # The rows are the next ones past the upload mark
+            start = log.store.uploaded
+            for row, record in zip(rows, log.store.records(start, start + len(rows))):
+                row.append(hash_cell(record_hash(record)))
+            with span("append_rows"):
+                reply = wks.append_rows(rows, value_input_option="USER_ENTERED")
+            log.mark_uploaded(len(rows))
+            note_worksheet_end(row_after(reply))
+            uploaded += len(rows)
+    finally:
+        log.export_csv()
+    return uploaded
+
+
+class Target:
+    """A worksheet that `punch upload --all-targets` uploads entries to.
+
+    Targets are listed in `upload_targets.json` in the punch folder, each as an
+    object with a `name`, the key of its `spreadsheet`, optionally the title of
+    its `worksheet` (the first one if left out) and optionally a `description`
+    pattern, e.g. 'client-a*', in which case only the entries whose description
+    matches it, ignoring case, are uploaded to it.
+    """
+
+    __slots__ = ("name", "spreadsheet", "worksheet", "description")
+
+    def __init__(
+        self,
+        name: str,
+        spreadsheet: str,
+        worksheet: str | None = None,
+        description: str | None = None,
+    ) -> None:
+        self.name: str = name
+        self.spreadsheet: str = spreadsheet
+        self.worksheet: str | None = worksheet
+        self.description: str | None = description.lower() if description else None
+
+    def matches(self, row: list[str]) -> bool:
+        """Whether the entry of `.csv` row `row` is uploaded to the target."""
+        return self.description is None or fnmatchcase(row[4].lower(), self.description)
+
+    def __repr__(self) -> str:
+        attrs = f"name='{self.name}', "
+        attrs += f"spreadsheet='{self.spreadsheet}', "
+        attrs += f"worksheet={self.worksheet!r}, "
+        attrs += f"description={self.description!r}"
+        return f"Target({attrs})"
+
+
+class TargetResult:
+    """How uploading to a target went."""
+
+    __slots__ = ("name", "rows", "requests", "seconds", "error")
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        # Rows the target confirmed, and the requests it took including retries
+        self.rows: int = 0
+        self.requests: int = 0
+        self.seconds: float = 0.0
+        # Why the target stopped short, if it did
+        self.error: str = ""
+
+
+def load_targets() -> list[Target]:
+    """Reads the upload targets, see `Target`.
+
+    :raises `ValueError` - if there are none, or they can't be read
+    """
+    path = data_file_path(UPLOAD_TARGETS_FILE_NAME)
+    try:
+        with open(path, "r") as file:
+            targets = [Target(**fields) for fields in json.load(file)]
+    except FileNotFoundError:
+        raise ValueError(f"No upload targets; list them in '{path}'.")
+    except (ValueError, TypeError) as err:
+        raise ValueError(f"Can't read the upload targets in '{path}': {err}")
+    if not targets:
+        raise ValueError(f"No upload targets; list them in '{path}'.")
+    if len({target.name for target in targets}) < len(targets):
+        raise ValueError(f"Upload targets in '{path}' need different names.")
+    return targets
+
+
+def _transport_errors() -> tuple[type, ...]:
+    # The HTTP client's dropped connections and timeouts, which aren't the
+    #    builtin ones
+    try:
+        from requests.exceptions import ConnectionError, Timeout
+    except ImportError:
+        return ()
+    return ConnectionError, Timeout
+
+
+def retryable(err: Exception) -> bool:
+    """Whether `err` is a dropped connection, a timeout or a response asking to
+    come back later (408, 429 or 5xx), which trying again can get past. Other
+    errors, e.g. a missing key file, won't go away by waiting.
+    """
+    # The auth library raises its own errors from the connection errors behind them
+    if err.__cause__ is not None and retryable(err.__cause__):
+        return True
+    response = getattr(err, "response", None)
+    if response is not None:
+        status = getattr(response, "status_code", 0)
+        return status in (408, 429) or 500 <= status < 600
+    return isinstance(err, (ConnectionError, TimeoutError, *_transport_errors()))
+
+
+def append_with_retry(
+    wks: "Worksheet",
+    rows: list[list[str]],
+    retries: int = UPLOAD_RETRIES,
+    backoff: float = UPLOAD_BACKOFF,
+) -> int:
+    """Appends `rows` to `wks`, retrying up to `retries` times on dropped
+    connections and rate limits. The wait before each retry doubles from
+    `backoff` seconds, less a random part, so targets don't retry in lockstep.
+
+    A request whose reply was lost may have gone through, in which case the
+    retry appends its rows again; `punch sync` tells the copies apart by hash.
+
+    :raises `Exception` - what the last attempt raised, or any error retrying
+        can't help with
+    :returns `int` - the number of requests it took
+    """
+    for attempt in range(retries + 1):
+        try:
+            wks.append_rows(rows, value_input_option="USER_ENTERED")
+            return attempt + 1
+        except Exception as err:
+            if attempt == retries or not retryable(err):
+                raise
+            delay = backoff * 2**attempt * random.uniform(0.5, 1.0)
+            dprint(f"{err}; retrying in {delay:.2f} s...")
+            time.sleep(delay)
+
+
+class _Progress:
+    """How many of the rows past the upload mark each target has confirmed,
+    saved as they confirm them, so an interrupted upload resumes where each
+    target left off.
+    """
+
+    def __init__(self, mark: int, names: list[str]) -> None:
+        self.path: str = data_file_path(UPLOAD_PROGRESS_FILE_NAME)
+        self.mark: int = mark
+        self.sent: dict[str, int] = {name: 0 for name in names}
+        # Threads confirm rows concurrently
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, "r") as file:
+                saved = json.load(file)
+            # Counts past another mark are of other rows
+            if saved["mark"] == mark:
+                for name in names:
+                    self.sent[name] = saved["sent"].get(name, 0)
+
+    def confirm(self, name: str, count: int) -> None:
+        """Records that target `name` has the first `count` rows."""
+        with self.lock:
+            self.sent[name] = count
+            write_atomic(self.path, json.dumps({"mark": self.mark, "sent": self.sent}))
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def upload_to_targets(
+    targets: list[Target],
+    open_worksheet: Callable[[Target], "Worksheet"],
+    log: TimeLog,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+    retries: int = UPLOAD_RETRIES,
+    backoff: float = UPLOAD_BACKOFF,
+    workers: int | None = None,
+) -> list[TargetResult]:
+    """Appends the entries of `log` not uploaded yet to every target at once, in a
+    thread each or at most `workers` threads, in chunks of at most `chunk_size`
+    rows, see `append_with_retry()`. `open_worksheet` opens the worksheet of a
+    target, in its thread.
+
+    How far each target got is saved as it confirms each chunk, so running it
+    again only sends each target the rows it's missing. The upload mark moves,
+    and the `.csv` file is emptied, only once every target has confirmed every
+    row.
+
+    :returns `list[TargetResult]` - how uploading to each target went, in order
+    """
+    from syncing import hash_cell, record_hash
+
+    # Read up front: the data lock is held per process, not per thread
+    with data_lock():
+        mark = log.store.uploaded
+        stop = len(log.store)
+        if stop and not log.store.record(-1)[1]:
+            stop -= 1
+        rows = log.rows_in(mark, stop)
+        for row, record in zip(rows, log.store.records(mark, stop)):
+            row.append(hash_cell(record_hash(record)))
+    progress = _Progress(mark, [target.name for target in targets])
+
+    def upload(target: Target) -> TargetResult:
+        result = TargetResult(target.name)
+        started = time.perf_counter()
+        try:
+            with span(f"upload to {target.name}"):
+                wks = open_worksheet(target)
+                pending = [
+                    index
+                    for index in range(progress.sent[target.name], len(rows))
+                    if target.matches(rows[index])
+                ]
+                for chunk in range(0, len(pending), chunk_size):
+                    indices = pending[chunk : chunk + chunk_size]
+                    result.requests += append_with_retry(
+                        wks, [rows[index] for index in indices], retries, backoff
+                    )
+                    result.rows += len(indices)
+                    progress.confirm(target.name, indices[-1] + 1)
+                progress.confirm(target.name, len(rows))
+        except Exception as err:
+            dprint(f"Upload to {target.name} failed: {err!r}")
+            result.error = str(err) or type(err).__name__
+        result.seconds = time.perf_counter() - started
+        return result
+
+    with ThreadPoolExecutor(max_workers=workers or len(targets)) as pool:
+        results = list(pool.map(upload, targets))
+
+    if not any(result.error for result in results):
+        log.mark_uploaded(len(rows))
+        log.export_csv()
+        progress.clear()
+    return results
@@ -0,0 +1,212 @@
+"""Live view of the state for `punch state --watch`.
+
+The view is redrawn once a second from the status cache (see `status`), working
+the running times out in memory, and only reloaded when the data files change:
+on Linux the punch folder is watched with inotify, so the view sleeps until the
+next redraw or a write; elsewhere, or if inotify can't be set up, the files are
+stat'ed once a second instead. Neither reads the history, so the cost of a
+second doesn't grow with it.
+"""
+
+import os
+import select
+import struct
+import sys
+import time
+
+import status
+from constants import PUNCHED_IN_STATE, WORKDAY_HOURS, dprint
+
+# inotify(7) events of a file in a watched folder being written, replaced or removed
+_IN_MODIFY = 0x002
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+# Header of each event, followed by a NUL-padded file name of `length` bytes
+_EVENT = struct.Struct("iIII")
+
+
+class _InotifyWatch:
+    """Tells when any of `paths` is written, from inotify events of the folders
+    they are in.
+    """
+
+    def __init__(self, paths: list[str]) -> None:
+        """Starts watching the folders of `paths`.
+
+        :raises `OSError` - if inotify isn't available
+        """
+        import ctypes
+
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+        except (OSError, AttributeError) as err:
+            raise OSError(f"inotify isn't available: {err}")
+
+        self.names: set[bytes] = {os.fsencode(os.path.basename(path)) for path in paths}
+        self.fd: int = init(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+        for folder in {os.path.dirname(path) or "." for path in paths}:
+            if add_watch(self.fd, os.fsencode(folder), mask) < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"Can't watch '{folder}'")
+
+    def wait(self, timeout: float) -> bool:
+        """Sleeps until one of the files is written, or for `timeout` seconds.
+
+        :returns `bool` - whether any of the files was written
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = max(deadline - time.monotonic(), 0)
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if not readable:
+                return False
+            # Other files in the folder, e.g. log segments, keep sleeping
+            if self._drain():
+                return True
+
+    def _drain(self) -> bool:
+        # Reads every queued event, so one burst of writes is one reload;
+        #    returns whether any was about one of the files
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = _EVENT.unpack_from(data, offset)
+                start = offset + _EVENT.size
+                name = data[start : start + length].rstrip(b"\0")
+                changed = changed or name in self.names
+                offset = start + length
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class _PollingWatch:
+    """Tells when any of `paths` is written, from their modification times and
+    sizes; for systems without inotify.
+    """
+
+    def __init__(self, paths: list[str]) -> None:
+        self.paths: list[str] = paths
+        self.seen: list[tuple | None] = self.version()
+
+    def version(self) -> list[tuple | None]:
+        versions: list[tuple | None] = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                versions.append(None)
+                continue
+            versions.append((stat.st_mtime_ns, stat.st_size))
+        return versions
+
+    def wait(self, timeout: float) -> bool:
+        """Sleeps for `timeout` seconds, then checks the files.
+
+        :returns `bool` - whether any of the files was written
+        """
+        time.sleep(max(timeout, 0))
+        version = self.version()
+        changed, self.seen = version != self.seen, version
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+def watch(paths: list[str]) -> "_InotifyWatch | _PollingWatch":
+    """Watches `paths` for writes with inotify if it's available, else by polling."""
+    if sys.platform.startswith("linux"):
+        try:
+            return _InotifyWatch(paths)
+        except OSError as err:
+            dprint(f"Polling the data files instead: {err}")
+    return _PollingWatch(paths)
+
+
+def _clock(seconds: float) -> str:
+    # H:MM:SS, so the view visibly ticks
+    seconds = max(int(seconds), 0)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02}:{seconds % 60:02}"
+
+
+def render(current: "status.Status", now: float) -> str:
+    """Gets the view of `current` as of epoch `now`."""
+    lines = [f"Current state of TimeLog is {current.state}."]
+    if current.state == PUNCHED_IN_STATE:
+        since = time.strftime("%H:%M", time.localtime(current.punch_in))
+        description = f": '{current.description}'" if current.description else ""
+        lines.append(f"Punched in at {since}{description}")
+        if current.break_start:
+            started = time.strftime("%H:%M", time.localtime(current.break_start))
+            lines.append(f"On a break since {started}.")
+        lines.append(f"Elapsed since punch-in:\t{_clock(current.elapsed(now))}")
+        lines.append(f"Net of breaks:\t\t{_clock(current.net(now))}")
+    worked = current.worked_today(now)
+    lines.append(f"Worked today:\t\t{_clock(worked)}")
+    remaining = WORKDAY_HOURS * 60 * 60 - worked
+    if current.state == PUNCHED_IN_STATE and remaining > 0:
+        clock_out = time.strftime("%H:%M", time.localtime(now + remaining))
+        lines.append(
+            f"Clock out at {clock_out} to reach {WORKDAY_HOURS:g} hours today."
+        )
+    elif remaining <= 0:
+        lines.append(f"Reached {WORKDAY_HOURS:g} hours today.")
+    return "\n".join(lines)
+
+
+def _release() -> None:
+    # Closes the session store and forgets what was loaded, so the next reload
+    #    sees other processes' writes and no files are held open in between
+    from timelog import find_log_archive, find_rollup, find_store, find_tag_index
+
+    if find_store.cache_info().currsize:
+        find_store().close()
+    find_store.cache_clear()
+    find_rollup.cache_clear()
+    find_tag_index.cache_clear()
+    find_log_archive.cache_clear()
+
+
+def _reload() -> "status.Status":
+    # The process that wrote usually rewrote the cache too; if not, rebuild it
+    fields = status.load()
+    if fields is None:
+        fields = status.save()
+        _release()
+    return status.Status(fields)
+
+
+def watch_state(interval: float = 1.0) -> None:
+    """Shows the live view, redrawn every `interval` seconds, until interrupted."""
+    current = status.current()
+    _release()
+    files = watch(status.sources())
+    # Redraw in place on a terminal; elsewhere, one view after another
+    clear = "\x1b[H\x1b[J" if sys.stdout.isatty() else "\n"
+    try:
+        while True:
+            now = time.time()
+            sys.stdout.write(f"{clear}\n{render(current, now)}\n\n(Ctrl+C to stop)\n")
+            sys.stdout.flush()
+            # On the next whole second, so the seconds shown tick evenly
+            if files.wait(interval - now % interval):
+                dprint("Data files changed, reloading.")
+                current = _reload()
+    except KeyboardInterrupt:
+        print()
+    finally:
+        files.close()